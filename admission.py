@@ -0,0 +1,139 @@
+"""Ограничение частоты запросов к LLM на пользователя и на весь бот.
+
+Перед генерацией обработчик резервирует по токену в корзине пользователя и
+в общей корзине. Если токен есть, запрос идет сразу; если появится не
+позже чем через max_wait секунд — запрос ждет своей очереди (корзина
+уходит в минус, следующие ждут дольше); иначе запрос отклоняется.
+
+Корзины пользователей живут в памяти процесса: при нескольких воркерах все
+обновления пользователя приходят в один процесс. Общий лимит при заданном
+хранилище (shared_store) считается по посекундным счетчикам в нем и
+действует на все воркеры сразу; burst в этом режиме не используется.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, max_wait: float, now: float = None):
+        """Задержка до своей очереди или None, если ждать дольше max_wait"""
+        self._refill(time.monotonic() if now is None else now)
+        delay = max(0.0, (1 - self.tokens) / self.rate)
+        if delay > max_wait:
+            return None
+        self.tokens -= 1
+        return delay
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class AdmissionController:
+    def __init__(self, user_rate: float, user_burst: float, global_rate: float = 0, global_burst: float = 0,
+                 max_wait: float = 10.0, store=None, max_users: int = 100000):
+        """Скорости — запросов в секунду; 0 отключает соответствующий лимит"""
+        self.user_rate = user_rate
+        self.user_burst = max(1.0, user_burst)
+        self.global_rate = global_rate
+        self.max_wait = max_wait
+        self.store = store
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._global = TokenBucket(global_rate, max(1.0, global_burst)) if global_rate > 0 else None
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.waiting = 0
+        self.store_errors = 0
+
+    def _user_bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst)
+            if len(self._users) > self.max_users:
+                # Давно неактивный пользователь: его корзина все равно уже полна
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return bucket
+
+    async def _reserve_shared(self):
+        """Первое посекундное окно в пределах max_wait, где есть место"""
+        limit = max(1, round(self.global_rate))
+        now = time.time()
+        window = int(now)
+        for ahead in range(math.ceil(self.max_wait) + 1):
+            count = await self.store.incr(f"admission:global:{window + ahead}", ttl=ahead + 2)
+            if count <= limit:
+                return max(0.0, window + ahead - now)
+        return None
+
+    async def _reserve_global(self):
+        if self.global_rate <= 0:
+            return 0.0
+        if self.store is not None:
+            try:
+                return await self._reserve_shared()
+            except Exception:
+                # Хранилище недоступно: ограничиваем хотя бы этот процесс
+                self.store_errors += 1
+        return self._global.reserve(self.max_wait)
+
+    async def reserve(self, user_id: int):
+        """Задержка перед запросом к LLM в секундах или None, если запрос нужно отклонить"""
+        user_delay = 0.0
+        bucket = None
+        if self.user_rate > 0 and user_id is not None:
+            bucket = self._user_bucket(user_id)
+            user_delay = bucket.reserve(self.max_wait)
+            if user_delay is None:
+                self.shed += 1
+                metrics.ADMISSION_THROTTLED.inc(limit="user", result="shed")
+                return None
+
+        global_delay = await self._reserve_global()
+        if global_delay is None:
+            if bucket is not None:
+                bucket.refund()
+            self.shed += 1
+            metrics.ADMISSION_THROTTLED.inc(limit="global", result="shed")
+            return None
+
+        delay = max(user_delay, global_delay)
+        if delay > 0:
+            self.queued += 1
+            metrics.ADMISSION_THROTTLED.inc(limit="user" if user_delay >= global_delay else "global", result="queued")
+        else:
+            self.admitted += 1
+        return delay
+
+    async def wait(self, delay: float):
+        self.waiting += 1
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.waiting -= 1
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "waiting": self.waiting,
+            "store_errors": self.store_errors,
+        }
@@ -0,0 +1,363 @@
+"""Отчеты по журналу действий пользователей (user_sessions.txt).
+
+Журнал читается потоково, строка за строкой, вместе с ротированными
+частями (user_sessions.txt.20250101-120000[.gz]) и журналами воркеров
+(user_sessions.txt.w0, если BOT_WORKERS > 1). Большие несжатые файлы
+делятся на куски по границам строк и обрабатываются параллельно в
+нескольких процессах; сжатую часть читает один процесс. Частичные итоги
+складываются, поэтому память зависит от числа пользователей и дней, а не
+от размера журнала.
+
+Итоги и прочитанные позиции сохраняются в файл контрольной точки: повторный
+запуск дочитывает только новые строки. Части узнаются по первой строке,
+поэтому ротация и сжатие уже прочитанного файла не приводят к повторному
+подсчету.
+
+    python analytics.py [--report daily|actions|funnel|hexagrams|all] [--format csv|json]
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+CHECKPOINT_VERSION = 2
+# Имена частей, которые создает LogSink при ротации
+ROTATED_SUFFIX = re.compile(r"\.\d{8}-\d{6}(-\d+)?(\.gz)?$")
+# Журналы воркеров при BOT_WORKERS > 1: user_sessions.txt.w0 и их ротированные части
+WORKER_SUFFIX = re.compile(r"^\.w\d+(\.\d{8}-\d{6}(-\d+)?(\.gz)?)?$")
+HEXAGRAM_IN_DETAILS = re.compile(r"Гексаграмма: (\d+)")
+# Гадание без вопроса пишет номер иначе: "Номер: 11, Название: ..."
+DIVINATION_IN_DETAILS = re.compile(r"Номер: (\d+)")
+# Шаги воронки помощи в формулировке вопроса
+FUNNEL = ("Начало помощи в формулировке", "Формулировка проблемы", "Подтверждение вопроса", "Сгенерирован совет")
+# Свой вариант вопроса заменяет подтверждение предложенного: шаг засчитывается и им
+FUNNEL_STEPS = {**{action: step for step, action in enumerate(FUNNEL)},
+                "Запрос своего варианта": FUNNEL.index("Подтверждение вопроса")}
+REPORTS = ("daily", "actions", "funnel", "hexagrams")
+
+
+class Aggregate:
+    """Складываемые итоги по части журнала"""
+
+    def __init__(self):
+        self.events = 0
+        self.bad_lines = 0
+        self.daily_events = Counter()
+        self.daily_users = defaultdict(set)
+        self.actions = Counter()
+        self.hexagrams = Counter()
+        self.divinations = Counter()
+        self.funnel_users = [set() for _ in FUNNEL]
+
+    def add_line(self, line: bytes):
+        try:
+            record = json.loads(line)
+            day = record["timestamp"][:10]
+            user_id = record["user_id"]
+            action = record["action"]
+        except (ValueError, KeyError, TypeError):
+            self.bad_lines += 1
+            return
+        self.events += 1
+        self.daily_events[day] += 1
+        self.daily_users[day].add(user_id)
+        self.actions[action] += 1
+        if action in FUNNEL_STEPS:
+            self.funnel_users[FUNNEL_STEPS[action]].add(user_id)
+        if action == "Сгенерирован совет":
+            match = HEXAGRAM_IN_DETAILS.search(record.get("details") or "")
+            if match:
+                self.hexagrams[int(match.group(1))] += 1
+        elif action == "Генерация гексаграммы":
+            match = DIVINATION_IN_DETAILS.search(record.get("details") or "")
+            if match:
+                self.divinations[int(match.group(1))] += 1
+
+    def merge(self, other: "Aggregate"):
+        self.events += other.events
+        self.bad_lines += other.bad_lines
+        self.daily_events.update(other.daily_events)
+        for day, users in other.daily_users.items():
+            self.daily_users[day] |= users
+        self.actions.update(other.actions)
+        self.hexagrams.update(other.hexagrams)
+        self.divinations.update(other.divinations)
+        for users, others in zip(self.funnel_users, other.funnel_users):
+            users |= others
+
+    def to_dict(self) -> dict:
+        return {
+            "events": self.events,
+            "bad_lines": self.bad_lines,
+            "daily_events": dict(self.daily_events),
+            "daily_users": {day: sorted(users) for day, users in self.daily_users.items()},
+            "actions": dict(self.actions),
+            "hexagrams": {str(number): count for number, count in self.hexagrams.items()},
+            "divinations": {str(number): count for number, count in self.divinations.items()},
+            "funnel_users": [sorted(users) for users in self.funnel_users],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Aggregate":
+        aggregate = cls()
+        aggregate.events = data["events"]
+        aggregate.bad_lines = data["bad_lines"]
+        aggregate.daily_events.update(data["daily_events"])
+        for day, users in data["daily_users"].items():
+            aggregate.daily_users[day] = set(users)
+        aggregate.actions.update(data["actions"])
+        aggregate.hexagrams.update({int(number): count for number, count in data["hexagrams"].items()})
+        aggregate.divinations.update({int(number): count for number, count in data["divinations"].items()})
+        aggregate.funnel_users = [set(users) for users in data["funnel_users"]]
+        return aggregate
+
+
+def log_parts(path: str) -> list:
+    """Ротированные части в порядке создания, журналы воркеров, затем текущий файл"""
+    log = Path(path)
+    parts = sorted(
+        str(p) for p in log.parent.glob(log.name + ".*")
+        if ROTATED_SUFFIX.search(p.name[len(log.name):]) or WORKER_SUFFIX.match(p.name[len(log.name):])
+    )
+    if log.exists():
+        parts.append(str(log))
+    return parts
+
+
+def _open(path: str):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def fingerprint(path: str):
+    """Отпечаток части по первой строке: не меняется при переименовании и сжатии"""
+    with _open(path) as f:
+        first = f.readline()
+    if not first.endswith(b"\n"):
+        return None
+    return hashlib.sha1(first).hexdigest()[:16]
+
+
+def _complete_end(path: str) -> int:
+    """Конец последней полной строки: недописанную строку оставляем на следующий запуск"""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0:
+            step = min(65536, end)
+            f.seek(end - step)
+            block = f.read(step)
+            newline = block.rfind(b"\n")
+            if newline >= 0:
+                return end - step + newline + 1
+            end -= step
+    return 0
+
+
+def _chunks(path: str, start: int, end: int, chunk_size: int) -> list:
+    """Разбить [start, end) на куски, которые начинаются с начала строки"""
+    bounds = [start]
+    with open(path, "rb") as f:
+        while bounds[-1] + chunk_size < end:
+            f.seek(bounds[-1] + chunk_size)
+            f.readline()
+            position = f.tell()
+            if position >= end:
+                break
+            bounds.append(position)
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _scan(path: str, start: int, end):
+    """Итоги строк части с позиции start до end (None — до конца файла) и достигнутая позиция"""
+    aggregate = Aggregate()
+    with _open(path) as f:
+        # В сжатом файле позиция — в распакованных байтах, gzip перематывает чтением
+        f.seek(start)
+        position = start
+        for line in f:
+            if end is not None and position >= end:
+                break
+            if not line.endswith(b"\n"):
+                break
+            position += len(line)
+            if line.strip():
+                aggregate.add_line(line)
+    return aggregate, position
+
+
+def iter_user_ids(log_path: str):
+    """Все user_id из журнала и его частей без повторов, по мере чтения"""
+    seen = set()
+    for part in log_parts(log_path):
+        with _open(part) as f:
+            for line in f:
+                try:
+                    user_id = json.loads(line)["user_id"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if isinstance(user_id, int) and user_id not in seen:
+                    seen.add(user_id)
+                    yield user_id
+
+
+def load_checkpoint(path: str) -> dict:
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") == CHECKPOINT_VERSION:
+            return data
+    return {"version": CHECKPOINT_VERSION, "files": {}, "complete": [], "totals": None}
+
+
+def save_checkpoint(path: str, files: dict, complete: set, totals: Aggregate):
+    tmp_path = f"{path}.tmp"
+    data = {"version": CHECKPOINT_VERSION, "files": files, "complete": sorted(complete), "totals": totals.to_dict()}
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def analyze(log_path: str, checkpoint_path: str = None, jobs: int = 0, chunk_size: int = 64 << 20,
+            resume: bool = True) -> Aggregate:
+    """Дочитать журнал с контрольной точки и вернуть итоги за всю историю"""
+    checkpoint = load_checkpoint(checkpoint_path if resume else None)
+    # Прочитанная позиция по отпечатку части; ротированные части после прочтения не меняются
+    files = checkpoint["files"]
+    complete = set(checkpoint["complete"])
+    totals = Aggregate.from_dict(checkpoint["totals"]) if checkpoint["totals"] else Aggregate()
+
+    # Задачи: (отпечаток, путь, начало, конец); конец None — сжатая часть до конца
+    tasks = []
+    rotated = set()
+    for part in log_parts(log_path):
+        key = fingerprint(part)
+        if key is None or key in complete:
+            continue
+        if ROTATED_SUFFIX.search(part):
+            rotated.add(key)
+        offset = files.get(key, 0)
+        if part.endswith(".gz"):
+            tasks.append((key, part, offset, None))
+            continue
+        end = _complete_end(part)
+        if end > offset:
+            tasks.extend((key, part, start, stop) for start, stop in _chunks(part, offset, end, chunk_size))
+
+    # Итоги части попадают в контрольную точку только целиком, когда готовы все ее куски
+    pending = Counter(task[0] for task in tasks)
+    partial = defaultdict(Aggregate)
+    reached = {}
+
+    def finish(key, aggregate, position):
+        partial[key].merge(aggregate)
+        reached[key] = max(reached.get(key, 0), position)
+        pending[key] -= 1
+        if pending[key] == 0:
+            totals.merge(partial.pop(key))
+            files[key] = max(files.get(key, 0), reached.pop(key))
+            if key in rotated:
+                complete.add(key)
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, files, complete, totals)
+
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(tasks) <= 1:
+        for key, part, start, end in tasks:
+            finish(key, *_scan(part, start, end))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(_scan, part, start, end): key for key, part, start, end in tasks}
+            for future in as_completed(futures):
+                finish(futures[future], *future.result())
+    return totals
+
+
+def _hexagram_names() -> dict:
+    try:
+        with open(Path(__file__).parent / "hexagrams.json", "r", encoding="utf-8") as f:
+            return {int(k): v[1] for k, v in json.load(f).items()}
+    except (OSError, ValueError, IndexError):
+        return {}
+
+
+def build_report(totals: Aggregate, name: str) -> list:
+    """Строки отчета: список словарей с одинаковыми ключами"""
+    if name == "daily":
+        return [
+            {"date": day, "events": totals.daily_events[day], "active_users": len(totals.daily_users[day])}
+            for day in sorted(totals.daily_events)
+        ]
+    if name == "actions":
+        return [{"action": action, "count": count} for action, count in totals.actions.most_common()]
+    if name == "funnel":
+        rows = []
+        reached = None
+        for action, users in zip(FUNNEL, totals.funnel_users):
+            # Дошедшие до шага — те, кто выполнил и его, и все предыдущие
+            previous = reached
+            reached = users if previous is None else previous & users
+            rows.append({
+                "step": action,
+                "users": len(users),
+                "reached": len(reached),
+                "conversion": round(len(reached) / len(previous), 4) if previous else (1.0 if reached else 0.0),
+            })
+        return rows
+    if name == "hexagrams":
+        # Выпавшие в советах и в гадании без вопроса — отдельными столбцами, доля от суммы
+        names = _hexagram_names()
+        counts = totals.hexagrams + totals.divinations
+        total = sum(counts.values())
+        return [
+            {"hexagram": number, "name": names.get(number, ""), "advice": totals.hexagrams[number],
+             "divination": totals.divinations[number], "count": count,
+             "share": round(count / total, 4) if total else 0.0}
+            for number, count in counts.most_common()
+        ]
+    raise ValueError(f"Неизвестный отчет: {name}")
+
+
+def write_report(totals: Aggregate, report: str, fmt: str, out):
+    if fmt == "json":
+        names = REPORTS if report == "all" else (report,)
+        data = {name: build_report(totals, name) for name in names}
+        data["events"] = totals.events
+        data["bad_lines"] = totals.bad_lines
+        json.dump(data, out, ensure_ascii=False, indent=2)
+        out.write("\n")
+        return
+    rows = build_report(totals, report)
+    if not rows:
+        return
+    writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Отчеты по журналу действий пользователей")
+    parser.add_argument("--log", default="user_sessions.txt")
+    parser.add_argument("--report", choices=REPORTS + ("all",), default="daily")
+    parser.add_argument("--format", choices=("csv", "json"), default="csv")
+    parser.add_argument("--out", default="-", help="файл отчета, по умолчанию stdout")
+    parser.add_argument("--jobs", type=int, default=0, help="процессов, по умолчанию по числу ядер")
+    parser.add_argument("--checkpoint", help="файл контрольной точки, по умолчанию <log>.analytics.json")
+    parser.add_argument("--full", action="store_true", help="пересчитать журнал с начала")
+    args = parser.parse_args()
+    if args.report == "all" and args.format == "csv":
+        parser.error("--report all поддерживается только с --format json")
+
+    checkpoint_path = args.checkpoint or f"{args.log}.analytics.json"
+    totals = analyze(args.log, checkpoint_path, args.jobs, resume=not args.full)
+    if args.out == "-":
+        write_report(totals, args.report, args.format, sys.stdout)
+    else:
+        with open(args.out, "w", encoding="utf-8", newline="") as f:
+            write_report(totals, args.report, args.format, f)
@@ -0,0 +1,89 @@
+"""Проверка и замер табличного броска гексаграммы.
+
+Проверяет, что частоты видов линий совпадают с DEFAULT_WEIGHTS (критерий хи-квадрат),
+что номера основной и преобразованной гексаграмм совпадают со старым
+способом подсчета, и сравнивает скорость со старым generate_hexagram.
+Код возврата 1, если проверка не прошла.
+
+Запуск из корня репозитория:
+    python -m benchmarks.casting_bench [--casts 1000000]
+"""
+import argparse
+import random
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    # Запуск как python benchmarks/<файл>.py: модули бота и пакет benchmarks лежат в корне
+    sys.path.insert(0, str(ROOT))
+
+from casting import CHI2_CRITICAL, DEFAULT_WEIGHTS, OUTCOMES, CastingEngine, load_numpy
+
+
+def legacy_generate_hexagram():
+    lines = [
+        random.choices(list(DEFAULT_WEIGHTS.keys()), weights=list(DEFAULT_WEIGHTS.values()), k=1)[0]
+        for _ in range(6)
+    ]
+    binary = ''.join(['1' if x in ['Ян', 'ЯнСтарый'] else '0' for x in reversed(lines)])
+    number = int(binary, 2) + 1
+    changing_lines = [i for i, line in enumerate(lines, 1) if "Старый" in line]
+    return number, changing_lines, lines
+
+
+def legacy_numbers(lines):
+    primary = ''.join('1' if x in ('Ян', 'ЯнСтарый') else '0' for x in reversed(lines))
+    flipped = {"ЯнСтарый": "Инь", "ИньСтарый": "Ян"}
+    moved = [flipped.get(x, x) for x in lines]
+    transformed = ''.join('1' if x in ('Ян', 'ЯнСтарый') else '0' for x in reversed(moved))
+    return int(primary, 2) + 1, int(transformed, 2) + 1
+
+
+def check_tables(engine: CastingEngine) -> bool:
+    ok = abs(sum(engine.probabilities) - 1.0) < 1e-9
+    for outcome in range(OUTCOMES):
+        lines = list(engine.lines[outcome])
+        if legacy_numbers(lines) != (engine.primary[outcome], engine.transformed[outcome]):
+            ok = False
+        if list(engine.changing_lines[outcome]) != [i for i, x in enumerate(lines, 1) if "Старый" in x]:
+            ok = False
+    return ok
+
+
+def run(casts: int, repeat: int, seed: int) -> bool:
+    engine = CastingEngine(DEFAULT_WEIGHTS, rng=random.Random(seed))
+
+    tables_ok = check_tables(engine)
+    print(f"Таблицы совпадают со старым подсчетом: {'да' if tables_ok else 'НЕТ'}")
+
+    single = [engine.sample() for _ in range(min(casts, 200000))]
+    batch = engine.sample_batch(casts, seed=seed)
+    statistics_ok = True
+    for label, outcomes in (("sample", single), ("sample_batch", batch)):
+        counts = engine.line_counts(outcomes)
+        chi2 = engine.chi_square(counts)
+        total = sum(counts)
+        shares = ", ".join(f"{name} {count / total * 100:.2f}%" for name, count in zip(engine.line_names, counts))
+        passed = chi2 < CHI2_CRITICAL
+        statistics_ok &= passed
+        print(f"{label:<13} линий {total}: {shares}; хи² = {chi2:.2f} ({'ок' if passed else 'ОТКЛОНЕНИЕ'})")
+
+    legacy = timeit.timeit(legacy_generate_hexagram, number=repeat) / repeat
+    table = timeit.timeit(engine.cast, number=repeat) / repeat
+    batch_time = timeit.timeit(lambda: engine.cast_batch(casts, seed=seed), number=1)
+    print(f"старый generate_hexagram: {legacy * 1e6:.2f} мкс, cast: {table * 1e6:.2f} мкс "
+          f"({legacy / table:.1f}x)")
+    print(f"cast_batch({casts}) {'NumPy' if load_numpy() is not None else 'без NumPy'}: {batch_time:.3f} с "
+          f"({casts / batch_time / 1e6:.1f} млн бросков/с)")
+    return tables_ok and statistics_ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--casts", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.casts, args.repeat, args.seed) else 1)
@@ -0,0 +1,238 @@
+"""Нагрузочный тест бота без сети.
+
+Поднимает заглушки Bot API и LLM, собирает настоящий Application из
+main.build_application() и прогоняет через него синтетические обновления
+от тысяч пользователей по сценариям помощи, готового вопроса, гадания и
+толкования. Печатает пропускную способность, p50/p95/p99 по сценариям и
+прирост памяти.
+
+Запуск из корня репозитория:
+    python -m benchmarks.load_test --users 2000 --concurrency 500 --llm-latency 0.8
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import aiohttp
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    # Запуск как python benchmarks/<файл>.py: модули бота и пакет benchmarks лежат в корне
+    sys.path.insert(0, str(ROOT))
+
+from benchmarks.stubs import start_in_process
+
+FLOWS = {
+    "help": ["Помочь сформулировать", "Что делать с работой, если начальник не ценит?", "1. Да", "cb:rate_good"],
+    "ready": ["Готовый вопрос", "Стоит ли менять город ради новой должности?", "cb:rate_bad"],
+    "divination": ["Быстрый ответ И-Цзин"],
+    "interpretation": ["Толкование гексаграммы", "{hexagram}", "Развернутое толкование", "💰 Финансы"],
+    "short_interpretation": ["Толкование гексаграммы", "{hexagram}", "Краткое толкование"],
+    "info": ["Инфо"],
+}
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class UpdateFactory:
+    def __init__(self):
+        self.update_id = 0
+
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def build(self, user_id: int, step: str) -> dict:
+        self.update_id += 1
+        chat = {"id": user_id, "type": "private"}
+        if step.startswith("cb:"):
+            return {
+                "update_id": self.update_id,
+                "callback_query": {
+                    "id": str(self.update_id),
+                    "from": self._user(user_id),
+                    "chat_instance": str(user_id),
+                    "data": step[3:],
+                    "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "совет"},
+                },
+            }
+        message = {
+            "message_id": self.update_id,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": self._user(user_id),
+            "text": step,
+        }
+        if step.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(step.split()[0])}]
+        return {"update_id": self.update_id, "message": message}
+
+
+async def run(args):
+    # Заглушки живут в своих процессах: в замер попадает только CPU бота
+    bot_url, bot_process = start_in_process("bot", latency=args.bot_latency)
+    llm_url, llm_process = start_in_process(
+        "llm", latency=args.llm_latency, jitter=args.llm_jitter, error_rate=args.llm_error_rate
+    )
+
+    # Логи и кэши пишутся во временный каталог, настоящие файлы не трогаем
+    workdir = tempfile.mkdtemp(prefix="dao-load-")
+    os.chdir(workdir)
+    os.environ.update({
+        "TELEGRAM_TOKEN": "123456:LOADTEST",
+        "PROXY_API_KEY": "load-test",
+        "OPENAI_BASE_URL": llm_url,
+        "LLM_MAX_CONCURRENCY": str(args.llm_concurrency),
+        "LLM_STREAMING": "1" if args.streaming else "0",
+        "STREAM_EDIT_INTERVAL": "0.2",
+        "INTERPRETATION_CACHE_FILE": os.path.join(workdir, "interpretation_cache.db"),
+        "FILE_ID_CACHE_FILE": os.path.join(workdir, "file_ids.db"),
+        "USAGE_LEDGER_FILE": os.path.join(workdir, "llm_usage.db"),
+    })
+    if not args.telegram_limits:
+        # Заглушка не ограничивает отправку, а сценарии шлют шаги без пауз, как не шлет живой человек
+        os.environ.update({"OUTBOUND_GLOBAL_PER_SECOND": "100000", "OUTBOUND_CHAT_PER_SECOND": "1000"})
+    sys.path.insert(0, str(ROOT))
+    import main as bot
+    from telegram import Update
+    from telegram.warnings import PTBUserWarning
+
+    # Без JobQueue PTB предупреждает про conversation_timeout на каждый ConversationHandler
+    warnings.filterwarnings("ignore", category=PTBUserWarning)
+
+    app = bot.build_application(base_url=bot_url)
+    factory = UpdateFactory()
+    rng = random.Random(args.seed)
+    flow_names = [name for name in args.flows.split(",") if name in FLOWS]
+    latencies = {name: [] for name in flow_names}
+    step_latencies = []
+    errors = 0
+    limiter = asyncio.Semaphore(args.concurrency)
+
+    async def process(update):
+        # Тот же путь, что у обновлений из очереди: через планировщик с полосами
+        await app.update_processor.process_update(update, app.process_update(update))
+
+    async def simulate(user_id: int):
+        nonlocal errors
+        flow = rng.choice(flow_names)
+        steps = [step.format(hexagram=f"{rng.randint(1, 64)}.{rng.randint(1, 6)}") for step in FLOWS[flow]]
+        async with limiter:
+            started = time.perf_counter()
+            try:
+                await process(Update.de_json(factory.build(user_id, "/start"), app.bot))
+                for step in steps:
+                    step_started = time.perf_counter()
+                    await process(Update.de_json(factory.build(user_id, step), app.bot))
+                    step_latencies.append(time.perf_counter() - step_started)
+            except Exception:
+                errors += 1
+                return
+            latencies[flow].append(time.perf_counter() - started)
+
+    async with app:
+        await bot.prepare_services(app)
+        rss_before = current_rss_mb()
+        started = time.perf_counter()
+        await asyncio.gather(*(simulate(100000 + i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+        rss_after = current_rss_mb()
+    await bot.shutdown_services(app)
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{bot_url}/stats") as response:
+            bot_stats = await response.json()
+        async with session.get(f"{llm_url}/stats") as response:
+            llm_stats = await response.json()
+    bot_process.terminate()
+    llm_process.terminate()
+
+    report = {
+        "users": args.users,
+        "updates": len(step_latencies) + args.users,
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round((len(step_latencies) + args.users) / elapsed, 1),
+        "flows_per_s": round(sum(len(v) for v in latencies.values()) / elapsed, 1),
+        "errors": errors,
+        "llm_requests": llm_stats["requests"],
+        "llm_upstream_errors": llm_stats["errors"],
+        "bot_api_calls": bot_stats["calls"],
+        "uploaded_bytes": bot_stats["uploaded_bytes"],
+        "photo_file_ids": bot.photo_file_ids.stats(),
+        "llm_usage": bot.usage_ledger.stats(),
+        "rss_mb_before": round(rss_before, 1),
+        "rss_mb_after": round(rss_after, 1),
+        "rss_mb_growth": round(rss_after - rss_before, 1),
+        "flows": {
+            name: {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+            }
+            for name, values in latencies.items()
+        },
+    }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return report
+
+    print(f"Пользователей: {report['users']}, обновлений: {report['updates']}, ошибок: {report['errors']}")
+    print(f"Время: {report['elapsed_s']} с, {report['updates_per_s']} обновлений/с, {report['flows_per_s']} сценариев/с")
+    print(f"Запросов к LLM: {report['llm_requests']}, из них с ошибкой: {report['llm_upstream_errors']}")
+    usage = report["llm_usage"]
+    print(f"Токены LLM: {usage['prompt_tokens']} в запросах, {usage['completion_tokens']} в ответах, "
+          f"оценка стоимости {usage['cost']:.4f}, по длине текста: {usage['estimated']}")
+    photos = report["photo_file_ids"]
+    print(f"Картинки: загружено {report['uploaded_bytes'] // 1024} КБ, по file_id {photos['hits']} из "
+          f"{photos['hits'] + photos['uploads']}, сэкономлено {photos['bytes_saved'] // 1024} КБ")
+    print(f"Память: {report['rss_mb_before']} → {report['rss_mb_after']} МБ (+{report['rss_mb_growth']})")
+    print(f"{'сценарий':<22}{'кол-во':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, row in report["flows"].items():
+        print(f"{name:<22}{row['count']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест Дао-бота на заглушках")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200, help="одновременно активных пользователей")
+    parser.add_argument("--flows", default=",".join(FLOWS))
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="доля ответов 503 от заглушки LLM")
+    parser.add_argument("--llm-concurrency", type=int, default=100)
+    parser.add_argument("--bot-latency", type=float, default=0.005)
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--telegram-limits", action="store_true",
+                        help="оставить лимиты исходящих сообщений Telegram (30/с на бот, 1/с на чат)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
@@ -0,0 +1,230 @@
+"""Выбор обработчика: цепочка регулярных выражений против MenuHandler.
+
+Сначала проверяется, что обработчики из build_application выбирают для
+каждого текста и каждого состояния диалога тот же обработчик, что и прежняя
+цепочка MessageHandler с filters.Regex (она воспроизведена ниже). Затем
+замеряется время выбора обработчика — тот же перебор check_update, что
+делает Application.process_update, — на кнопках меню, свободном тексте и
+тексте внутри толкования гексаграммы.
+
+Запуск из корня репозитория:
+    python -m benchmarks.menu_router_bench [--updates 20000] [--repeat 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    # Запуск как python benchmarks/<файл>.py: модули бота и пакет benchmarks лежат в корне
+    sys.path.insert(0, str(ROOT))
+USER_ID = 1001
+
+LABELS = [
+    "Старт", "Start", "Выйти", "Exit", "Быстрый ответ И-Цзин", "Divination", "Инфо", "Info",
+    "English version ➡️", "Толкование гексаграммы", "Готовый вопрос", "Ready question",
+    "Помочь сформулировать", "Help", "Краткое толкование", "Развернутое толкование",
+    "💑 Отношения", "👨‍👩‍👧‍👦 Дети", "💰 Финансы", "🧘 Здоровье", "🎓 Образование", "🏛 Бизнес",
+    "🔮 Общее толкование", "Отмена",
+]
+FREE_TEXT = [
+    "Что делать с работой, если начальник не ценит мои усилия?",
+    "12", "64 3", "старт", "Старт ", " Старт", "Старт\n\n", "Старт\nВыйти", "Толкование",
+    "Краткое толкование гексаграммы", "1. Да", "Уточнить",
+]
+COMMANDS = ["/start", "/stats", "/broadcast", "/cancel", "/start Старт"]
+
+
+def legacy_handlers(bot):
+    """Обработчики в том виде, как их регистрировал build_application до MenuHandler"""
+    from telegram.ext import CallbackQueryHandler, CommandHandler, ConversationHandler, MessageHandler, filters
+
+    choices = r"^(Краткое толкование|Развернутое толкование)$"
+    contexts = r"^(💑 Отношения|👨‍👩‍👧‍👦 Дети|💰 Финансы|🧘 Здоровье|🎓 Образование|🏛 Бизнес|🔮 Общее толкование)$"
+    return [
+        CommandHandler("start", bot.start_command),
+        CommandHandler("stats", bot.show_stats),
+        CommandHandler("broadcast", bot.broadcast_command),
+        MessageHandler(filters.Regex(r"^(Старт|Start)$"), bot.start_command),
+        MessageHandler(filters.Regex(r"^(Выйти|Exit)$"), bot.exit_command),
+        MessageHandler(filters.Regex(r"^(Быстрый ответ И-Цзин|Divination)$"), bot.divination_command),
+        MessageHandler(filters.Regex(r"^(Инфо|Info)$"), bot.info_command),
+        CallbackQueryHandler(bot.handle_rating, pattern="^rate_"),
+        MessageHandler(filters.Regex(r"^English version ➡️$"), bot.english_version),
+        ConversationHandler(
+            entry_points=[MessageHandler(filters.Regex(r"^Толкование гексаграммы$"), bot.start_hexagram_interpretation)],
+            states={
+                bot.HEXAGRAM_INTERPRETATION: [
+                    MessageHandler(
+                        filters.TEXT & ~filters.COMMAND & ~filters.Regex(choices) & ~filters.Regex(contexts),
+                        bot.process_hexagram_input
+                    ),
+                    MessageHandler(filters.Regex(choices), bot.handle_interpretation_choice),
+                    MessageHandler(filters.Regex(contexts), bot.handle_context_choice),
+                ],
+            },
+            fallbacks=[CommandHandler("cancel", bot.cancel), MessageHandler(filters.ALL, bot.timeout_handler)],
+            name="hex_interpretation",
+        ),
+        ConversationHandler(
+            entry_points=[MessageHandler(filters.Regex(r"^(Готовый вопрос|Ready question)$"), bot.ready_question)],
+            states={
+                bot.FORMULATE_PROBLEM: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.process_ready_question)],
+            },
+            fallbacks=[CommandHandler("cancel", bot.cancel), MessageHandler(filters.ALL, bot.timeout_handler)],
+            name="ready_question",
+        ),
+        ConversationHandler(
+            entry_points=[MessageHandler(filters.Regex(r"^(Помочь сформулировать|Help)$"), bot.start_help)],
+            states={
+                bot.FORMULATE_PROBLEM: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.formulate_problem)],
+                bot.CONFIRM_QUESTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.confirm_question)],
+            },
+            fallbacks=[CommandHandler("cancel", bot.cancel)],
+            name="help_question",
+        ),
+        MessageHandler(filters.TEXT & ~filters.COMMAND, bot.handle_unrecognized),
+    ]
+
+
+def select(handlers, update):
+    """(диалог, обработчик), которые выберет Application для обновления"""
+    from telegram.ext import ConversationHandler
+    from menu_router import MenuHandler
+
+    for handler in handlers:
+        check = handler.check_update(update)
+        if check is None or check is False:
+            continue
+        conversation = None
+        if isinstance(handler, ConversationHandler):
+            conversation = handler.name
+            handler, check = check[2], check[3]
+        return conversation, check if isinstance(handler, MenuHandler) else handler.callback
+    return None, None
+
+
+def set_state(handlers, conversation, state):
+    from telegram.ext import ConversationHandler
+
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            handler._conversations.clear()
+            if handler.name == conversation:
+                handler._conversations[(USER_ID, USER_ID)] = state
+
+
+def build_updates(telegram_bot):
+    from telegram import Update
+    from benchmarks.load_test import UpdateFactory
+
+    factory = UpdateFactory()
+    texts = LABELS + [label + "\n" for label in LABELS] + FREE_TEXT + COMMANDS
+    updates = {text: Update.de_json(factory.build(USER_ID, text), telegram_bot) for text in texts}
+    raw = factory.build(USER_ID, "cb:rate_good")
+    updates["cb:rate_good"] = Update.de_json(raw, telegram_bot)
+    raw = factory.build(USER_ID, "")
+    del raw["message"]["text"]
+    raw["message"]["sticker"] = {
+        "file_id": "s", "file_unique_id": "s", "width": 1, "height": 1,
+        "is_animated": False, "is_video": False, "type": "regular",
+    }
+    updates["<стикер>"] = Update.de_json(raw, telegram_bot)
+    raw = factory.build(USER_ID, "Старт")
+    raw["edited_message"] = raw.pop("message")
+    raw["edited_message"]["edit_date"] = raw["edited_message"]["date"]
+    updates["<правка: Старт>"] = Update.de_json(raw, telegram_bot)
+    return updates
+
+
+def check_equivalence(bot, legacy, current, updates) -> int:
+    states = [
+        (None, None),
+        ("hex_interpretation", bot.HEXAGRAM_INTERPRETATION),
+        ("ready_question", bot.FORMULATE_PROBLEM),
+        ("help_question", bot.FORMULATE_PROBLEM),
+        ("help_question", bot.CONFIRM_QUESTION),
+    ]
+    mismatches = 0
+    for conversation, state in states:
+        set_state(legacy, conversation, state)
+        set_state(current, conversation, state)
+        for text, update in updates.items():
+            expected, actual = select(legacy, update), select(current, update)
+            if expected != actual:
+                mismatches += 1
+                print(f"  расхождение [{conversation}:{state}] {text!r}: "
+                      f"{expected[0]}/{getattr(expected[1], '__name__', None)} -> "
+                      f"{actual[0]}/{getattr(actual[1], '__name__', None)}")
+    print(f"Проверено: {len(states)} состояний × {len(updates)} обновлений, расхождений: {mismatches}")
+    return mismatches
+
+
+def bench(handlers, updates, count: int, repeat: int) -> float:
+    """Лучшее из repeat прогонов, мкс на обновление"""
+    batch = [updates[i % len(updates)] for i in range(count)]
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for update in batch:
+            select(handlers, update)
+        best = min(best, time.perf_counter() - started)
+    return best / count * 1e6
+
+
+async def prepare():
+    """(модуль бота, обработчики build_application, прежние обработчики, обновления)"""
+    # Бот импортируется с заглушечными ключами, его файлы пишутся во временный каталог
+    from benchmarks.stubs import start_in_process
+    bot_url, bot_process = start_in_process("bot", latency=0.0)
+    os.chdir(tempfile.mkdtemp(prefix="dao-menu-"))
+    os.environ.update({"TELEGRAM_TOKEN": "123456:MENUBENCH", "PROXY_API_KEY": "menu-bench"})
+    import main as bot
+    from telegram.warnings import PTBUserWarning
+    warnings.filterwarnings("ignore", category=PTBUserWarning)
+
+    app = bot.build_application(base_url=bot_url)
+    # CommandHandler сверяет имя бота в /команда@бот: нужен getMe
+    try:
+        await app.bot.initialize()
+    finally:
+        bot_process.terminate()
+    return bot, app.handlers[0], legacy_handlers(bot), build_updates(app.bot)
+
+
+async def run(args):
+    bot, current, legacy, updates = await prepare()
+    if check_equivalence(bot, legacy, current, updates):
+        sys.exit(1)
+
+    mixes = {
+        "кнопки меню": (None, None, LABELS[:10]),
+        "свободный текст": (None, None, FREE_TEXT[:1]),
+        "текст в толковании": ("hex_interpretation", bot.HEXAGRAM_INTERPRETATION, ["12", "64 3"]),
+        "выбор контекста": ("hex_interpretation", bot.HEXAGRAM_INTERPRETATION, LABELS[16:23]),
+    }
+    print(f"Выбор обработчика, мкс на обновление ({args.updates} обновлений):")
+    print(f"  {'':<22}{'regex':>10}{'menu':>10}{'ускорение':>12}")
+    for name, (conversation, state, texts) in mixes.items():
+        sample = [updates[text] for text in texts]
+        set_state(legacy, conversation, state)
+        set_state(current, conversation, state)
+        old = bench(legacy, sample, args.updates, args.repeat)
+        new = bench(current, sample, args.updates, args.repeat)
+        print(f"  {name:<22}{old:>10.2f}{new:>10.2f}{old / new:>11.1f}×")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выбор обработчика: регулярные выражения против MenuHandler")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
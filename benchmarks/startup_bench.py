@@ -0,0 +1,129 @@
+"""Замер холодного старта бота.
+
+Каждый прогон — новый процесс интерпретатора, как при запуске контейнера
+с нуля. Процесс импортирует main, собирает Application, выполняет
+prepare_services и обрабатывает первые обновления (/start и гадание с
+картинкой) через заглушку Bot API. Печатаются медианы по прогонам: время
+импорта, инициализации, первых обновлений и время от запуска процесса
+до первого ответа.
+
+Запуск из корня репозитория:
+    python -m benchmarks.startup_bench [--runs 5] [--importtime]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    # Запуск как python benchmarks/<файл>.py: модули бота и пакет benchmarks лежат в корне
+    sys.path.insert(0, str(ROOT))
+FIRST_UPDATES = ("/start", "Быстрый ответ И-Цзин")
+
+
+async def child(bot_url: str):
+    started = time.perf_counter()
+    sys.path.insert(0, str(ROOT))
+    import main as bot
+    imported = time.perf_counter()
+
+    import warnings
+    from telegram import Update
+    from telegram.warnings import PTBUserWarning
+    from benchmarks.load_test import UpdateFactory
+    warnings.filterwarnings("ignore", category=PTBUserWarning)
+
+    app = bot.build_application(base_url=bot_url)
+    factory = UpdateFactory()
+    timings = {"import": imported - started}
+    async with app:
+        init_started = time.perf_counter()
+        await bot.prepare_services(app)
+        timings["init"] = time.perf_counter() - init_started
+        for text in FIRST_UPDATES:
+            update = Update.de_json(factory.build(1, text), app.bot)
+            update_started = time.perf_counter()
+            await app.update_processor.process_update(update, app.process_update(update))
+            timings[text] = time.perf_counter() - update_started
+            timings.setdefault("first_reply", time.time() - float(os.environ["STARTUP_BENCH_SPAWNED"]))
+        await bot.shutdown_services(app)
+    timings["modules"] = sorted(name for name in ("openai", "PIL", "numpy", "aiohttp") if name in sys.modules)
+    print(json.dumps(timings, ensure_ascii=False))
+
+
+def run_once(bot_url: str, workdir: str, importtime: bool):
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_TOKEN": "123456:STARTUP",
+        "PROXY_API_KEY": "startup-bench",
+        "OPENAI_BASE_URL": "http://127.0.0.1:9/v1",
+        "INTERPRETATION_CACHE_FILE": os.path.join(workdir, "interpretation_cache.db"),
+        "FILE_ID_CACHE_FILE": os.path.join(workdir, "file_ids.db"),
+        "USAGE_LEDGER_FILE": os.path.join(workdir, "llm_usage.db"),
+        "PYTHONPATH": str(ROOT),
+    })
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-m", "benchmarks.startup_bench", "--child", bot_url]
+    env["STARTUP_BENCH_SPAWNED"] = repr(time.time())
+    result = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def top_imports(stderr: str, count: int = 15) -> list:
+    """main и его прямые импорты с наибольшим суммарным временем импорта"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Отступ в выводе -X importtime: по два пробела на уровень вложенности
+        if cumulative.strip().isdigit() and len(name) - len(name.lstrip()) <= 3:
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер холодного старта Дао-бота")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="показать самые долгие импорты")
+    parser.add_argument("--child", metavar="BOT_URL", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(child(args.child))
+        return
+
+    from benchmarks.stubs import start_in_process
+    bot_url, bot_process = start_in_process("bot", latency=0.0)
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="dao-startup-") as workdir:
+        # Первый прогон прогревает кэш байткода и файловый кэш ОС, в статистику не идет
+        run_once(bot_url, workdir, False)
+        for _ in range(args.runs):
+            runs.append(run_once(bot_url, workdir, False)[0])
+        if args.importtime:
+            _, stderr = run_once(bot_url, workdir, True)
+    bot_process.terminate()
+
+    keys = ["import", "init", *FIRST_UPDATES, "first_reply"]
+    print(f"Прогонов: {len(runs)}, медианы, мс")
+    for key in keys:
+        print(f"  {key:<24}{statistics.median(run[key] for run in runs) * 1000:>10.1f}")
+    print(f"Загружены к первому ответу: {', '.join(runs[-1]['modules']) or '-'}")
+    if args.importtime:
+        print("Самые долгие импорты main, мс:")
+        for milliseconds, name in top_imports(stderr):
+            print(f"  {name:<24}{milliseconds:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Сравнение старого поиска стоп-слов (`word in text`) с автоматом Ахо–Корасик.
+
+Запуск из корня репозитория:
+    python -m benchmarks.stop_words_bench [--sizes 71,1000,5000,20000]
+"""
+import argparse
+import json
+import random
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    # Запуск как python benchmarks/<файл>.py: модули бота и пакет benchmarks лежат в корне
+    sys.path.insert(0, str(ROOT))
+
+from stop_words import StopWordMatcher
+
+ALPHABET = "абвгдежзийклмнопрстуфхцчшщыьэюя"
+
+SAMPLE_TEXTS = [
+    "Что делать с работой, если начальник не ценит мои усилия и я устал?",
+    "Стоит ли переезжать в другой город ради новой должности в этом году",
+    "Как наладить отношения с сыном, он перестал со мной разговаривать после развода",
+    "Хочу открыть своё дело, но боюсь потерять накопления. Какой первый шаг?",
+]
+
+
+def legacy_contains(words, text: str) -> bool:
+    text_lower = text.lower()
+    return any(word in text_lower for word in words)
+
+
+def synthetic_words(base, size: int, rng: random.Random):
+    words = list(base)
+    while len(words) < size:
+        words.append("".join(rng.choice(ALPHABET) for _ in range(rng.randint(6, 12))))
+    return words[:max(size, len(base))]
+
+
+def run(sizes, repeat: int):
+    with open(ROOT / "stop_words.json", "r", encoding="utf-8") as f:
+        base = json.load(f)["words"]
+    rng = random.Random(42)
+
+    print(f"{'терминов':>9} {'старый, мкс':>12} {'автомат, мкс':>13} {'ускорение':>10} {'сборка, мс':>11}")
+    for size in sizes:
+        words = synthetic_words(base, size, rng)
+        build = timeit.timeit(lambda: StopWordMatcher(words), number=1) * 1000
+        matcher = StopWordMatcher(words)
+
+        for text in SAMPLE_TEXTS:
+            assert legacy_contains(words, text) == (matcher.scan(text) is not None)
+
+        legacy = timeit.timeit(lambda: [legacy_contains(words, t) for t in SAMPLE_TEXTS], number=repeat)
+        compiled = timeit.timeit(lambda: [matcher.scan(t) for t in SAMPLE_TEXTS], number=repeat)
+        per_call = len(SAMPLE_TEXTS) * repeat
+        print(f"{len(words):>9} {legacy / per_call * 1e6:>12.1f} {compiled / per_call * 1e6:>13.1f} "
+              f"{legacy / compiled:>9.1f}x {build:>11.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="71,1000,5000,20000")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    run([int(x) for x in args.sizes.split(",")], args.repeat)
@@ -0,0 +1,213 @@
+"""Локальные заглушки Telegram Bot API и OpenAI-совместимого прокси.
+
+Используются нагрузочными тестами: бот работает как обычно, но все
+исходящие запросы уходят на localhost с настраиваемой задержкой.
+"""
+import asyncio
+import itertools
+import json
+import multiprocessing
+import random
+import time
+
+from aiohttp import web
+
+
+class StubBotAPI:
+    """Минимальный Bot API: отвечает на методы, которые вызывает бот, и запоминает ответы по чатам"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {}
+        self.sent = {}
+        self.uploaded_bytes = 0
+        self._message_ids = itertools.count(1000)
+        self._file_ids = itertools.count(1)
+        # Выданные file_id: чужой или забытый file_id отклоняется, как настоящим Bot API
+        self.issued_files = set()
+        self.app = web.Application(client_max_size=20 * 1024 * 1024)
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+        self.app.router.add_get("/stats", self.stats)
+        self.app.router.add_post("/forget_files", self.forget_files)
+        self._runner = None
+
+    async def stats(self, request):
+        return web.json_response({"calls": self.calls, "uploaded_bytes": self.uploaded_bytes})
+
+    async def forget_files(self, request):
+        """Сделать все выданные file_id недействительными"""
+        self.issued_files.clear()
+        return web.json_response({"ok": True})
+
+    async def _params(self, request) -> dict:
+        if request.content_type == "application/json":
+            return await request.json()
+        form = await request.post()
+        params = {}
+        for key, value in form.items():
+            if hasattr(value, "file"):
+                data = value.file.read()
+                self.uploaded_bytes += len(data)
+                params[key] = {"upload": len(data)}
+            else:
+                params[key] = value
+        return params
+
+    def _message(self, chat_id, **fields) -> dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+        }
+        message.update(fields)
+        return message
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        params = await self._params(request)
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        chat_id = params.get("chat_id")
+        if chat_id is not None:
+            self.sent.setdefault(int(chat_id), []).append((time.perf_counter(), method))
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Stub", "username": "stub_bot",
+                      "can_join_groups": False, "can_read_all_group_messages": False,
+                      "supports_inline_queries": False}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(chat_id or 0, text=params.get("text", ""))
+        elif method == "sendPhoto":
+            photo = params.get("photo")
+            if isinstance(photo, str) and not photo.startswith("attach://"):
+                if photo not in self.issued_files:
+                    return web.json_response(
+                        {"ok": False, "error_code": 400,
+                         "description": "Bad Request: wrong file identifier/HTTP URL specified"},
+                        status=400
+                    )
+                file_id = photo
+            else:
+                file_id = f"stub-file-{next(self._file_ids)}"
+                self.issued_files.add(file_id)
+            result = self._message(chat_id, photo=[{
+                "file_id": file_id, "file_unique_id": file_id, "width": 114, "height": 108
+            }])
+        elif method == "editMessageReplyMarkup":
+            result = self._message(chat_id or 0, text="")
+        elif method == "getUpdates":
+            await asyncio.sleep(1)
+            result = []
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class StubLLM:
+    """OpenAI-совместимый /chat/completions с задержкой latency ± jitter секунд.
+
+    С вероятностью error_rate отвечает 503, как перегруженный прокси.
+    """
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.0, tokens_per_chunk: int = 5,
+                 error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_chunk = tokens_per_chunk
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.app = web.Application()
+        self.app.router.add_post("/v1/chat/completions", self.handle)
+        self.app.router.add_get("/v1/stats", self.stats)
+        self._runner = None
+
+    async def stats(self, request):
+        return web.json_response({"requests": self.requests, "errors": self.errors})
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    async def handle(self, request):
+        body = await request.json()
+        self.requests += 1
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(self._delay() / 10)
+            return web.json_response({"error": {"message": "upstream overloaded"}}, status=503)
+        max_tokens = body.get("max_tokens") or 100
+        words = ["Дао"] * max(1, max_tokens // 2)
+
+        if body.get("stream"):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            chunks = [words[i:i + self.tokens_per_chunk] for i in range(0, len(words), self.tokens_per_chunk)]
+            for chunk in chunks:
+                await asyncio.sleep(self._delay() / len(chunks))
+                event = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                         "choices": [{"index": 0, "delta": {"content": " ".join(chunk) + " "}, "finish_reason": None}]}
+                await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                event = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                         "choices": [], "usage": {"prompt_tokens": 50, "completion_tokens": len(words),
+                                                  "total_tokens": 50 + len(words)}}
+                await response.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            await response.write(b"data: [DONE]\n\n")
+            return response
+
+        await asyncio.sleep(self._delay())
+        return web.json_response({
+            "id": "stub", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": " ".join(words)}}],
+            "usage": {"prompt_tokens": 50, "completion_tokens": len(words), "total_tokens": 50 + len(words)},
+        })
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/v1"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+STUBS = {"bot": StubBotAPI, "llm": StubLLM}
+
+
+def _serve(kind: str, kwargs: dict, conn):
+    async def serve():
+        stub = STUBS[kind](**kwargs)
+        conn.send(await stub.start())
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def start_in_process(kind: str, **kwargs):
+    """Запустить заглушку в отдельном процессе, чтобы она не делила CPU с ботом.
+
+    Возвращает (базовый URL, процесс); счетчики доступны по GET <URL>/stats.
+    """
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(kind, kwargs, child), daemon=True)
+    process.start()
+    return parent.recv(), process
@@ -0,0 +1,197 @@
+"""Табличный бросок гексаграммы.
+
+Шесть линий по четыре вида дают 4^6 = 4096 исходов. Распределение по
+исходам считается один раз из весов линий, выборка идет по таблице
+псевдонимов (метод Уолкера–Воуза): одно случайное число и одно сравнение на
+бросок. Номер основной и преобразованной гексаграммы, изменяющиеся линии
+и названия линий для каждого исхода лежат в готовых таблицах.
+
+Исход кодируется так: линия i (снизу, с 1) — биты 2(i-1)..2i-1, значение —
+индекс вида линии в порядке ключей весов.
+"""
+import random
+
+LINES_PER_HEXAGRAM = 6
+OUTCOMES = 4 ** LINES_PER_HEXAGRAM
+
+# Веса видов линий, с которыми работает бот
+DEFAULT_WEIGHTS = {
+    "ЯнСтарый": 16,
+    "ИньСтарый": 6,
+    "Ян": 39,
+    "Инь": 39
+}
+
+# Критическое значение хи-квадрат для 3 степеней свободы (четыре вида линий) при p = 0.001
+CHI2_CRITICAL = 16.27
+
+# NumPy нужен только пакетным броскам: импортируется при первом обращении
+_numpy = None
+
+
+def load_numpy():
+    """Модуль numpy или None, если он не установлен"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+def _build_alias(probabilities):
+    """Таблица псевдонимов Воуза: (вероятность остаться, псевдоним) для каждой ячейки"""
+    n = len(probabilities)
+    scaled = [p * n for p in probabilities]
+    keep = [1.0] * n
+    alias = list(range(n))
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        keep[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        (small if scaled[l] < 1.0 else large).append(l)
+    # Остатки из-за погрешности округления считаются полными ячейками
+    return keep, alias
+
+
+class CastingEngine:
+    def __init__(self, weights: dict, rng: random.Random = None):
+        if len(weights) != 4:
+            raise ValueError("Нужно ровно четыре вида линий")
+        self.line_names = list(weights)
+        self.weights = [weights[name] for name in self.line_names]
+        self.rng = rng or random.Random()
+        yang = [1 if name in ("Ян", "ЯнСтарый") else 0 for name in self.line_names]
+        changing = ["Старый" in name for name in self.line_names]
+
+        total = float(sum(self.weights))
+        line_probability = [w / total for w in self.weights]
+
+        self.probabilities = []
+        self.primary = []
+        self.transformed = []
+        self.changing_lines = []
+        self.lines = []
+        for outcome in range(OUTCOMES):
+            kinds = [(outcome >> (2 * i)) & 3 for i in range(LINES_PER_HEXAGRAM)]
+            probability = 1.0
+            primary_bits = transformed_bits = 0
+            for i, kind in enumerate(kinds):
+                probability *= line_probability[kind]
+                primary_bits |= yang[kind] << i
+                transformed_bits |= (yang[kind] ^ changing[kind]) << i
+            self.probabilities.append(probability)
+            self.primary.append(primary_bits + 1)
+            self.transformed.append(transformed_bits + 1)
+            self.changing_lines.append(tuple(i for i, kind in enumerate(kinds, 1) if changing[kind]))
+            self.lines.append(tuple(self.line_names[kind] for kind in kinds))
+
+        self._keep, self._alias = _build_alias(self.probabilities)
+        self._np_tables = None
+
+    def tables(self) -> dict:
+        """Готовые таблицы для снимка содержимого (см. content_snapshot)"""
+        return {
+            "line_names": self.line_names, "weights": self.weights, "probabilities": self.probabilities,
+            "primary": self.primary, "transformed": self.transformed, "changing_lines": self.changing_lines,
+            "lines": self.lines, "keep": self._keep, "alias": self._alias,
+        }
+
+    @classmethod
+    def from_tables(cls, tables: dict, rng: random.Random = None) -> "CastingEngine":
+        """Движок из таблиц, посчитанных заранее, без перебора 4096 исходов"""
+        engine = cls.__new__(cls)
+        engine.line_names = list(tables["line_names"])
+        engine.weights = list(tables["weights"])
+        engine.rng = rng or random.Random()
+        engine.probabilities = tables["probabilities"]
+        engine.primary = tables["primary"]
+        engine.transformed = tables["transformed"]
+        engine.changing_lines = tables["changing_lines"]
+        engine.lines = tables["lines"]
+        engine._keep = tables["keep"]
+        engine._alias = tables["alias"]
+        engine._np_tables = None
+        return engine
+
+    def sample(self) -> int:
+        """Индекс исхода 0..4095"""
+        u = self.rng.random() * OUTCOMES
+        cell = int(u)
+        return cell if u - cell < self._keep[cell] else self._alias[cell]
+
+    def cast(self):
+        """(номер, изменяющиеся линии, названия линий) — как прежний generate_hexagram"""
+        outcome = self.sample()
+        return self.primary[outcome], list(self.changing_lines[outcome]), list(self.lines[outcome])
+
+    def cast_pair(self):
+        """(основная гексаграмма, преобразованная гексаграмма, изменяющиеся линии)"""
+        outcome = self.sample()
+        return self.primary[outcome], self.transformed[outcome], list(self.changing_lines[outcome])
+
+    def _tables(self):
+        np = load_numpy()
+        if self._np_tables is None:
+            self._np_tables = (
+                np.asarray(self._keep, dtype=np.float64),
+                np.asarray(self._alias, dtype=np.int64),
+                np.asarray(self.primary, dtype=np.int8),
+                np.asarray(self.transformed, dtype=np.int8),
+            )
+        return self._np_tables
+
+    def sample_batch(self, n: int, seed=None):
+        """n индексов исходов: массив NumPy, если он установлен, иначе список"""
+        np = load_numpy()
+        if np is None:
+            rng = random.Random(seed) if seed is not None else self.rng
+            outcomes = []
+            for _ in range(n):
+                u = rng.random() * OUTCOMES
+                cell = int(u)
+                outcomes.append(cell if u - cell < self._keep[cell] else self._alias[cell])
+            return outcomes
+
+        keep, alias, _, _ = self._tables()
+        generator = np.random.default_rng(seed)
+        u = generator.random(n) * OUTCOMES
+        cells = u.astype(np.int64)
+        return np.where(u - cells < keep[cells], cells, alias[cells])
+
+    def cast_batch(self, n: int, seed=None):
+        """(основные номера, преобразованные номера, исходы) для n бросков"""
+        outcomes = self.sample_batch(n, seed)
+        if load_numpy() is None:
+            return ([self.primary[o] for o in outcomes], [self.transformed[o] for o in outcomes], outcomes)
+        _, _, primary, transformed = self._tables()
+        return primary[outcomes], transformed[outcomes], outcomes
+
+    def line_counts(self, outcomes) -> list:
+        """Сколько раз выпал каждый вид линии (по всем шести позициям) в наборе исходов"""
+        counts = [0] * len(self.line_names)
+        np = load_numpy()
+        if np is not None and isinstance(outcomes, np.ndarray):
+            for i in range(LINES_PER_HEXAGRAM):
+                kinds = np.bincount((outcomes >> (2 * i)) & 3, minlength=len(counts))
+                for kind, value in enumerate(kinds[:len(counts)]):
+                    counts[kind] += int(value)
+            return counts
+        for outcome in outcomes:
+            for i in range(LINES_PER_HEXAGRAM):
+                counts[(outcome >> (2 * i)) & 3] += 1
+        return counts
+
+    def chi_square(self, counts) -> float:
+        """Хи-квадрат числа линий каждого вида (из line_counts) против весов; сравнивать с CHI2_CRITICAL"""
+        total = sum(counts)
+        weight_sum = sum(self.weights)
+        return sum(
+            (observed - total * weight / weight_sum) ** 2 / (total * weight / weight_sum)
+            for observed, weight in zip(counts, self.weights)
+        )
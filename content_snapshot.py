@@ -0,0 +1,74 @@
+"""Снимок содержимого бота для быстрого холодного старта.
+
+При запуске бот читает hexagrams.json, stop_words.json, interpretations.json
+и строит таблицы броска гексаграммы по всем 4096 исходам. Снимок хранит
+все это в одном pickle-файле, собранном заранее (на этапе сборки
+деплоя), и загружается за миллисекунды. Снимок действителен, пока размер
+и время изменения исходных файлов и веса линий совпадают с записанными;
+иначе бот просто читает исходные файлы, как раньше.
+
+    python content_snapshot.py [--out content.snapshot]
+"""
+import argparse
+import json
+import os
+import pickle
+from pathlib import Path
+
+from casting import DEFAULT_WEIGHTS, CastingEngine
+
+VERSION = 1
+ROOT = Path(__file__).parent
+SOURCES = ("hexagrams.json", "stop_words.json", "interpretations.json")
+
+
+def source_signature(root: Path = ROOT) -> dict:
+    signature = {}
+    for name in SOURCES:
+        try:
+            stat = os.stat(root / name)
+        except OSError:
+            signature[name] = None
+            continue
+        signature[name] = (stat.st_size, stat.st_mtime_ns)
+    return signature
+
+
+def load(path: str, weights: dict, root: Path = ROOT):
+    """Содержимое снимка или None, если его нет или он устарел"""
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if (snapshot.get("version") != VERSION or snapshot.get("weights") != weights
+            or snapshot.get("signature") != source_signature(root)):
+        return None
+    return snapshot
+
+
+def build(path: str, weights: dict, root: Path = ROOT):
+    content = {}
+    for name in SOURCES:
+        with open(root / name, "r", encoding="utf-8") as f:
+            content[name] = json.load(f)
+    snapshot = {
+        "version": VERSION,
+        "weights": dict(weights),
+        "signature": source_signature(root),
+        "files": content,
+        "casting": CastingEngine(weights).tables(),
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    return snapshot
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Собрать снимок содержимого бота")
+    parser.add_argument("--out", default=str(ROOT / "content.snapshot"))
+    args = parser.parse_args()
+    build(args.out, DEFAULT_WEIGHTS)
+    print(f"Записан {args.out}: {', '.join(SOURCES)}, таблицы броска")
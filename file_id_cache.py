@@ -0,0 +1,118 @@
+"""Сохраненные file_id отправленных картинок гексаграмм.
+
+После первой загрузки PNG Telegram возвращает file_id, по которому ту же
+картинку можно отправить снова без передачи байтов. Всего вариантов
+64 × 64, поэтому все file_id держатся в памяти и дублируются в SQLite: они
+переживают перезапуск и видны другим воркерам. Если Telegram перестал
+принимать file_id (сменился бот или файл удален), запись удаляется и
+картинка загружается заново.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+
+
+def image_key(number: int, mask: int) -> str:
+    return f"hexagram:{number}:{mask}"
+
+
+class FileIdCache:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+        # ключ -> (file_id, размер загруженного файла в байтах)
+        self._ids = {}
+        self.hits = 0
+        self.uploads = 0
+        self.invalidated = 0
+        self.bytes_saved = 0
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS file_ids (
+                    key TEXT PRIMARY KEY,
+                    file_id TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            self._db.commit()
+            for key, file_id, size in self._db.execute("SELECT key, file_id, size FROM file_ids"):
+                self._ids.setdefault(key, (file_id, size))
+        return self._db
+
+    def open(self):
+        """Открыть базу и загрузить сохраненные file_id (при старте, в потоке)"""
+        with self._lock:
+            self._connect()
+
+    def _load(self, key: str):
+        with self._lock:
+            return self._connect().execute("SELECT file_id, size FROM file_ids WHERE key = ?", (key,)).fetchone()
+
+    def _save(self, key: str, file_id: str, size: int):
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO file_ids (key, file_id, size, updated) VALUES (?, ?, ?, ?)",
+                (key, file_id, size, time.time())
+            )
+            db.commit()
+
+    def _delete(self, key: str, file_id: str):
+        with self._lock:
+            # Только если запись не успел обновить другой воркер
+            db = self._connect()
+            db.execute("DELETE FROM file_ids WHERE key = ? AND file_id = ?", (key, file_id))
+            db.commit()
+
+    async def get(self, key: str):
+        """file_id для повторной отправки или None"""
+        entry = self._ids.get(key)
+        if entry is None:
+            # Картинку мог уже загрузить другой воркер
+            entry = await asyncio.to_thread(self._load, key)
+            if entry is None:
+                return None
+            self._ids[key] = tuple(entry)
+        return entry[0]
+
+    def record_hit(self, key: str):
+        """Картинка отправлена по file_id: байты не загружались"""
+        self.hits += 1
+        entry = self._ids.get(key)
+        if entry is not None:
+            self.bytes_saved += entry[1]
+
+    async def put(self, key: str, file_id: str, size: int):
+        self.uploads += 1
+        self._ids[key] = (file_id, size)
+        await asyncio.to_thread(self._save, key, file_id, size)
+
+    async def invalidate(self, key: str):
+        entry = self._ids.pop(key, None)
+        if entry is not None:
+            self.invalidated += 1
+            await asyncio.to_thread(self._delete, key, entry[0])
+
+    def stats(self) -> dict:
+        sends = self.hits + self.uploads
+        return {
+            "size": len(self._ids),
+            "hits": self.hits,
+            "uploads": self.uploads,
+            "invalidated": self.invalidated,
+            "hit_rate": self.hits / sends if sends else 0.0,
+            "bytes_saved": self.bytes_saved,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,150 @@
+"""Кэш изображений гексаграмм.
+
+Базовые картинки gg/{номер}.png декодируются один раз, а варианты с
+красными точками изменяющихся линий хранятся готовыми PNG-байтами в
+ограниченном LRU. Всего вариантов 64 × 64, поэтому при желании их можно
+отрисовать заранее в пуле процессов.
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+HEXAGRAM_COUNT = 64
+
+
+def lines_mask(changing_lines) -> int:
+    """Битовая маска изменяющихся линий: линия 1 — младший бит"""
+    mask = 0
+    for line in changing_lines:
+        mask |= 1 << (line - 1)
+    return mask
+
+
+def _render_png(base, mask: int) -> bytes:
+    # PIL импортируется при первой отрисовке, а не при старте бота
+    from PIL import ImageDraw
+
+    img = base.copy()
+    draw = ImageDraw.Draw(img)
+    width, height = img.size
+    line_spacing = height / 6
+
+    for line_number in range(1, 7):
+        if not mask & (1 << (line_number - 1)):
+            continue
+        y = height - (line_number - 0.7) * line_spacing
+        x = width * 0.93
+        radius = 3
+        draw.ellipse(
+            (x - radius, y - radius, x + radius, y + radius),
+            fill="red"
+        )
+
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _load_base(images_dir: Path, number: int):
+    image_path = images_dir / f"{number}.png"
+    if not image_path.exists():
+        return None
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        return img.convert("RGB")
+
+
+# Состояние процесса-воркера при предварительной отрисовке
+_worker_dir = None
+
+
+def _init_worker(images_dir: str):
+    global _worker_dir
+    _worker_dir = Path(images_dir)
+
+
+def _render_all_masks(number: int):
+    base = _load_base(_worker_dir, number)
+    if base is None:
+        return number, []
+    return number, [(mask, _render_png(base, mask)) for mask in range(HEXAGRAM_COUNT)]
+
+
+class HexagramImageCache:
+    def __init__(self, images_dir, maxsize: int = 4096):
+        self.images_dir = Path(images_dir)
+        self.maxsize = maxsize
+        self._bases = {}
+        self._rendered = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load_bases(self):
+        """Декодировать все базовые изображения; отсутствующие номера пропускаются"""
+        for number in range(1, HEXAGRAM_COUNT + 1):
+            base = _load_base(self.images_dir, number)
+            if base is not None:
+                self._bases[number] = base
+        return len(self._bases)
+
+    def has_base(self, number: int) -> bool:
+        if number not in self._bases:
+            base = _load_base(self.images_dir, number)
+            if base is None:
+                return False
+            self._bases[number] = base
+        return True
+
+    def get_cached(self, number: int, changing_lines):
+        """PNG из кэша без отрисовки; None, если варианта еще нет"""
+        key = (number, lines_mask(changing_lines))
+        with self._lock:
+            png = self._rendered.get(key)
+            if png is not None:
+                self._rendered.move_to_end(key)
+                self.hits += 1
+            return png
+
+    def render(self, number: int, changing_lines):
+        """PNG для гексаграммы с точками; None, если нет базового изображения"""
+        png = self.get_cached(number, changing_lines)
+        if png is not None:
+            return png
+        if not self.has_base(number):
+            return None
+
+        png = _render_png(self._bases[number], lines_mask(changing_lines))
+        with self._lock:
+            self.misses += 1
+            self._store((number, lines_mask(changing_lines)), png)
+        return png
+
+    def _store(self, key, png: bytes):
+        self._rendered[key] = png
+        self._rendered.move_to_end(key)
+        while len(self._rendered) > self.maxsize:
+            self._rendered.popitem(last=False)
+
+    def prerender_all(self, workers: int = None) -> int:
+        """Отрисовать все 64 × 64 вариантов в пуле процессов"""
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                 initializer=_init_worker,
+                                 initargs=(str(self.images_dir),)) as pool:
+            for number, variants in pool.map(_render_all_masks, range(1, HEXAGRAM_COUNT + 1)):
+                with self._lock:
+                    for mask, png in variants:
+                        self._store((number, mask), png)
+        return len(self._rendered)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._rendered),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,164 @@
+"""Кэш толкований гексаграмм.
+
+Промпт толкования полностью задается номером гексаграммы, изменяющимися
+линиями, типом и контекстом толкования, поэтому ответы можно переиспользовать.
+На каждый ключ хранится несколько разных ответов, чтобы пользователи не
+получали один и тот же текст слово в слово. Горячие ключи живут в LRU в
+памяти, все остальные — в SQLite-файле, который переживает перезапуск.
+Если передано общее хранилище (shared_store), варианты, полученные одним
+воркером, сразу видны остальным.
+"""
+import asyncio
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def interpretation_key(hex_number: int, changing_lines, interpretation_type: str, context_type: str = "") -> str:
+    lines = ",".join(map(str, sorted(set(changing_lines))))
+    return f"{hex_number}|{lines}|{interpretation_type}|{context_type}"
+
+
+class InterpretationCache:
+    def __init__(self, path: str, memory_size: int = 4096, disk_size: int = 32768,
+                 ttl: float = 30 * 24 * 3600, variants: int = 3, shared=None):
+        self.path = path
+        self.shared = shared
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl = ttl
+        self.variants = variants
+        # ключ -> список (текст, время создания)
+        self._memory = OrderedDict()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._puts_since_prune = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS interpretations (
+                    key TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_interpretations_key ON interpretations(key)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_interpretations_used ON interpretations(last_used)")
+            self._db.commit()
+        return self._db
+
+    def _fresh(self, entries):
+        now = time.time()
+        return [entry for entry in entries if now - entry[1] < self.ttl]
+
+    def _remember(self, key: str, entries):
+        self._memory[key] = entries
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _load(self, key: str):
+        with self._db_lock:
+            db = self._connect()
+            now = time.time()
+            db.execute("DELETE FROM interpretations WHERE key = ? AND created < ?", (key, now - self.ttl))
+            rows = db.execute(
+                "SELECT text, created FROM interpretations WHERE key = ? ORDER BY created", (key,)
+            ).fetchall()
+            if rows:
+                db.execute("UPDATE interpretations SET last_used = ? WHERE key = ?", (now, key))
+            db.commit()
+        return [tuple(row) for row in rows]
+
+    def _save(self, key: str, text: str, created: float):
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT INTO interpretations (key, text, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, text, created, created)
+            )
+            # Оставляем только последние варианты ключа
+            db.execute("""
+                DELETE FROM interpretations WHERE key = ? AND rowid NOT IN (
+                    SELECT rowid FROM interpretations WHERE key = ? ORDER BY created DESC LIMIT ?
+                )
+            """, (key, key, self.variants))
+            self._puts_since_prune += 1
+            if self._puts_since_prune >= 100:
+                self._puts_since_prune = 0
+                self._prune(db)
+            db.commit()
+
+    def _prune(self, db):
+        db.execute("DELETE FROM interpretations WHERE created < ?", (time.time() - self.ttl,))
+        keys = db.execute("SELECT COUNT(DISTINCT key) FROM interpretations").fetchone()[0]
+        if keys > self.disk_size:
+            db.execute("""
+                DELETE FROM interpretations WHERE key IN (
+                    SELECT key FROM interpretations GROUP BY key ORDER BY MAX(last_used) LIMIT ?
+                )
+            """, (keys - self.disk_size,))
+
+    def _merge(self, entries, other):
+        known = {entry[0] for entry in entries}
+        merged = entries + [entry for entry in other if entry[0] not in known]
+        return sorted(merged, key=lambda entry: entry[1])[-self.variants:]
+
+    async def _entries(self, key: str):
+        entries = self._fresh(self._memory.get(key) or [])
+        if len(entries) >= self.variants:
+            self._remember(key, entries)
+            return entries
+        # Неполный список в памяти мог пополнить другой воркер: перечитываем общее хранилище и диск
+        if self.shared is not None:
+            raw = await self.shared.get(f"interpretation:{key}")
+            if raw is not None:
+                entries = self._merge(entries, self._fresh([tuple(entry) for entry in json.loads(raw)]))
+        if len(entries) < self.variants:
+            entries = self._merge(entries, await asyncio.to_thread(self._load, key))
+        self._remember(key, entries)
+        return entries
+
+    async def get(self, key: str):
+        """Случайный сохраненный ответ, если для ключа уже набрано достаточно вариантов"""
+        entries = await self._entries(key)
+        if len(entries) < self.variants:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return random.choice(entries)[0]
+
+    async def get_any(self, key: str):
+        """Любой сохраненный ответ, даже если вариантов меньше нужного"""
+        entries = await self._entries(key)
+        return random.choice(entries)[0] if entries else None
+
+    async def put(self, key: str, text: str):
+        created = time.time()
+        entries = await self._entries(key)
+        # Объединенные одновременные запросы приносят один и тот же текст
+        if any(entry[0] == text for entry in entries):
+            return
+        entries = (entries + [(text, created)])[-self.variants:]
+        self._remember(key, entries)
+        if self.shared is not None:
+            await self.shared.set(f"interpretation:{key}", json.dumps(entries, ensure_ascii=False), ttl=self.ttl)
+        await asyncio.to_thread(self._save, key, text, created)
+
+    def stats(self) -> dict:
+        return {"memory_keys": len(self._memory), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
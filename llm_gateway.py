@@ -0,0 +1,295 @@
+"""Асинхронный шлюз к LLM.
+
+Все обращения к модели идут через один экземпляр LLMGateway: общий
+AsyncOpenAI-клиент с пулом HTTP-соединений, глобальный и пользовательский
+лимиты параллельных запросов и таймауты. Пока запрос ждёт ответа прокси,
+цикл событий бота свободен и обслуживает остальных пользователей.
+
+Каждый вызов ограничен общим сроком (deadline), временные ошибки
+повторяются с разбросом задержки, медленный запрос можно продублировать
+после порога по перцентилю, а размыкатель цепи (breaker) при падении
+прокси сразу отвечает CircuitOpenError. Токены, задержка и стоимость
+каждого вызова записываются в ledger (UsageLedger), если он передан;
+отмененный дубль тоже попадает в счет прокси и записывается оценкой по
+ответу победившего запроса.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+import metrics
+from resilience import CircuitBreaker, CircuitOpenError, LatencyWindow, backoff_delay, hedged, is_retryable
+from single_flight import SingleFlight, request_key
+from usage_ledger import estimate_tokens, usage_tokens
+
+
+class LLMGateway:
+    def __init__(self, api_key: str, base_url: str, model: str,
+                 max_concurrency: int = 100, per_user_concurrency: int = 1,
+                 timeout: float = 30.0, connect_timeout: float = 5.0, deadline: float = 45.0,
+                 retries: int = 2, retry_base_delay: float = 0.5, retry_max_delay: float = 4.0,
+                 hedge_percentile: float = 0, breaker: CircuitBreaker = None, ledger=None,
+                 stream_usage: bool = True):
+        if max_concurrency < 1 or per_user_concurrency < 1:
+            raise ValueError("Лимиты параллельности LLM должны быть не меньше 1")
+
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.per_user_concurrency = per_user_concurrency
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.deadline = deadline
+        self.retries = retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        # 0 — без дублирующих запросов, иначе перцентиль задержки, после которого шлем дубль
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker()
+        self.ledger = ledger
+        # Просить у API итоговый usage в конце потока (stream_options.include_usage)
+        self.stream_usage = stream_usage
+        self.latencies = LatencyWindow()
+        self.retried = 0
+        self.hedges = 0
+        self.hedges_cancelled = 0
+
+        self._client = None
+        self.in_flight = 0
+        self._global_slots = asyncio.Semaphore(max_concurrency)
+        # user_id -> [семафор, число ожидающих/выполняющихся запросов]
+        self._user_slots = {}
+        self.single_flight = SingleFlight()
+
+    def _get_client(self):
+        # Клиент и пул соединений создаются при первом запросе, уже внутри цикла событий;
+        # тогда же импортируется openai — это заметная часть времени холодного старта
+        if self._client is None:
+            from openai import AsyncOpenAI
+
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                timeout=self.timeout
+            )
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_client,
+                timeout=self.timeout,
+                # Повторы делает _call: с общим сроком и учетом размыкателя
+                max_retries=0
+            )
+        return self._client
+
+    @asynccontextmanager
+    async def _user_slot(self, user_id):
+        if user_id is None:
+            yield
+            return
+
+        slot = self._user_slots.get(user_id)
+        if slot is None:
+            slot = self._user_slots[user_id] = [asyncio.Semaphore(self.per_user_concurrency), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            # Не держим в памяти семафоры пользователей без активных запросов
+            if slot[1] == 0:
+                self._user_slots.pop(user_id, None)
+
+    def available(self) -> bool:
+        """False, пока размыкатель разомкнут: запросы сейчас не отправляются"""
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    async def _call(self, attempt, upstream: str):
+        """attempt() с общим сроком, повторами временных ошибок и учетом в размыкателе"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        number = 0
+        while True:
+            remaining = deadline - loop.time()
+            try:
+                with metrics.track(upstream):
+                    result = await asyncio.wait_for(attempt(), max(remaining, 0.001))
+            except Exception as e:
+                if not is_retryable(e):
+                    # Прокси ответил (например, 400): он доступен, повтор не поможет
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                delay = backoff_delay(number, self.retry_base_delay, self.retry_max_delay)
+                if number >= self.retries or delay >= deadline - loop.time() or not self.breaker.allow():
+                    raise
+                number += 1
+                self.retried += 1
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _create(self, user_id=None, **kwargs):
+        started = time.perf_counter()
+        create = lambda: self._get_client().chat.completions.create(**kwargs)
+        threshold = self.latencies.percentile(self.hedge_percentile) if self.hedge_percentile else None
+        cancelled = 0
+        if threshold is None:
+            response = await create()
+        else:
+            def count_cancelled():
+                nonlocal cancelled
+                cancelled += 1
+            response = await hedged(create, threshold, on_hedge=self._count_hedge, on_cancel=count_cancelled)
+        latency = time.perf_counter() - started
+        self.latencies.observe(latency)
+        if cancelled:
+            await self._account_cancelled(user_id, kwargs["model"], kwargs["messages"], response, latency, cancelled)
+        return response
+
+    def _count_hedge(self):
+        self.hedges += 1
+
+    async def _account_cancelled(self, user_id, model: str, messages: list, response, latency: float, count: int):
+        # Отмена не останавливает генерацию у прокси: дубль оплачен, его usage не придет.
+        # Запрос тот же, ответ примерно той же длины — берем токены победителя
+        prompt_tokens, completion_tokens = usage_tokens(response.usage)
+        if response.usage is None:
+            prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+            completion_tokens = estimate_tokens(response.choices[0].message.content or "")
+        self.hedges_cancelled += count
+        for _ in range(count):
+            await self._account(user_id, model, prompt_tokens, completion_tokens, latency, estimated=True)
+
+    async def _account(self, user_id, model: str, prompt_tokens: int, completion_tokens: int,
+                       latency: float, estimated: bool = False):
+        if self.ledger is not None:
+            await self.ledger.record(user_id, metrics.current_handler.get(), model,
+                                     prompt_tokens, completion_tokens, latency, estimated)
+
+    async def complete(self, messages: list, *, temperature: float, max_tokens: int,
+                       user_id: int = None, model: str = None, coalesce: bool = False):
+        """Запрос chat.completions с учетом лимитов; возвращает ответ API целиком.
+
+        С coalesce=True одинаковые одновременные запросы разделяют один ответ.
+        В ledger он записывается на пользователя, чей запрос ушел к прокси;
+        присоединившиеся получают ответ бесплатно: их дневной бюджет не
+        расходуется, а итоги по модели сходятся со счетом прокси.
+        """
+        model = model or self.model
+        if coalesce:
+            key = request_key(model, messages, temperature, max_tokens)
+            return await self.single_flight.do(
+                key, lambda: self._complete(messages, temperature, max_tokens, user_id, model)
+            )
+        return await self._complete(messages, temperature, max_tokens, user_id, model)
+
+    async def _complete(self, messages, temperature, max_tokens, user_id, model):
+        probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM-прокси недоступен")
+        try:
+            return await self._complete_allowed(messages, temperature, max_tokens, user_id, model)
+        finally:
+            # Пробный запрос полуоткрытого размыкателя не должен потеряться при отмене
+            if probe:
+                self.breaker.release()
+
+    async def _complete_allowed(self, messages, temperature, max_tokens, user_id, model):
+        # Сначала очередь пользователя, затем общий слот, чтобы один пользователь
+        # не занимал глобальные слоты своими ожидающими запросами
+        async with self._user_slot(user_id):
+            async with self._global_slots:
+                self.in_flight += 1
+                started = time.perf_counter()
+                try:
+                    response = await self._call(
+                        lambda: self._create(
+                            user_id=user_id,
+                            model=model,
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens
+                        ),
+                        "llm"
+                    )
+                    metrics.record_llm_usage(response.usage, model)
+                    await self._account(user_id, model, *usage_tokens(response.usage),
+                                        time.perf_counter() - started)
+                    return response
+                finally:
+                    self.in_flight -= 1
+
+    async def stream(self, messages: list, *, temperature: float, max_tokens: int,
+                     user_id: int = None, model: str = None):
+        """Потоковый запрос: асинхронный генератор фрагментов текста ответа.
+
+        Повторяется только установка соединения; оборванный на середине ответ
+        не повторяется, чтобы пользователь не увидел текст дважды.
+        """
+        probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM-прокси недоступен")
+        try:
+            model = model or self.model
+            extra_body = {"stream_options": {"include_usage": True}} if self.stream_usage else None
+            async with self._user_slot(user_id):
+                async with self._global_slots:
+                    self.in_flight += 1
+                    started = time.perf_counter()
+                    text = ""
+                    usage = None
+                    try:
+                        response = await self._call(
+                            lambda: self._get_client().chat.completions.create(
+                                model=model,
+                                messages=messages,
+                                temperature=temperature,
+                                max_tokens=max_tokens,
+                                stream=True,
+                                extra_body=extra_body
+                            ),
+                            "llm_stream_connect"
+                        )
+                        with metrics.track("llm_stream"):
+                            try:
+                                async with response:
+                                    async for chunk in response:
+                                        # Последний фрагмент с include_usage: без choices, только usage
+                                        usage = getattr(chunk, "usage", None) or usage
+                                        if chunk.choices and chunk.choices[0].delta.content:
+                                            text += chunk.choices[0].delta.content
+                                            yield chunk.choices[0].delta.content
+                            except Exception as e:
+                                if is_retryable(e):
+                                    self.breaker.record_failure()
+                                raise
+                    finally:
+                        self.in_flight -= 1
+                        if usage is not None:
+                            await self._account(user_id, model, *usage_tokens(usage), time.perf_counter() - started)
+                        elif text:
+                            # Прокси не прислал usage (или поток оборвался): считаем по длине текста
+                            prompt = sum(estimate_tokens(message["content"]) for message in messages)
+                            await self._account(user_id, model, prompt, estimate_tokens(text),
+                                                time.perf_counter() - started, estimated=True)
+        finally:
+            if probe:
+                self.breaker.release()
+
+    def stats(self) -> dict:
+        stats = {"in_flight": self.in_flight, "retries": self.retried, "hedges": self.hedges,
+                 "hedges_cancelled": self.hedges_cancelled}
+        stats.update({f"circuit_{key}": value for key, value in self.breaker.stats().items()})
+        return stats
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
@@ -0,0 +1,182 @@
+"""Фоновая запись логов.
+
+Обработчики только кладут строки в очередь в памяти, а отдельный поток
+пишет их на диск пачками (по размеру пачки или по таймеру), ротирует файлы
+по размеру или по дате и дописывает очередь при остановке.
+"""
+import os
+import gzip
+import queue
+import shutil
+import atexit
+import threading
+import time
+from datetime import datetime, date
+
+
+class _FilePolicy:
+    def __init__(self, max_bytes: int = 0, rotate_daily: bool = False, compress: bool = False):
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+        self.handle = None
+        self.opened_on = None
+
+
+class LogSink:
+    def __init__(self, batch_size: int = 100, flush_interval: float = 1.0, max_queue: int = 10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._policies = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopped = False
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.write_errors = 0
+
+    def configure(self, path: str, max_bytes: int = 0, rotate_daily: bool = False, compress: bool = False):
+        """Правила ротации для файла; файлы без настроек не ротируются"""
+        self._policies[path] = _FilePolicy(max_bytes, rotate_daily, compress)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+            "write_errors": self.write_errors,
+        }
+
+    def write(self, path: str, line: str):
+        """Неблокирующая постановка строки в очередь; при переполнении запись отбрасывается"""
+        if self._stopped:
+            # После остановки пишем напрямую, чтобы не потерять поздние записи
+            try:
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(line + "\n")
+            except Exception as e:
+                print(f"Критическая ошибка логирования в {path}: {str(e)}")
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((path, line))
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while True:
+            batch = {}
+            count = 0
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while count < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                path, line = item
+                batch.setdefault(path, []).append(line)
+                count += 1
+
+            if batch:
+                self._write_batch(batch)
+            if stop:
+                # Дописываем все, что успели положить до сигнала остановки
+                rest = {}
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        rest.setdefault(item[0], []).append(item[1])
+                if rest:
+                    self._write_batch(rest)
+                self._close_handles()
+                return
+
+    def _write_batch(self, batch: dict):
+        for path, lines in batch.items():
+            data = "".join(line + "\n" for line in lines)
+            try:
+                policy = self._policies.setdefault(path, _FilePolicy())
+                self._maybe_rotate(path, policy, len(data.encode("utf-8")))
+                if policy.handle is None:
+                    policy.handle = open(path, 'a', encoding='utf-8')
+                    policy.opened_on = date.today()
+                policy.handle.write(data)
+                policy.handle.flush()
+                self.written += len(lines)
+            except Exception as e:
+                self.write_errors += 1
+                print(f"Критическая ошибка логирования в {path}: {str(e)}")
+        self.batches += 1
+
+    def _maybe_rotate(self, path: str, policy: _FilePolicy, incoming: int):
+        if not policy.max_bytes and not policy.rotate_daily:
+            return
+        if not os.path.exists(path):
+            return
+
+        size = os.path.getsize(path)
+        if size == 0:
+            return
+        file_day = policy.opened_on or date.fromtimestamp(os.path.getmtime(path))
+        by_size = policy.max_bytes and size + incoming > policy.max_bytes
+        by_date = policy.rotate_daily and file_day != date.today()
+        if not (by_size or by_date):
+            return
+
+        if policy.handle is not None:
+            policy.handle.close()
+            policy.handle = None
+
+        rotated = f"{path}.{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        suffix = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            rotated = f"{path}.{datetime.now().strftime('%Y%m%d-%H%M%S')}-{suffix}"
+            suffix += 1
+        os.replace(path, rotated)
+
+        if policy.compress:
+            with open(rotated, 'rb') as src, gzip.open(rotated + ".gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+
+    def _close_handles(self):
+        for policy in self._policies.values():
+            if policy.handle is not None:
+                policy.handle.close()
+                policy.handle = None
+
+    def stop(self, timeout: float = 10.0):
+        """Дописать очередь на диск и остановить поток записи"""
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
@@ -3,31 +3,15 @@ import json
 import random
 import logging
 import asyncio
+import time
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv
-from PIL import Image, ImageDraw
-import threading
-from flask import Flask
-
-app = Flask(__name__)
-
-@app.route('/')
-def home():
-    return "🔮 Бот активен! Версия 2.0", 200
-
-@app.route('/health')
-def health_check():
-    return "OK", 200
-
-def run():
-    app.run(host='0.0.0.0', port=8080)
-
-# Запускаем Flask-сервер в отдельном потоке
-threading.Thread(target=run, daemon=True).start()
+import signal
+import struct
 
 # Импорт для Telegram
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram import Bot, Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -35,57 +19,215 @@ from telegram.ext import (
     filters,
     ContextTypes,
     ConversationHandler,
-    CallbackQueryHandler
+    CallbackQueryHandler,
+    Updater
 )
-from openai import OpenAI
+from telegram.error import BadRequest, Forbidden
+from llm_gateway import LLMGateway
+from resilience import CircuitBreaker, CircuitOpenError
+from log_sink import LogSink
+from image_cache import HexagramImageCache, lines_mask
+from file_id_cache import FileIdCache, image_key
+from stop_words import StopWordMatcher
+from interpretation_cache import InterpretationCache, interpretation_key
+from readings_corpus import ReadingsCorpus, short_reading_messages
+from semantic_cache import SemanticCache
+from usage_ledger import HANDLER, MODEL, PRICES, USER, UsageLedger
+from ratings_store import RatingsStore
+from casting import DEFAULT_WEIGHTS, CastingEngine
+import content_snapshot
+from persistence import SQLitePersistence
+from shared_store import MemoryStore, open_store
+from admission import AdmissionController
+from update_dispatcher import UpdateDispatcher, consume
+from scheduler import PriorityUpdateProcessor, fast_lane, handler_lane
+from menu_router import MenuHandler, RoutedConversation
+from outbound import BULK, OutboundRateLimiter
+from analytics import iter_user_ids
+import streaming
+from streaming import stream_reply
+import metrics
+from metrics import instrument
 
 # Конфигурация
 HEXAGRAMS_FILE = "hexagrams.json"
 STOP_WORDS_FILE = "stop_words.json"
 INTERPRETATIONS_FILE = "interpretations.json"
 RATINGS_FILE = "ratings.json"
-USER_SESSIONS_FILE = "user_sessions.txt"
+USER_SESSIONS_LOG = "user_sessions.txt"
+# Куда пишет этот процесс: воркеры переключают на свой user_sessions.txt.wN
+USER_SESSIONS_FILE = USER_SESSIONS_LOG
 ERROR_LOG_FILE = "error.txt"
 GPT_MODEL = "gpt-4.1-mini"
 ADMIN_ID = 774452314
 
 # Веса для генерации линий
-WEIGHTS = {
-    "ЯнСтарый": 16,
-    "ИньСтарый": 6,
-    "Ян": 39,
-    "Инь": 39
-}
+WEIGHTS = DEFAULT_WEIGHTS
+
+# Снимок содержимого (собирается командой python content_snapshot.py при сборке деплоя):
+# JSON-файлы и таблицы броска без разбора при каждом холодном старте
+CONTENT_SNAPSHOT_FILE = os.getenv("CONTENT_SNAPSHOT_FILE", str(Path(__file__).parent / "content.snapshot"))
+content = content_snapshot.load(CONTENT_SNAPSHOT_FILE, WEIGHTS)
+
+# Распределение по всем 4096 исходам броска считается один раз
+casting_engine = CastingEngine.from_tables(content["casting"]) if content else CastingEngine(WEIGHTS)
+
+# Ответ, пока LLM-прокси недоступен (размыкатель цепи разомкнут)
+UPSTREAM_DOWN_TEXT = "🔮 Оракул сейчас недоступен. Пожалуйста, попробуйте через несколько минут."
+INTERPRETATION_ERROR_TEXT = "Произошла ошибка при генерации толкования. Пожалуйста, попробуйте позже."
 
 # Загрузка .env
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 OPENAI_API_KEY = os.getenv('PROXY_API_KEY')
 
+# Режим получения обновлений: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+PORT = int(os.getenv("PORT", "8080"))
+
+# Число процессов-обработчиков; при BOT_WORKERS > 1 этот процесс только раздает обновления
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+
+# Другой адрес Bot API (локальный сервер или заглушка для нагрузочных тестов)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
 if not TELEGRAM_TOKEN or not OPENAI_API_KEY:
     raise ValueError("Необходимо указать TELEGRAM_TOKEN и OPENAI_API_KEY в .env")
 
+# Учет токенов и стоимости вызовов LLM; цены за 1 млн токенов можно переопределить под тариф прокси
+LLM_PRICE_PROMPT, LLM_PRICE_COMPLETION = PRICES.get(GPT_MODEL, (0.0, 0.0))
+usage_ledger = UsageLedger(
+    os.getenv("USAGE_LEDGER_FILE", "llm_usage.db"),
+    prices={GPT_MODEL: (
+        float(os.getenv("LLM_PRICE_PROMPT", str(LLM_PRICE_PROMPT))),
+        float(os.getenv("LLM_PRICE_COMPLETION", str(LLM_PRICE_COMPLETION)))
+    )},
+    retention_days=int(os.getenv("USAGE_RETENTION_DAYS", "30"))
+)
+COST_CURRENCY = os.getenv("LLM_COST_CURRENCY", "$")
+
+# Дневной бюджет пользователя на LLM в валюте цен (0 — без ограничения).
+# Сверх бюджета новые ответы короче (max_tokens умножается на BUDGET_TOKEN_FACTOR)
+USER_DAILY_BUDGET = float(os.getenv("LLM_USER_DAILY_BUDGET", "0"))
+BUDGET_TOKEN_FACTOR = float(os.getenv("LLM_BUDGET_TOKEN_FACTOR", "0.5"))
+
 try:
-    client = OpenAI(
-        api_key=os.getenv("PROXY_API_KEY"),
-        base_url="https://api.proxyapi.ru/openai/v1"
+    llm = LLMGateway(
+        api_key=OPENAI_API_KEY,
+        base_url=os.getenv("OPENAI_BASE_URL", "https://api.proxyapi.ru/openai/v1"),
+        model=GPT_MODEL,
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "100")),
+        per_user_concurrency=int(os.getenv("LLM_PER_USER_CONCURRENCY", "1")),
+        timeout=float(os.getenv("LLM_TIMEOUT", "30")),
+        deadline=float(os.getenv("LLM_DEADLINE", "45")),
+        retries=int(os.getenv("LLM_RETRIES", "2")),
+        hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("LLM_BREAKER_RESET", "30"))
+        ),
+        ledger=usage_ledger,
+        stream_usage=os.getenv("LLM_STREAM_USAGE", "1") == "1"
     )
 except Exception as e:
     with open(ERROR_LOG_FILE, 'a', encoding='utf-8') as f:
         f.write(f"{datetime.now().isoformat()} - Ошибка инициализации OpenAI: {str(e)}\n")
     raise
 
+# Фоновая запись логов: обработчики не ждут диска
+log_sink = LogSink(
+    batch_size=int(os.getenv("LOG_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", "1.0")),
+    max_queue=int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+)
+
+def configure_logs():
+    for log_file in (USER_SESSIONS_FILE, ERROR_LOG_FILE):
+        log_sink.configure(
+            log_file,
+            max_bytes=int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+            rotate_daily=os.getenv("LOG_ROTATE_DAILY", "0") == "1",
+            compress=os.getenv("LOG_ROTATE_GZIP", "1") == "1"
+        )
+
+configure_logs()
+
+# Готовые изображения гексаграмм хранятся в памяти
+image_cache = HexagramImageCache(
+    Path(__file__).parent / "gg",
+    maxsize=int(os.getenv("IMAGE_CACHE_SIZE", "4096"))
+)
+
+# file_id уже загруженных в Telegram картинок: повторно отправляются без байтов
+photo_file_ids = FileIdCache(os.getenv("FILE_ID_CACHE_FILE", "file_ids.db"))
+
+# Оценки советов и счетчики для /stats
+ratings_store = RatingsStore(os.getenv("RATINGS_DB_FILE", "ratings.db"))
+
+# Потоковая выдача ответов: заглушка сразу, затем правки текста по мере генерации
+LLM_STREAMING = os.getenv("LLM_STREAMING", "0") == "1"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+
+# Общее для всех воркеров хранилище (в памяти процесса или Redis-совместимый сервер)
+# При BOT_WORKERS > 1 обязателен; memory:// оставляет каждому воркеру свое хранилище
+SHARED_STORE_URL = os.getenv("SHARED_STORE_URL", "")
+shared_store = open_store(SHARED_STORE_URL)
+
+# Ограничение частоты запросов к LLM: на пользователя и на весь бот (0 — без ограничения)
+admission = AdmissionController(
+    user_rate=float(os.getenv("ADMISSION_USER_PER_MINUTE", "6")) / 60,
+    user_burst=float(os.getenv("ADMISSION_USER_BURST", "3")),
+    global_rate=float(os.getenv("ADMISSION_GLOBAL_PER_SECOND", "0")),
+    global_burst=float(os.getenv("ADMISSION_GLOBAL_BURST", "20")),
+    max_wait=float(os.getenv("ADMISSION_MAX_WAIT", "10")),
+    # Хранилище в памяти процесса общим не является: тогда хватает локальной корзины
+    store=None if isinstance(shared_store, MemoryStore) else shared_store
+)
+# Предупреждать пользователя, если запрос ждет своей очереди дольше стольких секунд
+ADMISSION_NOTICE_DELAY = float(os.getenv("ADMISSION_NOTICE_DELAY", "2"))
+THROTTLED_TEXT = "⏳ Слишком много вопросов подряд. Пожалуйста, передохните минуту и спросите снова."
+
+# Толкования гексаграмм переиспользуются между пользователями и перезапусками
+interpretation_cache = InterpretationCache(
+    os.getenv("INTERPRETATION_CACHE_FILE", "interpretation_cache.db"),
+    memory_size=int(os.getenv("INTERPRETATION_CACHE_MEMORY_SIZE", "4096")),
+    disk_size=int(os.getenv("INTERPRETATION_CACHE_DISK_SIZE", "32768")),
+    ttl=float(os.getenv("INTERPRETATION_CACHE_TTL", str(30 * 24 * 3600))),
+    variants=int(os.getenv("INTERPRETATION_CACHE_VARIANTS", "3")),
+    shared=shared_store
+)
+
+# Готовые краткие толкования (собираются командой python readings_corpus.py build)
+readings_corpus = ReadingsCorpus(os.getenv("READINGS_CORPUS_FILE", str(Path(__file__).parent / "readings.bin")))
+
+# Ответы на почти одинаковые тексты пользователей (уточнение вопроса и свободные сообщения)
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2048"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+clear_question_cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD)
+fallback_reply_cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD)
+
+# Рассылка администратора: сколько сообщений в полете и как часто обновлять отчет о ходе
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+BROADCAST_REPORT_INTERVAL = float(os.getenv("BROADCAST_REPORT_INTERVAL", "5"))
+broadcast_task = None
+
 # Состояния диалога
 FORMULATE_PROBLEM, CONFIRM_QUESTION, HEXAGRAM_INTERPRETATION = range(3)
 
 def load_json_data(filename):
     try:
-        file_path = Path(__file__).parent / filename
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            if filename == HEXAGRAMS_FILE:
-                return {int(k): v for k, v in data.items()}
-            return data
+        if content and filename in content["files"]:
+            data = content["files"][filename]
+        else:
+            file_path = Path(__file__).parent / filename
+            with open(file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        if filename == HEXAGRAMS_FILE:
+            return {int(k): v for k, v in data.items()}
+        return data
     except Exception as e:
         with open(ERROR_LOG_FILE, 'a', encoding='utf-8') as f:
             f.write(f"{datetime.now().isoformat()} - Ошибка загрузки {filename}: {str(e)}\n")
@@ -94,48 +236,42 @@ def load_json_data(filename):
 HEXAGRAMS = load_json_data(HEXAGRAMS_FILE)
 STOP_WORDS_DATA = load_json_data(STOP_WORDS_FILE)
 INTERPRETATIONS = load_json_data(INTERPRETATIONS_FILE)
+stop_word_matcher = StopWordMatcher(STOP_WORDS_DATA.get("words", []))
 
 async def log_user_action(user_id: int, username: str, full_name: str, action: str, details: str = ""):
     """Логирование действий пользователя"""
     try:
-        with open(USER_SESSIONS_FILE, 'a', encoding='utf-8') as f:
-            log_entry = {
-                'timestamp': datetime.now().isoformat(),
-                'user_id': user_id,
-                'username': username,
-                'full_name': full_name,
-                'action': action,
-                'details': details
-            }
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+        log_entry = {
+            'timestamp': datetime.now().isoformat(),
+            'user_id': user_id,
+            'username': username,
+            'full_name': full_name,
+            'action': action,
+            'details': details
+        }
+        log_sink.write(USER_SESSIONS_FILE, json.dumps(log_entry, ensure_ascii=False))
     except Exception as e:
-        with open(ERROR_LOG_FILE, 'a', encoding='utf-8') as f:
-            f.write(f"{datetime.now().isoformat()} - Ошибка записи в {USER_SESSIONS_FILE}: {str(e)}\n")
+        log_sink.write(ERROR_LOG_FILE, f"{datetime.now().isoformat()} - Ошибка записи в {USER_SESSIONS_FILE}: {str(e)}")
 
 async def log_error(error_message: str):
     """Логирование ошибок"""
     try:
-        with open(ERROR_LOG_FILE, 'a', encoding='utf-8') as f:
-            f.write(f"{datetime.now().isoformat()} - {error_message}\n")
+        log_sink.write(ERROR_LOG_FILE, f"{datetime.now().isoformat()} - {error_message}")
     except Exception as e:
         print(f"Критическая ошибка логирования: {str(e)}")
 
+def find_stop_word(text: str):
+    """Найденное стоп-слово или None; повторная проверка того же текста берется из памяти"""
+    return stop_word_matcher.find(text)
+
 def contains_stop_words(text: str) -> bool:
-    text_lower = text.lower()
-    return any(word in text_lower for word in STOP_WORDS_DATA.get("words", []))
+    return find_stop_word(text) is not None
 
 def get_stop_word_response() -> str:
     return random.choice(STOP_WORDS_DATA.get("responses", ["Извините, я не могу ответить на этот вопрос"]))
 
 def generate_hexagram():
-    lines = [
-        random.choices(list(WEIGHTS.keys()), weights=list(WEIGHTS.values()), k=1)[0]
-        for _ in range(6)
-    ]
-    binary = ''.join(['1' if x in ['Ян', 'ЯнСтарый'] else '0' for x in reversed(lines)])
-    number = int(binary, 2) + 1
-    changing_lines = [i for i, line in enumerate(lines, 1) if "Старый" in line]
-    return number, changing_lines, lines
+    return casting_engine.cast()
 
 def main_menu():
     return ReplyKeyboardMarkup(
@@ -151,9 +287,19 @@ def cancel_menu():
 def confirmation_menu():
     return ReplyKeyboardMarkup([["1. Да", "2. Уточнить"], ["3. Свой вариант"]], resize_keyboard=True)
 
+# Подписи кнопок выбора толкования и контекста
+INTERPRETATION_CHOICES = ("Краткое толкование", "Развернутое толкование")
+CONTEXT_CHOICES = ("💑 Отношения", "👨‍👩‍👧‍👦 Дети", "💰 Финансы", "🧘 Здоровье", "🎓 Образование", "🏛 Бизнес", "🔮 Общее толкование")
+
 def interpretation_menu():
     return ReplyKeyboardMarkup([["Краткое толкование", "Развернутое толкование"], ["Отмена"]], resize_keyboard=True)
 
+def rating_keyboard():
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("👍 Хорошо", callback_data="rate_good"),
+         InlineKeyboardButton("👎 Неактуально", callback_data="rate_bad")]
+    ])
+
 def context_menu():
     return ReplyKeyboardMarkup([
         ["💑 Отношения", "👨‍👩‍👧‍👦 Дети"],
@@ -162,35 +308,22 @@ def context_menu():
         ["🔮 Общее толкование"]
     ], resize_keyboard=True, one_time_keyboard=True) 
 
-async def draw_changing_lines(number: int, changing_lines: list, user_id: int):
-    image_path = Path(__file__).parent / "gg" / f"{number}.png"
-    if not image_path.exists():
-        await log_error(f"Изображение гексаграммы №{number} не найдено")
-        return None
+async def draw_changing_lines(number: int, changing_lines: list):
+    png = image_cache.get_cached(number, changing_lines)
+    if png is not None:
+        return png
 
     try:
-        img = Image.open(image_path).convert("RGB")
-        draw = ImageDraw.Draw(img)
-        width, height = img.size
-        line_spacing = height / 6
-
-        for line_number in changing_lines:
-            y = height - (line_number - 0.7) * line_spacing
-            x = width * 0.93
-            radius = 3
-            draw.ellipse(
-                (x - radius, y - radius, x + radius, y + radius),
-                fill="red"
-            )
-
-        temp_path = Path(__file__).parent / "temp" / f"{number}_{user_id}.png"
-        temp_path.parent.mkdir(exist_ok=True)
-        img.save(temp_path)
-        return temp_path
+        with metrics.track("image_render"):
+            png = await asyncio.to_thread(image_cache.render, number, changing_lines)
+        if png is None:
+            await log_error(f"Изображение гексаграммы №{number} не найдено")
+        return png
     except Exception as e:
         await log_error(f"Ошибка при создании изображения гексаграммы №{number}: {str(e)}")
         return None
 
+@instrument
 async def send_hexagram(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Определяем тип обновления (сообщение или callback)
     if update.callback_query:
@@ -212,15 +345,30 @@ async def send_hexagram(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Номер: {number}, Название: {hex_name}, Изменяющиеся линии: {changing_lines}"
     )
 
-    # Отправка изображения
-    temp_path = await draw_changing_lines(number, changing_lines, user.id)
-    if temp_path:
+    # Отправка изображения: по сохраненному file_id, если картинка уже загружалась
+    key = image_key(number, lines_mask(changing_lines))
+    file_id = await photo_file_ids.get(key)
+    sent = False
+    if file_id is not None:
         try:
-            await message.reply_photo(photo=open(temp_path, 'rb'))
-        finally:
-            temp_path.unlink()
-    else:
-        await message.reply_text(f"Гексаграмма №{number}")
+            await message.reply_photo(photo=file_id)
+            photo_file_ids.record_hit(key)
+            sent = True
+        except BadRequest as e:
+            # Остальные BadRequest (чат, сообщение для ответа) к file_id не относятся
+            if "file" not in str(e).lower():
+                raise
+            # Telegram больше не знает этот file_id: загружаем картинку заново
+            await log_error(f"file_id гексаграммы №{number} отклонен: {str(e)}")
+            await photo_file_ids.invalidate(key)
+    if not sent:
+        png = await draw_changing_lines(number, changing_lines)
+        if png:
+            sent_message = await message.reply_photo(photo=png)
+            if sent_message.photo:
+                await photo_file_ids.put(key, sent_message.photo[-1].file_id, len(png))
+        else:
+            await message.reply_text(f"Гексаграмма №{number}")
 
     # Формирование текста ответа
     response = f"🔮 {number} — {hex_name} ({hex_data[0]})"
@@ -234,6 +382,8 @@ async def send_hexagram(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await message.reply_text(response)
 
+@fast_lane
+@instrument
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     context.user_data["question_count"] = 0
@@ -244,6 +394,8 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=main_menu()
     )
 
+@fast_lane
+@instrument
 async def exit_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     await log_user_action(user.id, user.username, user.full_name, "Завершение сессии")
@@ -253,6 +405,8 @@ async def exit_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return ConversationHandler.END
 
+@fast_lane
+@instrument
 async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     await log_user_action(user.id, user.username, user.full_name, "Пауза сессии")
@@ -261,27 +415,47 @@ async def stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=main_menu()
     )
 
+@fast_lane
+@instrument
 async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     if user.id != ADMIN_ID:
         await update.message.reply_text("🚷 Команда только для администратора")
         return
 
+    # /stats — все время, /stats 7 — последние 7 дней, /stats hex — по гексаграммам
+    args = context.args or []
     try:
-        with open(RATINGS_FILE, 'r', encoding='utf-8') as f:
-            ratings = [json.loads(line) for line in f if line.strip()]
-
-        if not ratings:
-            await update.message.reply_text("📭 Нет данных для анализа")
+        if args and args[0] == "hex":
+            by_hex = await asyncio.to_thread(ratings_store.by_hexagram)
+            if not by_hex:
+                await update.message.reply_text("📭 Нет данных для анализа")
+                return
+            top = sorted(by_hex.items(), key=lambda item: item[1]["good"] + item[1]["bad"], reverse=True)[:15]
+            lines = [
+                f"• {number} {HEXAGRAMS.get(number, ['', ''])[1]}: 👍 {c['good']} / 👎 {c['bad']}"
+                for number, c in top
+            ]
+            await update.message.reply_text("📊 Оценки по гексаграммам:\n\n" + "\n".join(lines))
             return
 
-        good = sum(1 for r in ratings if r["rate"] == "good")
-        bad = sum(1 for r in ratings if r["rate"] == "bad")
+        if args and args[0].isdigit():
+            days = max(1, int(args[0]))
+            stats = await asyncio.to_thread(ratings_store.window, days)
+            title = f"📊 Статистика оценок за {days} дн.:"
+        else:
+            stats = await asyncio.to_thread(ratings_store.totals)
+            title = "📊 Статистика оценок:"
+
+        good, bad = stats["good"], stats["bad"]
         total = good + bad
+        if not total:
+            await update.message.reply_text("📭 Нет данных для анализа")
+            return
 
         await update.message.reply_text(
-            f"📊 Статистика оценок:\n\n"
-            f"• Пользователей: {len({r['user_id'] for r in ratings})}\n"
+            f"{title}\n\n"
+            f"• Пользователей: {stats['users']}\n"
             f"• 👍 Хорошо: {good}\n"
             f"• 👎 Неактуально: {bad}\n"
             f"• 📈 % позитивных: {good/total*100:.1f}%"
@@ -290,17 +464,210 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await log_error(f"Ошибка показа статистики: {str(e)}")
         await update.message.reply_text("⚠️ Ошибка загрузки данных")
 
+@fast_lane
+@instrument
+async def show_spend(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    if user.id != ADMIN_ID:
+        await update.message.reply_text("🚷 Команда только для администратора")
+        return
+
+    # /spend — расход на LLM за сегодня, /spend 7 — за последние 7 дней
+    args = context.args or []
+    days = max(1, int(args[0])) if args and args[0].isdigit() else 1
+    try:
+        totals = await asyncio.to_thread(usage_ledger.totals, days)
+        if not totals["calls"]:
+            await update.message.reply_text("📭 Нет данных для анализа")
+            return
+        sections = []
+        for title, kind in (("🤖 Модели", MODEL), ("👤 Пользователи", USER), ("⚙️ Обработчики", HANDLER)):
+            rows = await asyncio.to_thread(usage_ledger.top, kind, days)
+            sections.append(f"{title}:\n" + "\n".join(
+                f"• {name}: {cost:.4f} {COST_CURRENCY} ({calls} выз., {prompt}+{completion} ток.)"
+                for name, calls, prompt, completion, cost in rows
+            ))
+
+        period = "сегодня" if days == 1 else f"{days} дн."
+        text = (
+            f"💸 Расход на LLM за {period}: {totals['cost']:.4f} {COST_CURRENCY}\n\n"
+            f"• Вызовов: {totals['calls']}\n"
+            f"• Токенов: {totals['prompt_tokens']} в запросах, {totals['completion_tokens']} в ответах\n\n"
+            + "\n\n".join(sections)
+        )
+        if USER_DAILY_BUDGET:
+            text += f"\n\nДневной бюджет пользователя: {USER_DAILY_BUDGET} {COST_CURRENCY}"
+        await update.message.reply_text(text)
+    except Exception as e:
+        await log_error(f"Ошибка показа расхода на LLM: {str(e)}")
+        await update.message.reply_text("⚠️ Ошибка загрузки данных")
+
+@fast_lane
+@instrument
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global broadcast_task
+    user = update.effective_user
+    if user.id != ADMIN_ID:
+        await update.message.reply_text("🚷 Команда только для администратора")
+        return
+
+    # /broadcast <текст> — всем пользователям из журнала, /broadcast stop — остановить
+    parts = update.message.text.split(maxsplit=1)
+    text = parts[1].strip() if len(parts) > 1 else ""
+    running = broadcast_task is not None and not broadcast_task.done()
+    if text == "stop":
+        if running:
+            broadcast_task.cancel()
+        else:
+            await update.message.reply_text("Рассылка не идет")
+        return
+    if not text:
+        await update.message.reply_text("Использование: /broadcast <текст> или /broadcast stop")
+        return
+    if running:
+        await update.message.reply_text("⏳ Предыдущая рассылка еще идет")
+        return
+
+    await log_user_action(user.id, user.username, user.full_name, "Рассылка", text)
+    status = await update.message.reply_text("📣 Рассылка началась...")
+    broadcast_task = asyncio.create_task(run_broadcast(context.bot, text, status))
+
+async def run_broadcast(bot: Bot, text: str, status):
+    """Разослать text всем пользователям из журнала; ход рассылки — правками сообщения status"""
+    counts = {"sent": 0, "blocked": 0, "failed": 0}
+    started = time.monotonic()
+    slots = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    deliveries = set()
+
+    async def deliver(user_id: int):
+        try:
+            # Массовые сообщения уступают очередь ответам пользователям
+            await bot.send_message(chat_id=user_id, text=text, rate_limit_args=BULK)
+            counts["sent"] += 1
+        except Forbidden:
+            counts["blocked"] += 1
+        except Exception as e:
+            counts["failed"] += 1
+            await log_error(f"Ошибка рассылки пользователю {user_id}: {str(e)}")
+        finally:
+            slots.release()
+
+    def progress(title: str) -> str:
+        elapsed = time.monotonic() - started
+        rate = counts["sent"] / elapsed if elapsed > 0 else 0.0
+        return (
+            f"{title}\n\n"
+            f"• Отправлено: {counts['sent']}\n"
+            f"• Заблокировали бота: {counts['blocked']}\n"
+            f"• Ошибок: {counts['failed']}\n"
+            f"• Время: {elapsed:.0f} с, {rate:.1f} сообщ./с"
+        )
+
+    title = "✅ Рассылка завершена"
+    # Получатели — из общего журнала и журналов всех воркеров, а не только своего
+    recipients = iter_user_ids(USER_SESSIONS_LOG)
+    last_report = started
+    try:
+        while True:
+            # Журнал читается по одному получателю в потоке: в памяти только множество уже найденных id
+            user_id = await asyncio.to_thread(next, recipients, None)
+            if user_id is None:
+                break
+            if user_id <= 0:
+                # Группы и каналы в журнале не получатели рассылки
+                continue
+            await slots.acquire()
+            task = asyncio.create_task(deliver(user_id))
+            deliveries.add(task)
+            task.add_done_callback(deliveries.discard)
+            if time.monotonic() - last_report >= BROADCAST_REPORT_INTERVAL:
+                last_report = time.monotonic()
+                try:
+                    await status.edit_text(progress("📣 Рассылка идет..."))
+                except Exception:
+                    pass
+        if deliveries:
+            await asyncio.gather(*deliveries)
+    except asyncio.CancelledError:
+        title = "⏹ Рассылка остановлена"
+        for task in deliveries:
+            task.cancel()
+    except Exception as e:
+        title = "⚠️ Рассылка прервана ошибкой"
+        await log_error(f"Ошибка рассылки: {str(e)}")
+    try:
+        await status.edit_text(progress(title))
+    except Exception as e:
+        await log_error(f"Ошибка отчета о рассылке: {str(e)}")
+
 async def send_advice_with_rating(update: Update, text: str, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["last_advice"] = text
     await update.message.reply_text(
         f"{text}\n\n_Оцените совет:_",
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("👍 Хорошо", callback_data="rate_good"),
-             InlineKeyboardButton("👎 Неактуально", callback_data="rate_bad")]
-        ]),
+        reply_markup=rating_keyboard(),
         parse_mode="Markdown"
     )
 
+async def admit_llm_request(update: Update, user_id: int) -> bool:
+    """Дождаться своей очереди к LLM; False — запрос отклонен и пользователь об этом уведомлен"""
+    delay = await admission.reserve(user_id)
+    if delay is None:
+        await update.message.reply_text(THROTTLED_TEXT, reply_markup=main_menu())
+        return False
+    if delay >= ADMISSION_NOTICE_DELAY:
+        await update.message.reply_text(f"⏳ Много вопросов, отвечу через {round(delay)} с...")
+    if delay > 0:
+        await admission.wait(delay)
+    return True
+
+async def over_budget(user_id) -> bool:
+    """True, если пользователь сегодня исчерпал дневной бюджет на LLM"""
+    if not USER_DAILY_BUDGET or user_id is None:
+        return False
+    try:
+        return await usage_ledger.spent_today(user_id) >= USER_DAILY_BUDGET
+    except Exception as e:
+        await log_error(f"Ошибка проверки бюджета: {str(e)}")
+        return False
+
+def budget_max_tokens(max_tokens: int, over: bool) -> int:
+    return max(16, int(max_tokens * BUDGET_TOKEN_FACTOR)) if over else max_tokens
+
+async def reply_with_advice(update: Update, question: str, context: ContextTypes.DEFAULT_TYPE, user):
+    context.user_data.pop("last_hex_number", None)
+    if not await admit_llm_request(update, user.id):
+        return
+    if LLM_STREAMING and llm.available() and not contains_stop_words(question):
+        await stream_advice_with_rating(update, question, context, user)
+        return
+    advice = await generate_advice(question, context, user)
+    await send_advice_with_rating(update, f"🔮 Дао-бот говорит:\n\n{advice}", context)
+
+async def stream_advice_with_rating(update: Update, question: str, context: ContextTypes.DEFAULT_TYPE, user):
+    hex_num, changing_lines, _ = generate_hexagram()
+    hex_data = HEXAGRAMS.get(hex_num, ["", ""])
+    header = "🔮 Дао-бот говорит:\n\n"
+
+    try:
+        over = await over_budget(user.id)
+        advice, _ = await stream_reply(
+            update.message,
+            llm.stream(advice_messages(question, hex_num, hex_data, changing_lines),
+                       temperature=0.5, max_tokens=budget_max_tokens(150, over), user_id=user.id),
+            header=header,
+            footer="\n\n_Оцените совет:_",
+            final_markup=rating_keyboard(),
+            parse_mode="Markdown",
+            min_interval=STREAM_EDIT_INTERVAL,
+            error_text="Произошла ошибка. Попробуйте позже.",
+            unavailable_text=UPSTREAM_DOWN_TEXT
+        )
+        context.user_data["last_advice"] = header + advice
+        await record_advice(context, user.id, user.username, user.full_name, question, hex_num, hex_data, advice)
+    except Exception as e:
+        await log_error(f"Ошибка GPT при генерации совета: {str(e)}")
+
+@instrument
 async def handle_interpretation_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_choice = update.message.text
     context.user_data["interpretation_type"] = user_choice
@@ -314,11 +681,13 @@ async def handle_interpretation_choice(update: Update, context: ContextTypes.DEF
     else:
         return await generate_hexagram_interpretation(update, context)
 
-    # функцию для обработки выбора контекста  
+@instrument
 async def handle_context_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["interpretation_context"] = update.message.text
     return await generate_hexagram_interpretation(update, context)      
 
+@fast_lane
+@instrument
 async def handle_rating(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -332,18 +701,20 @@ async def handle_rating(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "username": user.username,
         "full_name": user.full_name,
         "advice": context.user_data.get("last_advice", "?"),
-        "rate": rate
+        "rate": rate,
+        "hex_number": context.user_data.get("last_hex_number")
     }
 
     try:
-        with open(RATINGS_FILE, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(rating_data, ensure_ascii=False) + "\n")
+        await asyncio.to_thread(ratings_store.add, rating_data)
 
         await query.message.edit_reply_markup(reply_markup=None)
         await query.message.reply_text(f"✅ Спасибо за оценку!", reply_markup=main_menu())
     except Exception as e:
         await log_error(f"Ошибка обработки оценки: {str(e)}")
 
+@fast_lane
+@instrument
 async def ready_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     await log_user_action(user.id, user.username, user.full_name, "Начало готового вопроса")
@@ -353,6 +724,7 @@ async def ready_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return FORMULATE_PROBLEM
 
+@instrument
 async def process_ready_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_text = update.message.text
@@ -362,17 +734,19 @@ async def process_ready_question(update: Update, context: ContextTypes.DEFAULT_T
         await update.message.reply_text("Отменено.", reply_markup=main_menu())
         return ConversationHandler.END
 
-    if contains_stop_words(user_text):
-        await log_user_action(user.id, user.username, user.full_name, "Стоп-слова в готовом вопросе")
+    stop_word = find_stop_word(user_text)
+    if stop_word:
+        await log_user_action(user.id, user.username, user.full_name, "Стоп-слова в готовом вопросе", stop_word)
         response = get_stop_word_response()
         await update.message.reply_text(response, reply_markup=main_menu())
         return ConversationHandler.END
 
     await log_user_action(user.id, user.username, user.full_name, "Готовый вопрос", user_text)
-    advice = await generate_advice(user_text, context)
-    await send_advice_with_rating(update, f"🔮 Дао-бот говорит:\n\n{advice}", context)
+    await reply_with_advice(update, user_text, context, user)
     return ConversationHandler.END
 
+@fast_lane
+@instrument
 async def start_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     context.user_data["user_name"] = user.full_name
@@ -383,6 +757,7 @@ async def start_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return FORMULATE_PROBLEM
 
+@instrument
 async def formulate_problem(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
 
@@ -393,8 +768,9 @@ async def formulate_problem(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     problem_text = update.message.text
 
-    if contains_stop_words(problem_text):
-        await log_user_action(user.id, user.username, user.full_name, "Стоп-слова в запросе")
+    stop_word = find_stop_word(problem_text)
+    if stop_word:
+        await log_user_action(user.id, user.username, user.full_name, "Стоп-слова в запросе", stop_word)
         response = get_stop_word_response()
         await update.message.reply_text(response, reply_markup=main_menu())
         return ConversationHandler.END
@@ -402,8 +778,14 @@ async def formulate_problem(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await log_user_action(user.id, user.username, user.full_name, "Формулировка проблемы", problem_text)
     context.user_data["problem"] = problem_text
 
+    # Ответ из кэша не расходует лимит запросов к LLM
+    question = clear_question_cache.get(problem_text)
+    if question is None and not await admit_llm_request(update, user.id):
+        return ConversationHandler.END
+
     try:
-        question = await generate_clear_question(problem_text)
+        if question is None:
+            question = await generate_clear_question(problem_text, user.id)
         context.user_data["current_question"] = question
         await update.message.reply_text(
             f"🔍 Ты имеешь в виду:\n\n«{question}»\n\n"
@@ -416,45 +798,51 @@ async def formulate_problem(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Ошибка обработки запроса", reply_markup=main_menu())
         return ConversationHandler.END
 
-async def generate_clear_question(text: str) -> str:
+async def generate_clear_question(text: str, user_id: int = None) -> str:
+    """Вопрос от LLM; кэш проверяет вызывающий обработчик до admit_llm_request"""
+    over = await over_budget(user_id)
     try:
-        response = client.chat.completions.create(
-            model=GPT_MODEL,
-            messages=[
+        response = await llm.complete(
+            [
                 {"role": "system", "content": "Сформулируй проблему как четкий вопрос"},
                 {"role": "user", "content": text}
             ],
             temperature=0.3,
-            max_tokens=50
+            max_tokens=budget_max_tokens(50, over),
+            user_id=user_id
         )
-        return response.choices[0].message.content.strip('"')
+        question = response.choices[0].message.content.strip('"')
+        if not over:
+            # Укороченные сверх бюджета ответы другим пользователям не отдаем
+            clear_question_cache.put(text, question, response.usage.total_tokens if response.usage else 0)
+        return question
     except Exception as e:
         await log_error(f"Ошибка уточнения вопроса: {str(e)}")
         return text
 
+@instrument
 async def confirm_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_text = update.message.text
     question = context.user_data.get("current_question", "")
 
     if context.user_data.get("waiting_for_custom_question", False):
-        if contains_stop_words(user_text):
-            await log_user_action(user.id, user.username, user.full_name, "Стоп-слова в кастомном вопросе")
+        stop_word = find_stop_word(user_text)
+        if stop_word:
+            await log_user_action(user.id, user.username, user.full_name, "Стоп-слова в кастомном вопросе", stop_word)
             response = get_stop_word_response()
             await update.message.reply_text(response, reply_markup=main_menu())
             context.user_data.pop("waiting_for_custom_question", None)
             return ConversationHandler.END
 
         context.user_data["current_question"] = user_text
-        advice = await generate_advice(user_text, context)
-        await send_advice_with_rating(update, f"🔮 Дао-бот говорит:\n\n{advice}", context)
+        await reply_with_advice(update, user_text, context, user)
         context.user_data.pop("waiting_for_custom_question", None)
         return ConversationHandler.END
 
     if user_text.startswith(("1", "Да")):
         await log_user_action(user.id, user.username, user.full_name, "Подтверждение вопроса", question)
-        advice = await generate_advice(question, context)
-        await send_advice_with_rating(update, f"🔮 Дао-бот говорит:\n\n{advice}", context)
+        await reply_with_advice(update, question, context, user)
         return ConversationHandler.END
     elif user_text.startswith(("2", "Уточнить")):
         await log_user_action(user.id, user.username, user.full_name, "Запрос уточнения")
@@ -473,12 +861,16 @@ async def confirm_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return CONFIRM_QUESTION
 
+@fast_lane
+@instrument
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     await log_user_action(user.id, user.username, user.full_name, "Отмена действия")
     await update.message.reply_text("Действие отменено.", reply_markup=main_menu())
     return ConversationHandler.END
 
+@fast_lane
+@instrument
 async def timeout_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     await log_user_action(user.id, user.username, user.full_name, "Тайм-аут диалога")
@@ -489,6 +881,8 @@ async def timeout_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return ConversationHandler.END
 
+@fast_lane
+@instrument
 async def divination_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     # Инициализация счетчика, если его нет
@@ -535,6 +929,8 @@ async def divination_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Основная логика генерации гексаграммы
     await send_hexagram(update, context)
 
+@fast_lane
+@instrument
 async def info_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         info_path = Path(__file__).parent / "info.txt"
@@ -550,6 +946,16 @@ async def info_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=main_menu()
         )
 
+@fast_lane
+@instrument
+async def english_version(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(
+        "For English version, please visit @TaoDronBot",
+        reply_markup=main_menu()
+    )
+
+@fast_lane
+@instrument
 async def start_hexagram_interpretation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     await log_user_action(user.id, user.username, user.full_name, "Начало толкования гексаграммы")
@@ -561,6 +967,8 @@ async def start_hexagram_interpretation(update: Update, context: ContextTypes.DE
     )
     return HEXAGRAM_INTERPRETATION
 
+@fast_lane
+@instrument
 async def process_hexagram_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_input = update.message.text.strip()
@@ -634,6 +1042,7 @@ async def process_hexagram_input(update: Update, context: ContextTypes.DEFAULT_T
         )
         return HEXAGRAM_INTERPRETATION
 
+@instrument
 async def generate_hexagram_interpretation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     hex_number = context.user_data["hex_number"]
@@ -641,13 +1050,12 @@ async def generate_hexagram_interpretation(update: Update, context: ContextTypes
     hex_data = HEXAGRAMS.get(hex_number, ["", f"Гексаграмма №{hex_number}"])
     interpretation_type = context.user_data.get("interpretation_type", "Краткое толкование")
 
+    streamed = False
     try:
         if interpretation_type == "Краткое толкование":
-            prompt = f"Дайте краткое толкование (2-3 предложения) гексаграммы {hex_number} '{hex_data[1]}'"
-            if changing_lines:
-                prompt += f" с учетом изменяющихся линий: {', '.join(map(str, changing_lines))}"
-            prompt += ". Будьте лаконичны."
+            messages = short_reading_messages(hex_number, hex_data[1], changing_lines)
             max_tokens = 100
+            cache_key = interpretation_key(hex_number, changing_lines, interpretation_type)
         else:
             context_type = context.user_data.get("interpretation_context", "🔮 Общее толкование")
             context_prompts = {
@@ -665,29 +1073,73 @@ async def generate_hexagram_interpretation(update: Update, context: ContextTypes
             if changing_lines:
                 prompt += f"Учтите изменяющиеся линии: {', '.join(map(str, changing_lines))}.\n"
             prompt += "Структурируйте ответ:\n1. Общее значение (1 предложение)\n2. Особенности в выбранном контексте (1 предложение)\n3. Толкование линий (1 предложение)\n4. Практические рекомендации (1 предложение)"
-            max_tokens = 350
-
-        response = client.chat.completions.create(
-            model=GPT_MODEL,
-            messages=[
+            messages = [
                 {"role": "system", "content": "Вы специалист по И-Цзин. Дайте точное толкование гексаграммы с учетом контекста"},
                 {"role": "user", "content": prompt}
-            ],
-            temperature=0.4,
-            max_tokens=max_tokens
-        )
-
-        interpretation = response.choices[0].message.content
+            ]
+            max_tokens = 350
+            cache_key = interpretation_key(hex_number, changing_lines, interpretation_type, context_type)
 
         if interpretation_type == "Развернутое толкование":
             header = f"🔮 Развернутое толкование ({context_type}) гексаграммы {hex_number} — {hex_data[1]}:\n\n"
         else:
             header = f"🔮 Краткое толкование гексаграммы {hex_number} — {hex_data[1]}:\n\n"
 
-        await update.message.reply_text(
-            header + interpretation,
-            reply_markup=main_menu()
-        )
+        interpretation = None
+        if interpretation_type == "Краткое толкование":
+            # Корпус покрывает все сочетания; к LLM идем только за ключами, которых в нем нет
+            interpretation = readings_corpus.get(hex_number, changing_lines)
+        if interpretation is None:
+            interpretation = await interpretation_cache.get(cache_key)
+        if interpretation is None and not llm.available():
+            # Прокси недоступен: подойдет любой сохраненный вариант
+            interpretation = await interpretation_cache.get_any(cache_key)
+        over = interpretation is None and await over_budget(user.id)
+        if over:
+            # Дневной бюджет исчерпан: подойдет любой сохраненный вариант, иначе толкование короче
+            interpretation = await interpretation_cache.get_any(cache_key)
+            max_tokens = budget_max_tokens(max_tokens, True)
+        if interpretation is None and not await admit_llm_request(update, user.id):
+            return ConversationHandler.END
+
+        if interpretation is None and LLM_STREAMING and interpretation_type == "Развернутое толкование":
+            # Развернутое толкование длинное: показываем его по мере генерации
+            streamed = True
+            interpretation, _ = await stream_reply(
+                update.message,
+                llm.stream(messages, temperature=0.4, max_tokens=max_tokens, user_id=user.id),
+                header=header,
+                reply_markup=main_menu(),
+                min_interval=STREAM_EDIT_INTERVAL,
+                error_text=INTERPRETATION_ERROR_TEXT,
+                unavailable_text=UPSTREAM_DOWN_TEXT
+            )
+            if not over:
+                await interpretation_cache.put(cache_key, interpretation)
+        else:
+            if interpretation is None:
+                try:
+                    response = await llm.complete(
+                        messages,
+                        temperature=0.4,
+                        max_tokens=max_tokens,
+                        user_id=user.id,
+                        coalesce=True
+                    )
+                except Exception:
+                    # Прокси не ответил: отдаем устаревший вариант из кэша, если он есть
+                    interpretation = await interpretation_cache.get_any(cache_key)
+                    if interpretation is None:
+                        raise
+                else:
+                    interpretation = response.choices[0].message.content
+                    if not over:
+                        await interpretation_cache.put(cache_key, interpretation)
+
+            await update.message.reply_text(
+                header + interpretation,
+                reply_markup=main_menu()
+            )
 
         # Очищаем временные данные
         context.user_data.pop("interpretation_type", None)
@@ -695,14 +1147,18 @@ async def generate_hexagram_interpretation(update: Update, context: ContextTypes
 
         return ConversationHandler.END
 
+    except CircuitOpenError:
+        # При потоковой выдаче ошибку уже показывает сама заглушка
+        if not streamed:
+            await update.message.reply_text(UPSTREAM_DOWN_TEXT, reply_markup=main_menu())
+        return ConversationHandler.END
     except Exception as e:
         await log_error(f"Ошибка генерации толкования: {str(e)}")
-        await update.message.reply_text(
-            "Произошла ошибка при генерации толкования. Пожалуйста, попробуйте позже.",
-            reply_markup=main_menu()
-        )
+        if not streamed:
+            await update.message.reply_text(INTERPRETATION_ERROR_TEXT, reply_markup=main_menu())
         return ConversationHandler.END
 
+@instrument
 async def handle_unrecognized(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Добавляем обработку ответов на подтверждение
     if context.user_data.get("awaiting_confirmation", False):
@@ -712,20 +1168,14 @@ async def handle_unrecognized(update: Update, context: ContextTypes.DEFAULT_TYPE
     user = update.effective_user
     user_text = update.message.text
     await log_user_action(user.id, user.username, user.full_name, "Неопознанное сообщение", user_text)
-    reply = await generate_fallback_reply(user_text)
+    reply = fallback_reply_cache.get(user_text)
+    if reply is None:
+        if not await admit_llm_request(update, user.id):
+            return
+        reply = await generate_fallback_reply(user_text, user.id)
     await update.message.reply_text(reply, reply_markup=main_menu())
 
-async def generate_advice(question: str, context: ContextTypes.DEFAULT_TYPE):
-    if contains_stop_words(question):
-        await log_user_action(context.user_data.get("user_id", 0), 
-                            context.user_data.get("username", ""), 
-                            context.user_data.get("full_name", ""), 
-                            "Обнаружены стоп-слова", question)
-        return get_stop_word_response()
-
-    hex_num, changing_lines, _ = generate_hexagram()
-    hex_data = HEXAGRAMS.get(hex_num, ["", ""])
-
+def advice_messages(question: str, hex_num: int, hex_data: list, changing_lines: list) -> list:
     prompt = (
         f"Пользователь спрашивает:\n"
         f"«{question}»\n\n"
@@ -734,125 +1184,396 @@ async def generate_advice(question: str, context: ContextTypes.DEFAULT_TYPE):
         f"{'Изменяющиеся линии: ' + ', '.join(map(str, changing_lines)) if changing_lines else ''}\n\n"
         f"Дай практичный совет (2 предложения), упоминая номер гексаграммы, название и изменяющиеся линии (если будут)."
     )
+    return [
+        {"role": "system", "content": "Ты — ментор Silicon Valley, который помогает решать проблемы методами design thinking. Твои советы — конкретные шаги, проверенные кейсы и неочевидные инсайты."},
+        {"role": "user", "content": prompt}
+    ]
+
+async def record_advice(context: ContextTypes.DEFAULT_TYPE, user_id: int, username: str, full_name: str,
+                        question: str, hex_num: int, hex_data: list, advice: str):
+    context.user_data["question_count"] = context.user_data.get("question_count", 0) + 1
+    context.user_data["last_hex_number"] = hex_num
+    await log_user_action(
+        user_id,
+        username,
+        full_name,
+        "Сгенерирован совет", 
+        f"Вопрос: {question}\nГексаграмма: {hex_num} {hex_data[1]}\nСовет: {advice}"
+    )
+
+async def generate_advice(question: str, context: ContextTypes.DEFAULT_TYPE, user=None):
+    user_id = user.id if user else context.user_data.get("user_id", 0)
+    username = user.username if user else context.user_data.get("username", "")
+    full_name = user.full_name if user else context.user_data.get("full_name", "")
+
+    if contains_stop_words(question):
+        await log_user_action(user_id, username, full_name, "Обнаружены стоп-слова", question)
+        return get_stop_word_response()
+
+    hex_num, changing_lines, _ = generate_hexagram()
+    hex_data = HEXAGRAMS.get(hex_num, ["", ""])
 
     try:
-        response = client.chat.completions.create(
-            model=GPT_MODEL,
-            messages=[
-                {"role": "system", "content": "Ты — ментор Silicon Valley, который помогает решать проблемы методами design thinking. Твои советы — конкретные шаги, проверенные кейсы и неочевидные инсайты."},
-                {"role": "user", "content": prompt}
-            ],
+        response = await llm.complete(
+            advice_messages(question, hex_num, hex_data, changing_lines),
             temperature=0.5,
-            max_tokens=150
+            max_tokens=budget_max_tokens(150, await over_budget(user_id)),
+            user_id=user_id
         )
         advice = response.choices[0].message.content
-        context.user_data["question_count"] = context.user_data.get("question_count", 0) + 1
-
-        await log_user_action(
-            context.user_data.get("user_id", 0), 
-            context.user_data.get("username", ""), 
-            context.user_data.get("full_name", ""), 
-            "Сгенерирован совет", 
-            f"Вопрос: {question}\nГексаграмма: {hex_num} {hex_data[1]}\nСовет: {advice}"
-        )
+        await record_advice(context, user_id, username, full_name, question, hex_num, hex_data, advice)
         return advice
+    except CircuitOpenError:
+        return UPSTREAM_DOWN_TEXT
     except Exception as e:
         await log_error(f"Ошибка GPT при генерации совета: {str(e)}")
         return "Произошла ошибка. Попробуйте позже."
 
-async def generate_fallback_reply(user_text: str):
+async def generate_fallback_reply(user_text: str, user_id: int = None):
+    over = await over_budget(user_id)
     try:
-        response = client.chat.completions.create(
-            model=GPT_MODEL,
-            messages=[
+        response = await llm.complete(
+            [
                 {"role": "system", "content": "Ты — вежливый, мудрый собеседник."},
                 {"role": "user", "content": user_text}
             ],
             temperature=0.7,
-            max_tokens=100
+            max_tokens=budget_max_tokens(100, over),
+            user_id=user_id,
+            coalesce=True
         )
-        return response.choices[0].message.content.strip()
+        reply = response.choices[0].message.content.strip()
+        if not over:
+            fallback_reply_cache.put(user_text, reply, response.usage.total_tokens if response.usage else 0)
+        return reply
     except Exception as e:
         await log_error(f"Ошибка обработки необработанного сообщения: {str(e)}")
         return "Я тебя понял. Спасибо за сообщение."
 
-def main():
+async def prepare_services(app: Application):
+    # Базы открываются здесь, а не при импорте main
+    await asyncio.gather(*(
+        asyncio.to_thread(store.open) for store in (ratings_store, photo_file_ids, usage_ledger)
+    ))
     try:
-        app = Application.builder().token(TELEGRAM_TOKEN).build()
-
-        # Основные команды
-        app.add_handler(CommandHandler("start", start_command))
-        app.add_handler(CommandHandler("stats", show_stats))
-        app.add_handler(MessageHandler(filters.Regex(r"^(Старт|Start)$"), start_command))
-        app.add_handler(MessageHandler(filters.Regex(r"^(Выйти|Exit)$"), exit_command))
-        app.add_handler(MessageHandler(filters.Regex(r"^(Быстрый ответ И-Цзин|Divination)$"), divination_command))
-        app.add_handler(MessageHandler(filters.Regex(r"^(Инфо|Info)$"), info_command))
-        app.add_handler(CallbackQueryHandler(handle_rating, pattern="^rate_"))
-        app.add_handler(MessageHandler(filters.Regex(r"^English version ➡️$"), 
-             lambda update, context: update.message.reply_text(
-                 "For English version, please visit @TaoDronBot",
-                 reply_markup=main_menu()
-             )))
-
-        # Обработчик для толкования гексаграмм
-        hex_interpretation_handler = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex(r"^Толкование гексаграммы$"), start_hexagram_interpretation)],
-    states={
-        HEXAGRAM_INTERPRETATION: [
-            MessageHandler(
-                filters.TEXT & ~filters.COMMAND & ~filters.Regex(r"^(Краткое толкование|Развернутое толкование)$") & 
-                ~filters.Regex(r"^(💑 Отношения|👨‍👩‍👧‍👦 Дети|💰 Финансы|🧘 Здоровье|🎓 Образование|🏛 Бизнес|🔮 Общее толкование)$"),
-                process_hexagram_input
-            ),
-            MessageHandler(
-                filters.Regex(r"^(Краткое толкование|Развернутое толкование)$"),
-                handle_interpretation_choice
-            ),
-            MessageHandler(
-                filters.Regex(r"^(💑 Отношения|👨‍👩‍👧‍👦 Дети|💰 Финансы|🧘 Здоровье|🎓 Образование|🏛 Бизнес|🔮 Общее толкование)$"),
-                handle_context_choice
-            )
+        await asyncio.to_thread(readings_corpus.open)
+    except (ValueError, struct.error) as e:
+        # Испорченный корпус не мешает старту: краткие толкования пойдут через кэш и LLM
+        await log_error(f"Корпус толкований не открыт: {str(e)}")
+    imported = await asyncio.to_thread(ratings_store.import_jsonl, RATINGS_FILE)
+    if imported:
+        await log_error(f"Импортировано оценок из {RATINGS_FILE}: {imported}")
+    metrics.registry.register_gauges("log_sink", log_sink.stats)
+    metrics.registry.register_gauges("image_cache", image_cache.stats)
+    metrics.registry.register_gauges("photo_file_ids", photo_file_ids.stats)
+    metrics.registry.register_gauges("interpretation_cache", interpretation_cache.stats)
+    metrics.registry.register_gauges("readings_corpus", readings_corpus.stats)
+    metrics.registry.register_gauges("clear_question_cache", clear_question_cache.stats)
+    metrics.registry.register_gauges("fallback_reply_cache", fallback_reply_cache.stats)
+    metrics.registry.register_gauges("llm_single_flight", llm.single_flight.stats)
+    metrics.registry.register_gauges("llm", llm.stats)
+    metrics.registry.register_gauges("usage_ledger", usage_ledger.stats)
+    metrics.registry.register_gauges("llm_stream", lambda: streaming.stats)
+    metrics.registry.register_gauges("persistence", app.persistence.stats)
+    metrics.registry.register_gauges("shared_store", shared_store.stats)
+    metrics.registry.register_gauges("admission", admission.stats)
+    metrics.registry.register_gauges("scheduler", app.update_processor.stats)
+    metrics.registry.register_gauges("outbound", app.bot.rate_limiter.stats)
+
+async def warm_image_cache():
+    """Декодировать картинки гексаграмм уже после старта: до этого они загружаются по запросу"""
+    try:
+        await asyncio.to_thread(image_cache.load_bases)
+        if os.getenv("IMAGE_PRERENDER", "0") == "1":
+            workers = int(os.getenv("IMAGE_PRERENDER_WORKERS", "0")) or None
+            await asyncio.to_thread(image_cache.prerender_all, workers)
+    except Exception as e:
+        await log_error(f"Ошибка подготовки изображений: {str(e)}")
+
+async def shutdown_services(app: Application):
+    if broadcast_task is not None:
+        broadcast_task.cancel()
+    await llm.aclose()
+    interpretation_cache.close()
+    readings_corpus.close()
+    photo_file_ids.close()
+    usage_ledger.close()
+    ratings_store.close()
+    await shared_store.close()
+    log_sink.stop()
+
+def build_application(base_url: str = TELEGRAM_API_URL) -> Application:
+    # Обновления обрабатываются параллельно, быстрые ответы и ответы LLM — в разных пулах;
+    # обновления одного пользователя идут по порядку
+    update_processor = PriorityUpdateProcessor(
+        {
+            "fast": int(os.getenv("SCHEDULER_FAST_CONCURRENCY", "64")),
+            "llm": int(os.getenv("SCHEDULER_LLM_CONCURRENCY", os.getenv("BOT_CONCURRENT_UPDATES", "256")))
+        },
+        max_pending=int(os.getenv("SCHEDULER_MAX_PENDING", "10000"))
+    )
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(update_processor)
+        # Исходящие сообщения: лимиты Telegram на бот и на чат, паузы по 429, рассылка в последнюю очередь.
+        # Общий лимит делится между воркерами: каждый шлет от имени того же бота
+        .rate_limiter(OutboundRateLimiter(
+            global_rate=float(os.getenv("OUTBOUND_GLOBAL_PER_SECOND", "30")) / max(1, BOT_WORKERS),
+            private_rate=float(os.getenv("OUTBOUND_CHAT_PER_SECOND", "1")),
+            group_rate=float(os.getenv("OUTBOUND_GROUP_PER_MINUTE", "20")) / 60,
+            max_retries=int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+        ))
+    )
+    if base_url:
+        builder = builder.base_url(f"{base_url.rstrip('/')}/bot").base_file_url(f"{base_url.rstrip('/')}/file/bot")
+    # user_data и состояния диалогов переживают перезапуск; неактивные пользователи выгружаются из памяти
+    builder = builder.persistence(SQLitePersistence(
+        os.getenv("STATE_DB_FILE", "bot_state.db"),
+        update_interval=float(os.getenv("STATE_UPDATE_INTERVAL", "30")),
+        idle_ttl=float(os.getenv("STATE_IDLE_TTL", "3600"))
+    ))
+    app = builder.build()
+    update_processor.classify = lambda update: handler_lane(app, update)
+
+    # Основные команды
+    app.add_handler(CommandHandler("start", start_command))
+    app.add_handler(CommandHandler("stats", show_stats))
+    app.add_handler(CommandHandler("spend", show_spend))
+    app.add_handler(CommandHandler("broadcast", broadcast_command))
+    # Кнопки главного меню: один словарь подписей вместо цепочки регулярных выражений
+    app.add_handler(MenuHandler({
+        ("Старт", "Start"): start_command,
+        ("Выйти", "Exit"): exit_command,
+        ("Быстрый ответ И-Цзин", "Divination"): divination_command,
+        ("Инфо", "Info"): info_command,
+        "English version ➡️": english_version
+    }))
+    app.add_handler(CallbackQueryHandler(handle_rating, pattern="^rate_"))
+
+    # Обработчик для толкования гексаграмм
+    hex_interpretation_handler = RoutedConversation(
+        entry_points=[MenuHandler({"Толкование гексаграммы": start_hexagram_interpretation})],
+        states={
+            HEXAGRAM_INTERPRETATION: [
+                MenuHandler(
+                    {INTERPRETATION_CHOICES: handle_interpretation_choice, CONTEXT_CHOICES: handle_context_choice},
+                    default=process_hexagram_input
+                )
+            ],
+        },
+        fallbacks=[
+            CommandHandler("cancel", cancel),
+            MessageHandler(filters.ALL, timeout_handler)
         ],
-    },
-    fallbacks=[
-        CommandHandler("cancel", cancel),
-        MessageHandler(filters.ALL, timeout_handler)
-    ],
-    conversation_timeout=300
-)
+        conversation_timeout=300,
+        name="hex_interpretation",
+        persistent=True
+    )
 
-        app.add_handler(hex_interpretation_handler)
-
-        # Обработчик для готовых вопросов
-        ready_handler = ConversationHandler(
-            entry_points=[MessageHandler(filters.Regex(r"^(Готовый вопрос|Ready question)$"), ready_question)],
-            states={
-                FORMULATE_PROBLEM: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_ready_question)],
-            },
-            fallbacks=[
-                CommandHandler("cancel", cancel),
-                MessageHandler(filters.ALL, timeout_handler)
-            ],
-            conversation_timeout=300
+    app.add_handler(hex_interpretation_handler)
+
+    # Обработчик для готовых вопросов
+    ready_handler = RoutedConversation(
+        entry_points=[MenuHandler({("Готовый вопрос", "Ready question"): ready_question})],
+        states={
+            FORMULATE_PROBLEM: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_ready_question)],
+        },
+        fallbacks=[
+            CommandHandler("cancel", cancel),
+            MessageHandler(filters.ALL, timeout_handler)
+        ],
+        conversation_timeout=300,
+        name="ready_question",
+        persistent=True
+    )
+    app.add_handler(ready_handler)
+
+    # Обработчик для помощи в формулировке вопроса
+    help_handler = RoutedConversation(
+        entry_points=[MenuHandler({("Помочь сформулировать", "Help"): start_help})],
+        states={
+            FORMULATE_PROBLEM: [MessageHandler(filters.TEXT & ~filters.COMMAND, formulate_problem)],
+            CONFIRM_QUESTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, confirm_question)]
+        },
+        fallbacks=[CommandHandler("cancel", cancel)],
+        conversation_timeout=300,
+        name="help_question",
+        persistent=True
+    )
+    app.add_handler(help_handler)
+
+    # Обработчик для нераспознанных сообщений
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_unrecognized))
+
+    return app
+
+def health_details() -> dict:
+    return {"llm": llm.breaker.state}
+
+def stop_signal() -> asyncio.Event:
+    """Событие, которое выставляется по SIGINT/SIGTERM"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    return stop_event
+
+def start_background_tasks(app: Application):
+    return [
+        asyncio.create_task(metrics.monitor_event_loop()),
+        asyncio.create_task(warm_image_cache()),
+        asyncio.create_task(app.persistence.run_eviction(app, float(os.getenv("STATE_EVICT_INTERVAL", "60"))))
+    ]
+
+async def start_receiving(bot: Bot, updater: Updater, webhook: bool):
+    if webhook:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            allowed_updates=Update.ALL_TYPES,
+            secret_token=WEBHOOK_SECRET
         )
-        app.add_handler(ready_handler)
-
-        # Обработчик для помощи в формулировке вопроса
-        help_handler = ConversationHandler(
-            entry_points=[MessageHandler(filters.Regex(r"^(Помочь сформулировать|Help)$"), start_help)],
-            states={
-                FORMULATE_PROBLEM: [MessageHandler(filters.TEXT & ~filters.COMMAND, formulate_problem)],
-                CONFIRM_QUESTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, confirm_question)]
-            },
-            fallbacks=[CommandHandler("cancel", cancel)],
-            conversation_timeout=300
+    else:
+        await bot.delete_webhook()
+        await updater.start_polling(allowed_updates=Update.ALL_TYPES)
+
+async def run_bot(app: Application):
+    """Запуск бота и HTTP-сервера в одном цикле событий до сигнала остановки"""
+    webhook = BOT_MODE == "webhook"
+    if webhook and not WEBHOOK_URL:
+        raise ValueError("Для BOT_MODE=webhook необходимо указать WEBHOOK_URL")
+
+    stop_event = stop_signal()
+    # aiohttp импортируется только процессами, которые поднимают HTTP-сервер
+    from web_server import WebServer
+    server = WebServer(
+        app,
+        port=PORT,
+        webhook_path=WEBHOOK_PATH if webhook else None,
+        secret_token=WEBHOOK_SECRET,
+        health=health_details
+    )
+
+    try:
+        async with app:
+            await prepare_services(app)
+            tasks = start_background_tasks(app)
+            await app.start()
+            await server.start()
+            await start_receiving(app.bot, app.updater, webhook)
+
+            await stop_event.wait()
+
+            if not webhook:
+                await app.updater.stop()
+            await server.stop()
+            await app.stop()
+            for task in tasks:
+                task.cancel()
+    finally:
+        await shutdown_services(app)
+
+async def run_ingress():
+    """Входной процесс: получает обновления и раздает их воркерам по chat_id"""
+    webhook = BOT_MODE == "webhook"
+    if webhook and not WEBHOOK_URL:
+        raise ValueError("Для BOT_MODE=webhook необходимо указать WEBHOOK_URL")
+    # В памяти процесса у каждого воркера свои лимиты и кэши: без общего хранилища
+    # ограничения частоты и бюджеты действуют в BOT_WORKERS раз слабее
+    if not SHARED_STORE_URL:
+        raise ValueError("Для BOT_WORKERS > 1 необходимо указать SHARED_STORE_URL=redis://...")
+    if isinstance(shared_store, MemoryStore):
+        with open(ERROR_LOG_FILE, 'a', encoding='utf-8') as f:
+            f.write(f"{datetime.now().isoformat()} - ПРЕДУПРЕЖДЕНИЕ: SHARED_STORE_URL={SHARED_STORE_URL}, "
+                    f"у {BOT_WORKERS} воркеров раздельные лимиты и кэши\n")
+
+    stop_event = stop_signal()
+    bot = Bot(TELEGRAM_TOKEN)
+    if TELEGRAM_API_URL:
+        bot = Bot(
+            TELEGRAM_TOKEN,
+            base_url=f"{TELEGRAM_API_URL.rstrip('/')}/bot",
+            base_file_url=f"{TELEGRAM_API_URL.rstrip('/')}/file/bot"
         )
-        app.add_handler(help_handler)
+    updater = Updater(bot, asyncio.Queue())
+    dispatcher = UpdateDispatcher(BOT_WORKERS, run_worker, max_queue=int(os.getenv("WORKER_QUEUE_SIZE", "10000")))
+    from web_server import WebServer
+    # WebServer кладет обновления вебхука в updater.update_queue, как и polling
+    server = WebServer(
+        updater,
+        port=PORT,
+        webhook_path=WEBHOOK_PATH if webhook else None,
+        secret_token=WEBHOOK_SECRET
+    )
+    metrics.registry.register_gauges("dispatcher", dispatcher.stats)
 
-        # Обработчик для нераспознанных сообщений
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_unrecognized))
+    dispatcher.start()
+    try:
+        async with updater:
+            forwarder = asyncio.create_task(dispatcher.forward(updater.update_queue))
+            loop_monitor = asyncio.create_task(metrics.monitor_event_loop())
+            await server.start()
+            await start_receiving(updater.bot, updater, webhook)
+
+            await stop_event.wait()
+
+            if not webhook:
+                await updater.stop()
+            await server.stop()
+            forwarder.cancel()
+            loop_monitor.cancel()
+            while not updater.update_queue.empty():
+                dispatcher.dispatch(updater.update_queue.get_nowait())
+    finally:
+        await asyncio.to_thread(dispatcher.stop)
+        log_sink.stop()
+
+async def serve_worker(index: int, updates):
+    app = build_application()
+    from web_server import WebServer
+    # Свои /health и /metrics у каждого воркера: PORT+1, PORT+2, ...
+    server = WebServer(app, port=PORT + 1 + index, health=health_details)
+    try:
+        async with app:
+            await prepare_services(app)
+            tasks = start_background_tasks(app)
+            await app.start()
+            await server.start()
+
+            await consume(updates, app)
+            # Application.stop отбрасывает необработанное, поэтому сначала дожидаемся очереди
+            await app.update_queue.join()
+
+            await server.stop()
+            await app.stop()
+            for task in tasks:
+                task.cancel()
+    finally:
+        await shutdown_services(app)
+
+def run_worker(index: int, updates):
+    """Процесс-воркер: обрабатывает обновления из своей очереди до сигнала от входного процесса"""
+    # Остановкой управляет входной процесс, чтобы воркер успел дописать очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Ротация переименовывает файл под открытыми дескрипторами других процессов,
+    # поэтому у каждого воркера свои журналы: user_sessions.txt.w0, error.txt.w0, ...
+    global USER_SESSIONS_FILE, ERROR_LOG_FILE
+    USER_SESSIONS_FILE = f"{USER_SESSIONS_LOG}.w{index}"
+    ERROR_LOG_FILE = f"{ERROR_LOG_FILE}.w{index}"
+    configure_logs()
+    asyncio.run(serve_worker(index, updates))
 
-        app.run_polling()
+def main():
+    try:
+        if BOT_WORKERS > 1:
+            asyncio.run(run_ingress())
+        else:
+            app = build_application()
+            asyncio.run(run_bot(app))
     except Exception as e:
         with open(ERROR_LOG_FILE, 'a', encoding='utf-8') as f:
             f.write(f"{datetime.now().isoformat()} - ФАТАЛЬНАЯ ОШИБКА: {str(e)}\n")
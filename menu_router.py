@@ -0,0 +1,83 @@
+"""Маршрутизация кнопок меню по точной подписи.
+
+Кнопка клавиатуры присылает ровно свой текст, поэтому вместо цепочки
+MessageHandler с регулярными выражениями (каждый проверяется по очереди, а в
+состоянии диалога еще и отрицания) текст нормализуется один раз и ищется в
+словаре подпись -> обработчик. Один MenuHandler заменяет группу обработчиков
+и внутри ConversationHandler: значение, которое вернул выбранный обработчик,
+остается новым состоянием диалога.
+
+Планировщик выбирает полосу по тем же check_update, что и Application, и
+запоминает результаты (remember_checks); MenuHandler и RoutedConversation
+берут их оттуда, поэтому обработчик для обновления подбирается один раз.
+"""
+import contextvars
+
+from telegram import Update
+from telegram.ext import ConversationHandler, MessageHandler, filters
+
+# Результаты check_update из выбора полосы: (обновление, {id(обработчик): результат})
+_checks = contextvars.ContextVar("menu_router_checks", default=(None, None))
+_MISSING = object()
+
+
+def remember_checks(update: object, results: dict):
+    """Запомнить результаты check_update для обработки этого обновления в той же задаче"""
+    _checks.set((update, results))
+
+
+def _recalled(handler, update: object):
+    checked, results = _checks.get()
+    if checked is not update:
+        return _MISSING
+    return results.get(id(handler), _MISSING)
+
+
+def normalize(text: str) -> str:
+    # Как якорь $ в прежних регулярных выражениях: завершающий перевод строки не мешает совпадению
+    return text[:-1] if text.endswith("\n") else text
+
+
+class MenuHandler(MessageHandler):
+    def __init__(self, routes: dict, default=None):
+        """routes: подпись или кортеж подписей (RU и EN) -> обработчик.
+        default получает остальной текст, кроме команд."""
+        self.routes = {}
+        for labels, callback in routes.items():
+            for label in (labels,) if isinstance(labels, str) else labels:
+                self.routes[label] = callback
+        self.default = default
+        super().__init__(filters.TEXT, self._dispatch)
+
+    def check_update(self, update: object):
+        """Обработчик для этого обновления или None"""
+        callback = _recalled(self, update)
+        if callback is not _MISSING:
+            return callback
+        if not isinstance(update, Update):
+            return None
+        # Те же сообщения, что пропускает filters.TEXT, без цепочки проверок фильтра
+        message = update.message or update.edited_message or update.channel_post or update.edited_channel_post
+        if message is None or not message.text:
+            return None
+        callback = self.routes.get(normalize(message.text))
+        if callback is None and self.default is not None and not filters.COMMAND.filter(message):
+            callback = self.default
+        return callback
+
+    async def handle_update(self, update, application, check_result, context):
+        return await check_result(update, context)
+
+    async def _dispatch(self, update, context):
+        # Вызывается, только если handle_update обошли: выбираем обработчик заново
+        callback = self.check_update(update)
+        if callback is not None:
+            return await callback(update, context)
+
+
+class RoutedConversation(ConversationHandler):
+    """ConversationHandler, который не подбирает обработчик состояния повторно"""
+
+    def check_update(self, update: object):
+        check = _recalled(self, update)
+        return super().check_update(update) if check is _MISSING else check
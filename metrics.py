@@ -0,0 +1,248 @@
+"""Метрики бота в текстовом формате Prometheus.
+
+Обработчики оборачиваются декоратором instrument, вызовы внешних сервисов —
+контекстным менеджером track. Модули с собственными счетчиками (кэши,
+очередь логов) подключаются через register_gauges. Отдельная задача
+измеряет задержку цикла событий, чтобы блокирующие вызовы были видны.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Имя обработчика, в рамках которого идет текущий вызов (для учета токенов LLM)
+current_handler = contextvars.ContextVar("current_handler", default="-")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = dict(labels, le=_format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._gauge_sources = []
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        return self._add(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames=()) -> Gauge:
+        return self._add(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_gauges(self, prefix: str, source):
+        """Экспортировать числовые значения словаря source() как gauge-метрики prefix_<ключ>"""
+        self._gauge_sources.append((prefix, source))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, source in self._gauge_sources:
+            try:
+                values = source()
+            except Exception:
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"bot_{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_LATENCY = registry.histogram(
+    "bot_handler_latency_seconds", "Время выполнения обработчика", ("handler",))
+HANDLER_IN_FLIGHT = registry.gauge(
+    "bot_handler_in_flight", "Обработчики, выполняющиеся прямо сейчас", ("handler",))
+HANDLER_ERRORS = registry.counter(
+    "bot_handler_errors_total", "Необработанные исключения в обработчиках", ("handler",))
+UPSTREAM_LATENCY = registry.histogram(
+    "bot_upstream_latency_seconds", "Время вызова внешнего сервиса или тяжелой операции", ("upstream",))
+UPSTREAM_IN_FLIGHT = registry.gauge(
+    "bot_upstream_in_flight", "Незавершенные вызовы внешних сервисов", ("upstream",))
+UPSTREAM_ERRORS = registry.counter(
+    "bot_upstream_errors_total", "Ошибки вызовов внешних сервисов", ("upstream",))
+LLM_TOKENS = registry.counter(
+    "bot_llm_tokens_total", "Токены LLM по обработчикам", ("handler", "model", "kind"))
+LLM_STREAM_TTFB = registry.histogram(
+    "bot_llm_stream_ttfb_seconds", "Время до первого фрагмента потокового ответа", ("handler",))
+UPDATE_QUEUE_WAIT = registry.histogram(
+    "bot_update_queue_wait_seconds", "Ожидание обновления до начала обработки по полосам", ("lane",))
+ADMISSION_THROTTLED = registry.counter(
+    "bot_admission_throttled_total", "Запросы к LLM, задержанные или отклоненные ограничителем частоты",
+    ("limit", "result"))
+EVENT_LOOP_LAG = registry.gauge(
+    "bot_event_loop_lag_seconds", "Последняя измеренная задержка цикла событий")
+EVENT_LOOP_LAG_HISTOGRAM = registry.histogram(
+    "bot_event_loop_lag_distribution_seconds", "Распределение задержки цикла событий",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+
+def instrument(func=None, *, name: str = None):
+    """Декоратор асинхронного обработчика: латентность, параллельность и ошибки"""
+    if func is None:
+        return functools.partial(instrument, name=name)
+    handler = name or func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_handler.set(handler)
+        HANDLER_IN_FLIGHT.inc(handler=handler)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=handler)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler=handler)
+            HANDLER_IN_FLIGHT.dec(handler=handler)
+            current_handler.reset(token)
+
+    return wrapper
+
+
+@contextmanager
+def track(upstream: str):
+    """Учет времени и ошибок вызова внешнего сервиса или тяжелой операции"""
+    UPSTREAM_IN_FLIGHT.inc(upstream=upstream)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_ERRORS.inc(upstream=upstream)
+        raise
+    finally:
+        UPSTREAM_LATENCY.observe(time.perf_counter() - started, upstream=upstream)
+        UPSTREAM_IN_FLIGHT.dec(upstream=upstream)
+
+
+def record_llm_usage(usage, model: str):
+    if usage is None:
+        return
+    handler = current_handler.get()
+    LLM_TOKENS.inc(usage.prompt_tokens or 0, handler=handler, model=model, kind="prompt")
+    LLM_TOKENS.inc(usage.completion_tokens or 0, handler=handler, model=model, kind="completion")
+
+
+async def monitor_event_loop(interval: float = 0.5):
+    """Фоновая задача: насколько позже запланированного просыпается цикл событий"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
@@ -0,0 +1,174 @@
+"""Очередь исходящих запросов к Bot API с учетом лимитов Telegram.
+
+Подключается к Application как rate_limiter, поэтому через нее проходят все
+reply_text, reply_photo, правки сообщений и т.д. Запросы с chat_id:
+
+- ждут своей очереди в корзине чата (личные чаты и группы — с разной
+  скоростью) и затем в общей корзине бота; правки уже отправленных
+  сообщений (потоковая выдача ответа) корзину чата не расходуют;
+- из общей очереди первыми уходят интерактивные ответы, массовые
+  (рассылка, rate_limit_args=BULK) — только в оставшиеся слоты;
+- на 429 вся отправка ставится на паузу на retry_after, и запрос
+  повторяется; сетевые ошибки до отправки повторяются с разбросом задержки.
+
+Остальные методы (getUpdates, answerCallbackQuery и т.п.) идут напрямую.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+from telegram.ext import BaseRateLimiter
+
+from admission import TokenBucket
+from resilience import backoff_delay
+
+INTERACTIVE = 0
+BULK = 10
+# Правки не добавляют сообщений в чат: иначе заглушка потоковой выдачи,
+# которую правят каждые STREAM_EDIT_INTERVAL секунд, задерживала бы следующие ответы
+EDIT_ENDPOINTS = frozenset({"editMessageText", "editMessageCaption", "editMessageReplyMarkup"})
+
+
+class OutboundRateLimiter(BaseRateLimiter):
+    def __init__(self, global_rate: float = 30.0, private_rate: float = 1.0, private_burst: float = 3,
+                 group_rate: float = 20 / 60, group_burst: float = 3, max_retries: int = 3,
+                 retry_base_delay: float = 0.5, retry_max_delay: float = 5.0, max_chats: int = 100000):
+        self.global_rate = global_rate
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate, max(1.0, global_rate))
+        self._chats = OrderedDict()
+        # (приоритет, номер, future): общая очередь, из которой pump выдает слоты
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._pump_task = None
+        self._paused_until = 0.0
+        self.sent = {INTERACTIVE: 0, BULK: 0}
+        self.retry_after = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def initialize(self) -> None:
+        # Тот же экземпляр получает и бот Updater, поэтому initialize может прийти дважды
+        if self._pump_task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._pump_task = asyncio.create_task(self._pump())
+
+    async def shutdown(self) -> None:
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except asyncio.CancelledError:
+                pass
+            self._pump_task = None
+        for _, _, future in self._waiting:
+            if not future.done():
+                future.cancel()
+        self._waiting.clear()
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Отрицательные id (и @username) — группы и каналы: там лимит строже
+            group = not isinstance(chat_id, int) or chat_id < 0
+            bucket = TokenBucket(self.group_rate, self.group_burst) if group else \
+                TokenBucket(self.private_rate, self.private_burst)
+            self._chats[chat_id] = bucket
+            if len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _pump(self):
+        """Выдает слоты общей очереди по приоритету с темпом global_rate"""
+        while True:
+            while not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            delay = self._global.reserve(float("inf"))
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # За время ожидания мог прийти более срочный запрос: берем лучший на этот момент
+            while self._waiting:
+                _, _, future = heapq.heappop(self._waiting)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                self._global.refund()
+
+    async def _slot(self, chat_id, priority: int, per_chat: bool = True):
+        delay = self._chat_bucket(chat_id).reserve(float("inf")) if per_chat else 0
+        if delay > 0:
+            await asyncio.sleep(delay)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._sequence), future))
+        self._wakeup.set()
+        await future
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+        priority = BULK if rate_limit_args == BULK else INTERACTIVE
+        per_chat = endpoint not in EDIT_ENDPOINTS
+
+        attempt = 0
+        while True:
+            await self._slot(chat_id, priority, per_chat)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                # Telegram просит подождать: останавливаем всю отправку, а не только этот чат
+                self.retry_after += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                # После паузы начинаем с пустой общей корзины, без всплеска из накопленных токенов
+                self._global.tokens = 0
+                self._global.updated = max(self._global.updated, self._paused_until)
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    raise
+            except BadRequest:
+                raise
+            except TimedOut:
+                # Запрос мог дойти до Telegram: повтор рискует отправить сообщение дважды
+                self.failed += 1
+                raise
+            except NetworkError:
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    raise
+                await asyncio.sleep(backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay))
+            else:
+                self.sent[priority] += 1
+                return result
+            attempt += 1
+            self.retried += 1
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._waiting),
+            "sent_interactive": self.sent[INTERACTIVE],
+            "sent_bulk": self.sent[BULK],
+            "retry_after": self.retry_after,
+            "retried": self.retried,
+            "failed": self.failed,
+            "paused": max(0.0, self._paused_until - time.monotonic()),
+        }
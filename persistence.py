@@ -0,0 +1,283 @@
+"""Хранение user_data и состояний диалогов в SQLite.
+
+Данные пользователя не загружаются при старте: PTB вызывает
+refresh_user_data перед обработкой каждого обновления, и в этот момент
+запись читается из базы один раз. Измененные данные PTB отдает раз в
+update_interval секунд; все записи одного прохода пишутся одной
+транзакцией. Пользователи, не писавшие боту дольше idle_ttl, выгружаются из
+памяти (их данные остаются в базе), а их незавершенные диалоги
+завершаются, поэтому память зависит от числа активных, а не всех
+пользователей.
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from copy import deepcopy
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+
+class SQLitePersistence(BasePersistence):
+    def __init__(self, path: str, update_interval: float = 30, idle_ttl: float = 3600):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS user_data (
+                user_id INTEGER PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS conversations (
+                name TEXT NOT NULL,
+                key TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (name, key)
+            );
+        """)
+        self._db.commit()
+
+        self._last_seen = {}
+        self._loading = {}
+        self._evicted = set()
+        self._pending_users = {}
+        self._pending_deletes = set()
+        self._pending_conversations = {}
+        # (имя диалога, ключ) -> время последней смены состояния
+        self._conversation_seen = {}
+        self._conversations_unsupported = False
+        self._flush_task = None
+        self._application = None
+        self.loads = 0
+        self.evictions = 0
+        self.conversation_evictions = 0
+        self.writes = 0
+
+    # --- чтение и запись в базу (в потоке) ---
+
+    def _read_user(self, user_id: int):
+        with self._lock:
+            row = self._db.execute("SELECT data FROM user_data WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write_pending(self):
+        with self._lock:
+            users, self._pending_users = self._pending_users, {}
+            deletes, self._pending_deletes = self._pending_deletes, set()
+            conversations, self._pending_conversations = self._pending_conversations, {}
+            if not (users or deletes or conversations):
+                return
+            now = time.time()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO user_data (user_id, data, updated) VALUES (?, ?, ?)",
+                [(user_id, json.dumps(data, ensure_ascii=False), now) for user_id, data in users.items()]
+            )
+            self._db.executemany("DELETE FROM user_data WHERE user_id = ?", [(user_id,) for user_id in deletes])
+            for (name, key), state in conversations.items():
+                if state is None:
+                    self._db.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, key))
+                else:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO conversations (name, key, state, updated) VALUES (?, ?, ?, ?)",
+                        (name, key, json.dumps(state), now)
+                    )
+            self._db.commit()
+            self.writes += 1
+
+    async def _flush_soon(self):
+        # Даем остальным update_* этого прохода PTB положить свои данные
+        await asyncio.sleep(0)
+        await asyncio.to_thread(self._write_pending)
+
+    async def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_soon())
+        await asyncio.shield(self._flush_task)
+
+    # --- ленивая загрузка и выгрузка ---
+
+    async def _load(self, user_id: int, user_data: dict):
+        try:
+            stored = self._pending_users.get(user_id)
+            if stored is None:
+                stored = await asyncio.to_thread(self._read_user, user_id)
+            for key, value in (stored or {}).items():
+                user_data.setdefault(key, value)
+            self._last_seen[user_id] = time.monotonic()
+            self.loads += 1
+        finally:
+            self._loading.pop(user_id, None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._last_seen:
+            self._last_seen[user_id] = time.monotonic()
+            return
+        task = self._loading.get(user_id)
+        if task is None:
+            task = self._loading[user_id] = asyncio.ensure_future(self._load(user_id, user_data))
+        await asyncio.shield(task)
+
+    def evict_idle(self, application) -> int:
+        """Выгрузить из памяти пользователей, неактивных дольше idle_ttl"""
+        self._application = application
+        deadline = time.monotonic() - self.idle_ttl
+        idle = [user_id for user_id, seen in self._last_seen.items() if seen < deadline]
+        for user_id in idle:
+            del self._last_seen[user_id]
+            if user_id in application.user_data:
+                # Последнее состояние уходит в базу со следующей записью
+                self._pending_users[user_id] = deepcopy(application.user_data[user_id])
+            self._evicted.add(user_id)
+            application.drop_user_data(user_id)
+        self.evictions += len(idle)
+        return len(idle) + self._evict_conversations(application, deadline)
+
+    def _evict_conversations(self, application, deadline: float) -> int:
+        # Таймаут диалога короче idle_ttl, но у диалогов, загруженных при старте,
+        # таймеров нет: брошенные завершаем здесь. Удаление из словаря PTB
+        # передаст в update_conversation как конец диалога. Публичного способа
+        # завершить чужой диалог у PTB нет: словарь приватный, версия закреплена
+        # в requirements.txt, а без него выгружаются только пользователи.
+        handler_conversations = getattr(application, "_conversation_handler_conversations", None)
+        if not isinstance(handler_conversations, dict):
+            if not self._conversations_unsupported:
+                self._conversations_unsupported = True
+                logger.warning("Application без _conversation_handler_conversations: диалоги не выгружаются")
+            return 0
+        evicted = 0
+        for name, conversations in handler_conversations.items():
+            idle = [
+                key for key in conversations
+                # Последний элемент ключа — user_id (per_user=True)
+                if self._conversation_seen.get((name, key), 0) < deadline and key[-1] not in self._last_seen
+            ]
+            for key in idle:
+                del conversations[key]
+                self._conversation_seen.pop((name, key), None)
+            evicted += len(idle)
+        self.conversation_evictions += evicted
+        return evicted
+
+    async def run_eviction(self, application, interval: float = 60):
+        """Фоновая задача: периодическая выгрузка неактивных пользователей"""
+        while True:
+            await asyncio.sleep(interval)
+            if self.evict_idle(application):
+                await self._schedule_flush()
+
+    def stats(self) -> dict:
+        return {
+            "users_in_memory": len(self._last_seen),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "conversations_in_memory": len(self._conversation_seen),
+            "conversation_evictions": self.conversation_evictions,
+            "writes": self.writes,
+            "pending": len(self._pending_users) + len(self._pending_conversations),
+        }
+
+    # --- интерфейс BasePersistence ---
+
+    async def get_user_data(self) -> dict:
+        # Пользователи загружаются по одному в refresh_user_data
+        return {}
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        if user_id not in self._last_seen:
+            # Данные не загружались: запись затерла бы сохраненное состояние
+            return
+        self._pending_users[user_id] = data
+        await self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        if user_id in self._evicted:
+            # Выгружен из памяти по неактивности, а не удален
+            self._evicted.discard(user_id)
+            if user_id in self._last_seen and self._application is not None:
+                # Успел вернуться до записи: PTB пропустит его изменения в этом проходе
+                self._pending_users[user_id] = deepcopy(self._application.user_data[user_id])
+                await self._schedule_flush()
+            return
+        self._last_seen.pop(user_id, None)
+        self._pending_users.pop(user_id, None)
+        self._pending_deletes.add(user_id)
+        await self._schedule_flush()
+
+    def _read_conversations(self, name: str) -> list:
+        # Диалоги, брошенные дольше idle_ttl назад, начинаются заново
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM conversations WHERE name = ? AND updated < ?", (name, time.time() - self.idle_ttl)
+            )
+            self._db.commit()
+            return self._db.execute(
+                "SELECT key, state, updated FROM conversations WHERE name = ?", (name,)
+            ).fetchall()
+
+    async def get_conversations(self, name: str) -> dict:
+        rows = await asyncio.to_thread(self._read_conversations, name)
+        # Возраст записи переносим на monotonic, чтобы выгрузка видела, как давно диалог стоит
+        offset = time.monotonic() - time.time()
+        conversations = {}
+        for key, state, updated in rows:
+            key = tuple(json.loads(key))
+            conversations[key] = json.loads(state)
+            self._conversation_seen[(name, key)] = updated + offset
+        return conversations
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        if new_state is None:
+            self._conversation_seen.pop((name, key), None)
+        else:
+            self._conversation_seen[(name, key)] = time.monotonic()
+        self._pending_conversations[(name, json.dumps(list(key)))] = new_state
+        await self._schedule_flush()
+
+    async def flush(self) -> None:
+        if self._flush_task is not None:
+            await self._flush_task
+        await asyncio.to_thread(self._write_pending)
+        with self._lock:
+            self._db.close()
+
+    # Чаты, bot_data и callback_data не хранятся (store_data их отключает)
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
@@ -0,0 +1,205 @@
+"""Хранилище оценок советов на SQLite.
+
+Каждая оценка пишется одной транзакцией вместе со счетчиками: общие итоги,
+итоги по дням и по гексаграммам, число уникальных пользователей. Поэтому
+/stats читает несколько строк по первичному ключу, а не всю историю.
+Старый ratings.json (JSON Lines) импортируется один раз.
+
+Импорт вручную:
+    python ratings_store.py import ratings.json [ratings.db]
+"""
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta
+
+_HEX_IN_ADVICE = re.compile(r"[Гг]ексаграмм\w*\s*№?\s*(\d{1,2})")
+
+
+def hexagram_from_advice(advice: str):
+    """Номер гексаграммы из текста совета, если модель его упомянула"""
+    match = _HEX_IN_ADVICE.search(advice or "")
+    if match and 1 <= int(match.group(1)) <= 64:
+        return int(match.group(1))
+    return None
+
+
+class RatingsStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS ratings (
+                    id INTEGER PRIMARY KEY,
+                    time TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    user_id INTEGER,
+                    username TEXT,
+                    full_name TEXT,
+                    advice TEXT,
+                    rate TEXT NOT NULL,
+                    hex_number INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_ratings_time ON ratings(time);
+                CREATE INDEX IF NOT EXISTS idx_ratings_user ON ratings(user_id);
+                CREATE INDEX IF NOT EXISTS idx_ratings_hex ON ratings(hex_number);
+                CREATE TABLE IF NOT EXISTS rating_users (user_id INTEGER PRIMARY KEY);
+                CREATE TABLE IF NOT EXISTS rating_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+                CREATE TABLE IF NOT EXISTS rating_imports (path TEXT PRIMARY KEY, imported_at TEXT NOT NULL);
+            """)
+            self._db.commit()
+        return self._db
+
+    def open(self):
+        """Открыть базу и создать таблицы (при старте, в потоке)"""
+        with self._lock:
+            self._connect()
+
+    def _bump(self, name: str, amount: int = 1):
+        self._db.execute(
+            "INSERT INTO rating_counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def _insert(self, rating: dict):
+        rate = "good" if rating.get("rate") == "good" else "bad"
+        time = rating.get("time") or datetime.now().isoformat()
+        day = time[:10]
+        hex_number = rating.get("hex_number")
+        if hex_number is None:
+            hex_number = hexagram_from_advice(rating.get("advice", ""))
+
+        self._db.execute(
+            "INSERT INTO ratings (time, day, user_id, username, full_name, advice, rate, hex_number) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (time, day, rating.get("user_id"), rating.get("username"), rating.get("full_name"),
+             rating.get("advice"), rate, hex_number)
+        )
+        self._bump(rate)
+        self._bump(f"day:{day}:{rate}")
+        if hex_number is not None:
+            self._bump(f"hex:{hex_number}:{rate}")
+        user_id = rating.get("user_id")
+        # NULL в INTEGER PRIMARY KEY получил бы новый rowid и посчитался бы новым пользователем
+        if user_id is not None:
+            cursor = self._db.execute("INSERT OR IGNORE INTO rating_users (user_id) VALUES (?)", (user_id,))
+            if cursor.rowcount:
+                self._bump("users")
+
+    def add(self, rating: dict):
+        with self._lock:
+            self._connect()
+            self._insert(rating)
+            self._db.commit()
+
+    def _counters(self, names):
+        names = list(names)
+        placeholders = ",".join("?" * len(names))
+        rows = self._db.execute(
+            f"SELECT name, value FROM rating_counters WHERE name IN ({placeholders})", names
+        ).fetchall()
+        values = dict.fromkeys(names, 0)
+        values.update(rows)
+        return values
+
+    def totals(self) -> dict:
+        with self._lock:
+            self._connect()
+            values = self._counters(["good", "bad", "users"])
+        return {"good": values["good"], "bad": values["bad"], "users": values["users"]}
+
+    def window(self, days: int) -> dict:
+        """Итоги за последние days дней, включая сегодняшний"""
+        today = datetime.now().date()
+        dates = [(today - timedelta(days=i)).isoformat() for i in range(days)]
+        with self._lock:
+            self._connect()
+            values = self._counters(f"day:{d}:{rate}" for d in dates for rate in ("good", "bad"))
+            users = self._db.execute(
+                "SELECT COUNT(DISTINCT user_id) FROM ratings WHERE time >= ?", (dates[-1],)
+            ).fetchone()[0]
+        return {
+            "good": sum(v for k, v in values.items() if k.endswith(":good")),
+            "bad": sum(v for k, v in values.items() if k.endswith(":bad")),
+            "users": users,
+        }
+
+    def by_hexagram(self) -> dict:
+        """{номер гексаграммы: {"good": .., "bad": ..}} для гексаграмм с оценками"""
+        with self._lock:
+            self._connect()
+            rows = self._db.execute(
+                "SELECT name, value FROM rating_counters WHERE name >= 'hex:' AND name < 'hex;'"
+            ).fetchall()
+        result = {}
+        for name, value in rows:
+            _, number, rate = name.split(":")
+            result.setdefault(int(number), {"good": 0, "bad": 0})[rate] = value
+        return result
+
+    def import_jsonl(self, path: str) -> int:
+        """Разовый импорт ratings.json; повторный вызов для того же файла ничего не делает.
+
+        Файл сначала занимается записью в rating_imports в той же транзакции,
+        что и импорт: воркеры, стартующие одновременно, не импортируют его дважды.
+        """
+        key = os.path.abspath(path)
+        if not os.path.exists(path):
+            return 0
+        with self._lock:
+            self._connect()
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                # База занята другим процессом, который как раз импортирует файл
+                return 0
+            try:
+                claimed = self._db.execute(
+                    "INSERT OR IGNORE INTO rating_imports (path, imported_at) VALUES (?, ?)",
+                    (key, datetime.now().isoformat())
+                ).rowcount
+                if not claimed:
+                    self._db.rollback()
+                    return 0
+                count = 0
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        try:
+                            self._insert(json.loads(line))
+                            count += 1
+                        except (ValueError, TypeError, AttributeError):
+                            # Битая строка или не объект JSON
+                            continue
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return count
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "import":
+        print(__doc__)
+        sys.exit(1)
+    store = RatingsStore(sys.argv[3] if len(sys.argv) > 3 else "ratings.db")
+    print(f"Импортировано оценок: {store.import_jsonl(sys.argv[2])}")
+    store.close()
@@ -0,0 +1,275 @@
+"""Готовый корпус кратких толкований в отображаемом в память файле.
+
+Краткое толкование полностью задается номером гексаграммы и набором
+изменяющихся линий: 64 × 64 = 4096 ключей. Команда build заранее получает
+по несколько вариантов на ключ через LLM (с ограничением частоты и
+продолжением после обрыва) и упаковывает их в бинарный файл:
+
+    заголовок  <6sHHI>  b"DAORC1", версия, вариантов на ключ, число ключей
+    индекс     <IH> × 4096  смещение первого варианта и их число
+    данные     <H> длина + текст UTF-8, варианты ключа подряд
+
+Ключ — (номер - 1) * 64 + маска линий (бит i-1 для линии i). Бот открывает
+файл через mmap и отвечает без обращения к API; LLM нужен только для
+ключей, которых нет в файле.
+
+Сборка (PROXY_API_KEY и OPENAI_BASE_URL берутся из .env):
+    python readings_corpus.py build [--out readings.bin] [--variants 3] [--rate 5] [--concurrency 4]
+"""
+import argparse
+import asyncio
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+MAGIC = b"DAORC1"
+VERSION = 1
+HEADER = struct.Struct("<6sHHI")
+INDEX_ENTRY = struct.Struct("<IH")
+LENGTH = struct.Struct("<H")
+KEYS = 64 * 64
+
+
+def reading_index(hex_number: int, changing_lines) -> int:
+    mask = 0
+    for line in changing_lines:
+        if not 1 <= line <= 6:
+            raise ValueError(f"Номер линии вне диапазона: {line}")
+        mask |= 1 << (line - 1)
+    if not 1 <= hex_number <= 64:
+        raise ValueError(f"Номер гексаграммы вне диапазона: {hex_number}")
+    return (hex_number - 1) * 64 + mask
+
+
+def short_reading_messages(hex_number: int, hex_name: str, changing_lines) -> list:
+    """Промпт краткого толкования; тот же, что использует бот"""
+    prompt = f"Дайте краткое толкование (2-3 предложения) гексаграммы {hex_number} '{hex_name}'"
+    if changing_lines:
+        prompt += f" с учетом изменяющихся линий: {', '.join(map(str, changing_lines))}"
+    prompt += ". Будьте лаконичны."
+    return [
+        {"role": "system", "content": "Вы специалист по И-Цзин. Дайте точное толкование гексаграммы с учетом контекста"},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def pack(readings: dict, path: str, variants: int):
+    """readings: {индекс ключа: [тексты]} -> бинарный файл (запись через временный файл)"""
+    index = bytearray(INDEX_ENTRY.size * KEYS)
+    data = bytearray()
+    data_start = HEADER.size + len(index)
+    for key in range(KEYS):
+        texts = readings.get(key, [])[:variants]
+        INDEX_ENTRY.pack_into(index, key * INDEX_ENTRY.size, data_start + len(data), len(texts))
+        for text in texts:
+            encoded = text.encode("utf-8")[:0xFFFF]
+            data += LENGTH.pack(len(encoded)) + encoded
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, variants, KEYS))
+        f.write(index)
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ReadingsCorpus:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._map = None
+        self._lock = threading.Lock()
+        self.keys = 0
+        self.hits = 0
+        self.misses = 0
+
+    def open(self):
+        """Открыть (или переоткрыть после пересборки) файл корпуса; без файла корпус пуст.
+
+        Чужой или обрезанный файл — ValueError или struct.error, корпус при этом остается пустым.
+        """
+        with self._lock:
+            self._close()
+            if not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER.size:
+                return
+            self._file = open(self.path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                magic, version, _, keys = HEADER.unpack_from(self._map, 0)
+                if magic != MAGIC or version != VERSION or keys != KEYS:
+                    raise ValueError(f"{self.path}: неизвестный формат корпуса толкований")
+                self.keys = sum(
+                    1 for key in range(KEYS)
+                    if INDEX_ENTRY.unpack_from(self._map, HEADER.size + key * INDEX_ENTRY.size)[1]
+                )
+            except (ValueError, struct.error):
+                self._close()
+                raise
+
+    def variants(self, hex_number: int, changing_lines) -> list:
+        try:
+            key = reading_index(hex_number, changing_lines)
+        except ValueError:
+            return []
+        with self._lock:
+            if self._map is None:
+                return []
+            offset, count = INDEX_ENTRY.unpack_from(self._map, HEADER.size + key * INDEX_ENTRY.size)
+            texts = []
+            for _ in range(count):
+                (length,) = LENGTH.unpack_from(self._map, offset)
+                offset += LENGTH.size
+                texts.append(self._map[offset:offset + length].decode("utf-8", errors="ignore"))
+                offset += length
+        return texts
+
+    def get(self, hex_number: int, changing_lines):
+        """Случайный вариант толкования или None, если ключа нет в корпусе"""
+        texts = self.variants(hex_number, changing_lines)
+        if not texts:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return random.choice(texts)
+
+    def stats(self) -> dict:
+        return {"keys": self.keys, "hits": self.hits, "misses": self.misses}
+
+    def _close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.keys = 0
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+class _RateLimiter:
+    """Не больше rate запросов в секунду, равномерно"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+            self._next = max(now, self._next) + self.interval
+
+
+def _load_progress(path: str) -> dict:
+    readings = {}
+    if not os.path.exists(path):
+        return readings
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            texts = readings.setdefault(record["key"], [])
+            if record["text"] not in texts:
+                texts.append(record["text"])
+    return readings
+
+
+async def build(out: str, variants: int, rate: float, concurrency: int, model: str, limit: int = 0):
+    from dotenv import load_dotenv
+    from llm_gateway import LLMGateway
+
+    load_dotenv()
+    root = Path(__file__).parent
+    with open(root / "hexagrams.json", "r", encoding="utf-8") as f:
+        hexagrams = {int(k): v for k, v in json.load(f).items()}
+
+    # Готовые ответы пишутся построчно: оборванную сборку можно продолжить
+    progress_path = f"{out}.progress.jsonl"
+    readings = _load_progress(progress_path)
+    jobs = []
+    for hex_number in range(1, 65):
+        for mask in range(64):
+            key = (hex_number - 1) * 64 + mask
+            missing = variants - len(readings.get(key, []))
+            lines = [i for i in range(1, 7) if mask & (1 << (i - 1))]
+            jobs.extend([(key, hex_number, lines)] * max(missing, 0))
+    if limit:
+        jobs = jobs[:limit]
+    print(f"Ключей с готовыми вариантами: {sum(1 for t in readings.values() if len(t) >= variants)} из {KEYS}, "
+          f"запросов к LLM: {len(jobs)}")
+
+    llm = LLMGateway(
+        api_key=os.getenv("PROXY_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL", "https://api.proxyapi.ru/openai/v1"),
+        model=model,
+        max_concurrency=concurrency
+    )
+    limiter = _RateLimiter(rate)
+    done = failed = 0
+
+    with open(progress_path, "a", encoding="utf-8") as progress:
+        async def generate(key, hex_number, lines):
+            nonlocal done, failed
+            hex_name = hexagrams.get(hex_number, ["", f"Гексаграмма №{hex_number}"])[1]
+            await limiter.wait()
+            try:
+                response = await llm.complete(
+                    short_reading_messages(hex_number, hex_name, lines), temperature=0.4, max_tokens=100
+                )
+            except Exception as e:
+                failed += 1
+                print(f"Ошибка для {hex_number}.{','.join(map(str, lines))}: {e}", file=sys.stderr)
+                return
+            text = response.choices[0].message.content.strip()
+            texts = readings.setdefault(key, [])
+            if text and text not in texts:
+                texts.append(text)
+                progress.write(json.dumps({"key": key, "text": text}, ensure_ascii=False) + "\n")
+                progress.flush()
+            done += 1
+            if done % 100 == 0:
+                print(f"Готово {done}/{len(jobs)}")
+
+        # Пачками по concurrency: в памяти не больше одной пачки задач
+        for start in range(0, len(jobs), concurrency):
+            await asyncio.gather(*(generate(*job) for job in jobs[start:start + concurrency]))
+    await llm.aclose()
+
+    pack(readings, out, variants)
+    print(f"Записано {out}: ключей {sum(1 for t in readings.values() if t)}, ошибок {failed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Корпус кратких толкований")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="сгенерировать и упаковать корпус")
+    build_parser.add_argument("--out", default="readings.bin")
+    build_parser.add_argument("--variants", type=int, default=3)
+    build_parser.add_argument("--rate", type=float, default=5.0, help="запросов в секунду")
+    build_parser.add_argument("--concurrency", type=int, default=4)
+    build_parser.add_argument("--model", default="gpt-4.1-mini")
+    build_parser.add_argument("--limit", type=int, default=0, help="не больше N запросов за запуск")
+    stats_parser = sub.add_parser("stats", help="сколько ключей в готовом файле")
+    stats_parser.add_argument("path", nargs="?", default="readings.bin")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        asyncio.run(build(args.out, args.variants, args.rate, args.concurrency, args.model, args.limit))
+    else:
+        corpus = ReadingsCorpus(args.path)
+        corpus.open()
+        print(f"{args.path}: ключей {corpus.keys} из {KEYS}")
+        corpus.close()
@@ -0,0 +1,136 @@
+"""Защита от деградации прокси LLM.
+
+Повторы с экспоненциальной задержкой и случайным разбросом только для
+временных ошибок (таймауты, обрывы соединения, 429, 5xx), дублирующий
+(hedged) запрос, если первый отвечает дольше обычного, и размыкатель цепи:
+после серии отказов запросы какое-то время не отправляются вовсе, а
+вызывающий код сразу отдает кэш или заготовленный ответ.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+
+import httpx
+
+
+class CircuitOpenError(Exception):
+    """Размыкатель разомкнут: запрос к прокси не отправлялся"""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    import openai
+
+    if isinstance(exc, (asyncio.TimeoutError, httpx.TransportError,
+                        openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+    return False
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Полный разброс: случайная задержка от 0 до base * 2^attempt (не больше maximum)"""
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_probes: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.failures = 0
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            # Пора проверить, ожил ли прокси: пропускаем несколько пробных запросов
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def release(self):
+        """Вернуть пробный слот, если запрос завершился без исхода для размыкателя (отмена)"""
+        if self._state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record_success(self):
+        self.failures = 0
+        self._state = self.CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.opens += 1
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        codes = {self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}
+        return {"state": codes[self.state], "failures": self.failures, "opens": self.opens, "rejected": self.rejected}
+
+
+class LatencyWindow:
+    """Последние N длительностей успешных запросов для оценки перцентиля"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._values = deque(maxlen=size)
+
+    def observe(self, value: float):
+        self._values.append(value)
+
+    def percentile(self, q: float):
+        if len(self._values) < self.min_samples:
+            return None
+        ordered = sorted(self._values)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def hedged(factory, hedge_after: float, on_hedge=None, on_cancel=None):
+    """Запустить factory(); если ответа нет за hedge_after секунд — запустить второй
+    такой же запрос и вернуть первый успешный результат, отменив другой.
+    on_cancel() вызывается на каждый отмененный, еще не завершившийся запрос"""
+    first = asyncio.ensure_future(factory())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            if on_hedge is not None:
+                on_hedge()
+            tasks.add(asyncio.ensure_future(factory()))
+        error = None
+        pending = tasks
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+                if on_cancel is not None:
+                    on_cancel()
@@ -0,0 +1,115 @@
+"""Планировщик обработки обновлений с быстрой полосой.
+
+Обработчики делятся на быстрые (кнопки, команды, картинка гексаграммы) и
+ждущие LLM. У каждой полосы свой пул параллельности, поэтому нажатие кнопки
+не стоит в очереди за чужими генерациями, когда прокси отвечает медленно.
+Обновления одного пользователя выполняются строго по очереди: следующее
+ждет завершения предыдущего. Полоса определяется по обработчику, который
+PTB выберет для обновления (с учетом состояния ConversationHandler).
+"""
+import asyncio
+import time
+
+from telegram.ext import BaseUpdateProcessor, ConversationHandler
+
+import metrics
+from menu_router import MenuHandler, remember_checks
+
+FAST = "fast"
+LLM = "llm"
+
+
+def fast_lane(func):
+    """Пометить обработчик как быстрый: он не обращается к LLM"""
+    func.lane = FAST
+    return func
+
+
+def handler_lane(application, update, default: str = LLM) -> str:
+    """Полоса обновления: LLM, если хоть один выбранный обработчик не помечен быстрым"""
+    lanes = set()
+    results = {}
+    remember_checks(update, results)
+    for group in sorted(application.handlers):
+        for handler in application.handlers[group]:
+            check = handler.check_update(update)
+            results[id(handler)] = check
+            if check is None or check is False:
+                continue
+            if isinstance(handler, ConversationHandler):
+                handler, check = check[2], check[3]
+            # MenuHandler выбирает обработчик сам и возвращает его из check_update
+            callback = check if isinstance(handler, MenuHandler) else getattr(handler, "callback", None)
+            lanes.add(getattr(callback, "lane", default))
+            break
+    if not lanes:
+        return FAST
+    return LLM if LLM in lanes else FAST
+
+
+class PriorityUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, limits: dict, max_pending: int = 10000):
+        # Семафор базового класса ограничивает все принятые в работу обновления,
+        # включая ждущие своей очереди; реальная параллельность — в пулах полос
+        super().__init__(max_pending)
+        self.limits = dict(limits)
+        self.classify = lambda update: LLM
+        self._pools = {lane: asyncio.Semaphore(limit) for lane, limit in self.limits.items()}
+        self._user_tails = {}
+        self.waiting = dict.fromkeys(self.limits, 0)
+        self.running = dict.fromkeys(self.limits, 0)
+        self.processed = dict.fromkeys(self.limits, 0)
+
+    async def do_process_update(self, update, coroutine) -> None:
+        enqueued = time.perf_counter()
+        user = getattr(update, "effective_user", None)
+        user_id = user.id if user is not None else None
+
+        previous = self._user_tails.get(user_id) if user_id is not None else None
+        done = asyncio.get_running_loop().create_future()
+        if user_id is not None:
+            self._user_tails[user_id] = done
+        try:
+            if previous is not None:
+                await previous
+            try:
+                lane = self.classify(update)
+            except Exception:
+                lane = LLM
+            if lane not in self._pools:
+                lane = LLM
+            pool = self._pools[lane]
+            self.waiting[lane] += 1
+            try:
+                await pool.acquire()
+            finally:
+                self.waiting[lane] -= 1
+            metrics.UPDATE_QUEUE_WAIT.observe(time.perf_counter() - enqueued, lane=lane)
+            self.running[lane] += 1
+            try:
+                await coroutine
+            finally:
+                self.running[lane] -= 1
+                self.processed[lane] += 1
+                pool.release()
+        finally:
+            if asyncio.iscoroutine(coroutine) and coroutine.cr_frame is not None and not coroutine.cr_running:
+                # Не дошли до обработки (отмена при остановке): закрываем без предупреждения
+                coroutine.close()
+            done.set_result(None)
+            if self._user_tails.get(user_id) is done:
+                del self._user_tails[user_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        stats = {"users_ordered": len(self._user_tails)}
+        for lane in self.limits:
+            stats[f"{lane}_waiting"] = self.waiting[lane]
+            stats[f"{lane}_running"] = self.running[lane]
+            stats[f"{lane}_processed"] = self.processed[lane]
+        return stats
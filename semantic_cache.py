@@ -0,0 +1,147 @@
+"""Кэш ответов LLM для почти одинаковых текстов пользователей.
+
+Сначала ищется точное совпадение нормализованного текста (регистр, ё,
+латинские двойники, пунктуация, пробелы). Если его нет — похожий текст по
+косинусной близости векторов символьных триграмм. Кандидаты берутся из
+обратного индекса по самым редким триграммам запроса, поэтому поиск не
+перебирает весь кэш. Похожий текст засчитывается, только если у него тот же
+набор значимых слов (с отрицаниями, по основам): близость триграмм не
+отличает «стоит ли» от «не стоит ли» и «квартиру» от «машину». Размер
+ограничен, вытесняются давно не использованные записи.
+"""
+import math
+import re
+import time
+from collections import OrderedDict
+
+from stop_words import normalize
+
+_NON_WORD = re.compile(r"[^\w]+")
+# Сколько самых редких триграмм запроса используется для поиска кандидатов
+_PROBE_GRAMS = 8
+# Служебные слова, которые не меняют смысл вопроса. Отрицания (не, ни, нет, без) сюда не входят
+_FUNCTION_WORDS = frozenset(
+    "а и или но же ли бы то это так вот ну в во на с со к ко о об обо у по за из от до для при про "
+    "над под через я ты он она мы вы они мне меня мой моя мое мои тебе тебя твой себя что как".split()
+)
+# Длина основы: разные окончания одного слова считаются одним словом
+_STEM_LENGTH = 5
+
+
+def normalize_text(text: str) -> str:
+    return _NON_WORD.sub(" ", normalize(text)).strip()
+
+
+def trigram_vector(normalized: str) -> dict:
+    counts = {}
+    for word in normalized.split():
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            gram = padded[i:i + 3]
+            counts[gram] = counts.get(gram, 0) + 1
+    norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+    return {gram: v / norm for gram, v in counts.items()}
+
+
+def content_words(normalized: str) -> frozenset:
+    """Основы значимых слов: похожие тексты с разным набором не считаются одним вопросом"""
+    return frozenset(word[:_STEM_LENGTH] for word in normalized.split() if word not in _FUNCTION_WORDS)
+
+
+def cosine(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(gram, 0.0) for gram, v in a.items())
+
+
+class SemanticCache:
+    def __init__(self, maxsize: int = 2048, threshold: float = 0.9, ttl: float = 7 * 24 * 3600):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        # нормализованный текст -> (вектор, ответ, токены ответа, время записи, значимые слова)
+        self._entries = OrderedDict()
+        # триграмма -> множество нормализованных текстов
+        self._index = {}
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    def _drop(self, key: str):
+        vector = self._entries.pop(key)[0]
+        for gram in vector:
+            postings = self._index.get(gram)
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self._index[gram]
+
+    def _alive(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        if time.time() - entry[3] > self.ttl:
+            self._drop(key)
+            return False
+        return True
+
+    def _hit(self, key: str):
+        self._entries.move_to_end(key)
+        entry = self._entries[key]
+        self.tokens_saved += entry[2]
+        return entry[1]
+
+    def get(self, text: str):
+        """Сохраненный ответ для такого же или достаточно похожего текста"""
+        key = normalize_text(text)
+        if not key:
+            return None
+        if self._alive(key):
+            self.exact_hits += 1
+            return self._hit(key)
+
+        vector = trigram_vector(key)
+        words = content_words(key)
+        probes = sorted((gram for gram in vector if gram in self._index), key=lambda g: len(self._index[g]))
+        candidates = set()
+        for gram in probes[:_PROBE_GRAMS]:
+            candidates |= self._index[gram]
+
+        best, best_score = None, self.threshold
+        for candidate in candidates:
+            entry = self._entries[candidate]
+            if entry[4] != words:
+                continue
+            score = cosine(vector, entry[0])
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is not None and self._alive(best):
+            self.similar_hits += 1
+            return self._hit(best)
+        self.misses += 1
+        return None
+
+    def put(self, text: str, answer: str, tokens: int = 0):
+        key = normalize_text(text)
+        if not key:
+            return
+        if key in self._entries:
+            self._drop(key)
+        vector = trigram_vector(key)
+        self._entries[key] = (vector, answer, tokens, time.time(), content_words(key))
+        for gram in vector:
+            self._index.setdefault(gram, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            "tokens_saved": self.tokens_saved,
+        }
@@ -0,0 +1,122 @@
+"""Общее хранилище ключ-значение для нескольких процессов бота.
+
+MemoryStore живет внутри процесса (один процесс, локальный запуск, проверки).
+RedisStore ходит в Redis или совместимый сервер (KeyDB, Dragonfly и т.п.)
+и нужен, когда обновления обрабатывают несколько воркеров. Значения —
+строки; сериализацией занимается вызывающий код.
+
+    store = open_store(os.getenv("SHARED_STORE_URL", ""))
+"""
+import time
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+
+class MemoryStore:
+    def __init__(self):
+        # ключ -> (значение, момент истечения или None)
+        self._data = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _alive(self, key: str):
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self._data[key]
+            item = None
+        return item
+
+    async def get(self, key: str):
+        item = self._alive(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return item[0]
+
+    async def set(self, key: str, value: str, ttl: float = None):
+        self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: float = None) -> int:
+        """Увеличить счетчик; ttl задается только при создании ключа"""
+        item = self._alive(key)
+        value = int(item[0]) + amount if item else amount
+        if item:
+            expires = item[1]
+        else:
+            expires = time.monotonic() + ttl if ttl else None
+        self._data[key] = (str(value), expires)
+        return value
+
+    def stats(self) -> dict:
+        return {"keys": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    async def close(self):
+        self._data.clear()
+
+
+class RedisStore:
+    def __init__(self, url: str, prefix: str = "dao:"):
+        if redis is None:
+            raise RuntimeError("Для SHARED_STORE_URL=redis://... нужен пакет redis")
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.from_url(url, decode_responses=True)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, key: str):
+        try:
+            value = await self._client.get(self.prefix + key)
+        except redis.RedisError:
+            # Общий кэш не должен ронять обработку: считаем промахом
+            self.errors += 1
+            return None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: str, ttl: float = None):
+        try:
+            await self._client.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+        except redis.RedisError:
+            self.errors += 1
+
+    async def delete(self, key: str):
+        try:
+            await self._client.delete(self.prefix + key)
+        except redis.RedisError:
+            self.errors += 1
+
+    async def incr(self, key: str, amount: int = 1, ttl: float = None) -> int:
+        value = await self._client.incrby(self.prefix + key, amount)
+        if ttl and value == amount:
+            # Ключ только что создан
+            await self._client.pexpire(self.prefix + key, int(ttl * 1000))
+        return value
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+    async def close(self):
+        # aclose появился в redis 5, в более старых версиях — close
+        close = getattr(self._client, "aclose", None) or self._client.close
+        await close()
+
+
+def open_store(url: str = ""):
+    """memory:// или пустая строка — MemoryStore, redis:// и rediss:// — RedisStore"""
+    if not url or url.startswith("memory://"):
+        return MemoryStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url)
+    raise ValueError(f"Неизвестное хранилище: {url}")
@@ -0,0 +1,56 @@
+"""Объединение одинаковых одновременных запросов к LLM.
+
+Если несколько пользователей одновременно запрашивают одно и то же
+(одинаковый нормализованный промпт и параметры), к прокси уходит только
+один запрос, а остальные ждут его результат.
+"""
+import asyncio
+import hashlib
+import json
+import re
+
+_SPACES = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _SPACES.sub(" ", text).strip().casefold()
+
+
+def request_key(model: str, messages: list, temperature: float, max_tokens: int) -> str:
+    payload = json.dumps(
+        [model, temperature, max_tokens,
+         [(m["role"], _normalize(m["content"])) for m in messages]],
+        ensure_ascii=False
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._in_flight = {}
+        self.calls = 0
+        self.saved = 0
+
+    async def do(self, key: str, factory):
+        """Выполнить factory() или присоединиться к уже идущему вызову с тем же ключом"""
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.saved += 1
+        else:
+            self.calls += 1
+            # Запрос живет отдельной задачей: отмена одного из ожидающих
+            # не отменяет ответ для остальных
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Помечаем исключение полученным, даже если все ожидающие ушли
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._in_flight), "calls": self.calls, "saved": self.saved}
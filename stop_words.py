@@ -0,0 +1,108 @@
+"""Поиск стоп-слов автоматом Ахо–Корасик.
+
+Автомат строится один раз по списку из stop_words.json и находит любое
+стоп-слово за один проход по тексту, независимо от длины списка. Текст и
+слова нормализуются одинаково: нижний регистр, ё → е, латинские буквы,
+похожие на кириллические, заменяются кириллицей.
+"""
+import threading
+from collections import OrderedDict, deque
+
+# Латинские двойники кириллических букв (с учетом заглавных: B, H, M, T)
+_HOMOGLYPHS = str.maketrans({
+    "a": "а", "b": "в", "c": "с", "e": "е", "h": "н", "k": "к",
+    "m": "м", "o": "о", "p": "р", "t": "т", "x": "х", "y": "у",
+    "ё": "е",
+})
+
+
+def normalize(text: str) -> str:
+    return text.lower().translate(_HOMOGLYPHS)
+
+
+class StopWordMatcher:
+    """Автомат по списку слов; после построения не меняется.
+
+    Память find общая для процесса, а не для обновления: результат зависит
+    только от текста, поэтому не устаревает и одинаков для всех
+    пользователей. Один и тот же вопрос проверяется несколько раз за
+    обновление (в диалоге и перед запросом к LLM), а короткие частые
+    сообщения повторяются и между пользователями. Объем ограничен memo_size
+    записей с вытеснением давно не запрошенных.
+    """
+
+    def __init__(self, words, memo_size: int = 4096):
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        # Узел автомата: переходы, ссылка неудачи, найденное слово
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [None]
+        self.size = 0
+
+        for word in words:
+            self._add(word)
+        self._build_links()
+
+    def _add(self, word: str):
+        pattern = normalize(word)
+        if not pattern:
+            return
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+            node = next_node
+        if self._output[node] is None:
+            self._output[node] = word
+        self.size += 1
+
+    def _build_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                # Наследуем слово по ссылке неудачи: более короткое слово,
+                # заканчивающееся в этой же позиции
+                if self._output[child] is None:
+                    self._output[child] = self._output[self._fail[child]]
+
+    def scan(self, text: str):
+        """Первое найденное стоп-слово (в исходном написании) или None"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        node = 0
+        for char in normalize(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node] is not None:
+                return output[node]
+        return None
+
+    def find(self, text: str):
+        """То же, что scan, но с запоминанием результата для уже проверенных текстов"""
+        with self._lock:
+            if text in self._memo:
+                self._memo.move_to_end(text)
+                return self._memo[text]
+
+        term = self.scan(text)
+        with self._lock:
+            self._memo[text] = term
+            if len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return term
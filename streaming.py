@@ -0,0 +1,93 @@
+"""Потоковая выдача ответов LLM в Telegram.
+
+Пользователь сразу получает сообщение-заглушку, которое затем
+редактируется накопленным текстом не чаще одного раза в min_interval
+секунд (лимиты Telegram на редактирование). Клавиатура оценки
+прикрепляется финальным редактированием.
+"""
+import asyncio
+import time
+
+from telegram.error import BadRequest, RetryAfter
+
+import metrics
+from resilience import CircuitOpenError
+
+PLACEHOLDER = "⏳"
+CURSOR = " ▌"
+
+# Для потоковых ответов задержкой считается время до первого фрагмента
+stats = {"streams": 0, "errors": 0, "ttfb_sum": 0.0, "duration_sum": 0.0}
+
+
+async def _edit(message, text: str, **kwargs):
+    try:
+        await message.edit_text(text, **kwargs)
+    except BadRequest as e:
+        if "not modified" in str(e).lower():
+            return
+        if kwargs.get("parse_mode"):
+            # Частичная или неудачная разметка от модели — отправляем как есть
+            kwargs.pop("parse_mode")
+            await message.edit_text(text, **kwargs)
+        else:
+            raise
+
+
+async def stream_reply(message, chunks, *, header: str = "", footer: str = "",
+                       reply_markup=None, final_markup=None, parse_mode: str = None,
+                       min_interval: float = 1.5, error_text: str = None, unavailable_text: str = None):
+    """Отправить заглушку и дописывать ее фрагментами из chunks.
+
+    При ошибке без полученного текста заглушка заменяется на error_text, а если
+    размыкатель не пустил запрос к прокси (CircuitOpenError) — на unavailable_text.
+    Возвращает (полный текст ответа, время до первого фрагмента в секундах).
+    """
+    started = time.monotonic()
+    placeholder = await message.reply_text(header + PLACEHOLDER, reply_markup=reply_markup)
+
+    text = ""
+    ttfb = None
+    last_edit = time.monotonic()
+    shown = ""
+    try:
+        async for chunk in chunks:
+            if ttfb is None:
+                ttfb = time.monotonic() - started
+            text += chunk
+            now = time.monotonic()
+            if now - last_edit >= min_interval and text.strip() != shown:
+                shown = text.strip()
+                try:
+                    await _edit(placeholder, header + shown + CURSOR)
+                except RetryAfter as e:
+                    # Пропускаем промежуточные правки, пока Telegram просит подождать
+                    last_edit = now + e.retry_after
+                    continue
+                last_edit = now
+    except Exception as e:
+        stats["errors"] += 1
+        fallback = text.strip() or (
+            unavailable_text if isinstance(e, CircuitOpenError) and unavailable_text else error_text
+        )
+        if fallback:
+            await _edit(placeholder, header + fallback)
+        raise
+
+    for attempt in range(3):
+        try:
+            await _edit(placeholder, header + text.strip() + footer,
+                        reply_markup=final_markup, parse_mode=parse_mode)
+            break
+        except RetryAfter as e:
+            if attempt == 2:
+                raise
+            await asyncio.sleep(e.retry_after)
+
+    duration = time.monotonic() - started
+    ttfb = ttfb if ttfb is not None else duration
+    stats["streams"] += 1
+    stats["ttfb_sum"] += ttfb
+    metrics.LLM_STREAM_TTFB.observe(ttfb, handler=metrics.current_handler.get())
+    stats["duration_sum"] += duration
+    return text.strip(), ttfb
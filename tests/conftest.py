@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.fixture
+def bot_module(monkeypatch, tmp_path):
+    """Модуль бота, импортированный во временном каталоге с заглушечными ключами"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TELEGRAM_TOKEN", "123456:TESTS")
+    monkeypatch.setenv("PROXY_API_KEY", "tests")
+    import main
+    return main
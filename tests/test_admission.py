@@ -0,0 +1,66 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import admission
+from admission import AdmissionController
+from shared_store import MemoryStore
+
+
+def reserve_all(controller, user_ids):
+    async def scenario():
+        return [await controller.reserve(user_id) for user_id in user_ids]
+    return asyncio.run(scenario())
+
+
+def test_user_bucket_allows_burst_then_sheds_only_that_user():
+    controller = AdmissionController(user_rate=1, user_burst=2, max_wait=0)
+    assert reserve_all(controller, [1, 1, 1, 2]) == [0.0, 0.0, None, 0.0]
+    assert controller.stats()["shed"] == 1
+
+
+def test_user_bucket_queues_within_max_wait():
+    controller = AdmissionController(user_rate=1, user_burst=1, max_wait=5)
+    first, second, third = reserve_all(controller, [1, 1, 1])
+    assert first == 0.0
+    assert second == pytest.approx(1.0, abs=0.05)
+    # Корзина в минусе: следующий ждет за предыдущим
+    assert third == pytest.approx(2.0, abs=0.05)
+    assert controller.stats()["queued"] == 2
+
+
+def test_global_bucket_sheds_and_refunds_user_token():
+    controller = AdmissionController(user_rate=1, user_burst=1, global_rate=20, global_burst=1, max_wait=0)
+    assert reserve_all(controller, [1, 2]) == [0.0, None]
+    # Общая корзина успевает наполниться, а своя у пользователя 2 — нет:
+    # пропуск возможен только если отказ вернул ему токен
+    time.sleep(0.06)
+    assert reserve_all(controller, [2]) == [0.0]
+
+
+def test_shared_store_limits_all_workers(monkeypatch):
+    # Все резервирования — в одном посекундном окне
+    monkeypatch.setattr(admission, "time", SimpleNamespace(time=lambda: 1000.25, monotonic=time.monotonic))
+    store = MemoryStore()
+    workers = [AdmissionController(user_rate=0, user_burst=1, global_rate=2, max_wait=1, store=store)
+               for _ in range(2)]
+
+    async def scenario():
+        return [await worker.reserve(user_id) for user_id, worker in enumerate(workers * 3)]
+
+    delays = asyncio.run(scenario())
+    # Два места в окне 1000, два в окне 1001, остальным ждать дольше max_wait
+    assert delays == [0.0, 0.0, 0.75, 0.75, None, None]
+
+
+def test_store_error_falls_back_to_local_bucket():
+    class BrokenStore:
+        async def incr(self, key, amount=1, ttl=None):
+            raise ConnectionError("хранилище недоступно")
+
+    controller = AdmissionController(user_rate=0, user_burst=1, global_rate=1, global_burst=1,
+                                     max_wait=0, store=BrokenStore())
+    assert reserve_all(controller, [1, 2]) == [0.0, None]
+    assert controller.stats()["store_errors"] == 2
@@ -0,0 +1,53 @@
+import json
+
+from analytics import Aggregate, analyze, build_report, iter_user_ids, log_parts
+
+
+def test_worker_logs_are_read_with_main_log(tmp_path):
+    log = tmp_path / "user_sessions.txt"
+    files = {
+        "user_sessions.txt": 1,
+        "user_sessions.txt.20250101-120000": 2,
+        "user_sessions.txt.w0": 3,
+        "user_sessions.txt.w1.20250101-120000": 4,
+        "user_sessions.txt.bak": 5,
+    }
+    for name, user_id in files.items():
+        line = {"user_id": user_id, "action": "start", "timestamp": "2025-01-01T00:00:00"}
+        (tmp_path / name).write_text(json.dumps(line) + "\n", encoding="utf-8")
+
+    assert [part.rsplit("/", 1)[-1] for part in log_parts(str(log))] == [
+        "user_sessions.txt.20250101-120000", "user_sessions.txt.w0",
+        "user_sessions.txt.w1.20250101-120000", "user_sessions.txt",
+    ]
+    assert sorted(iter_user_ids(str(log))) == [1, 2, 3, 4]
+    checkpoint = tmp_path / "checkpoint.json"
+    analyze(str(log), str(checkpoint), jobs=1)
+    # Текущие журналы воркеров дописываются дальше и не считаются прочитанными целиком
+    assert len(json.loads(checkpoint.read_text(encoding="utf-8"))["complete"]) == 2
+
+
+def record(user_id, action, details=""):
+    line = {"user_id": user_id, "action": action, "details": details, "timestamp": "2025-01-01T00:00:00"}
+    return json.dumps(line, ensure_ascii=False).encode("utf-8")
+
+
+def test_hexagrams_count_advice_and_divination():
+    totals = Aggregate()
+    totals.add_line(record(1, "Сгенерирован совет", "Вопрос: как быть?\nГексаграмма: 11 Мир\nСовет: ..."))
+    totals.add_line(record(2, "Генерация гексаграммы", "Номер: 11, Название: Мир, Изменяющиеся линии: [1]"))
+    totals.add_line(record(2, "Генерация гексаграммы", "Номер: 2, Название: Исполнение, Изменяющиеся линии: []"))
+    restored = Aggregate.from_dict(totals.to_dict())
+
+    rows = {row["hexagram"]: row for row in build_report(restored, "hexagrams")}
+    assert (rows[11]["advice"], rows[11]["divination"], rows[11]["count"]) == (1, 1, 2)
+    assert (rows[2]["advice"], rows[2]["divination"], rows[2]["share"]) == (0, 1, round(1 / 3, 4))
+
+
+def test_custom_question_passes_confirmation_step():
+    totals = Aggregate()
+    for user_id, confirmation in ((1, "Подтверждение вопроса"), (2, "Запрос своего варианта")):
+        for action in ("Начало помощи в формулировке", "Формулировка проблемы", confirmation, "Сгенерирован совет"):
+            totals.add_line(record(user_id, action))
+
+    assert [row["reached"] for row in build_report(totals, "funnel")] == [2, 2, 2, 2]
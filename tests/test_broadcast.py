@@ -0,0 +1,40 @@
+import asyncio
+import json
+
+
+class RecordingBot:
+    def __init__(self):
+        self.chat_ids = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.chat_ids.append(chat_id)
+
+
+class Status:
+    def __init__(self):
+        self.texts = []
+
+    async def edit_text(self, text):
+        self.texts.append(text)
+
+
+def write_log(path, user_ids):
+    with open(path, "w", encoding="utf-8") as f:
+        for user_id in user_ids:
+            f.write(json.dumps({"user_id": user_id, "action": "Старт"}) + "\n")
+
+
+def test_worker_broadcast_reaches_users_from_every_log(bot_module, monkeypatch, tmp_path):
+    base = tmp_path / "user_sessions.txt"
+    write_log(base, [1, 2])
+    write_log(f"{base}.w0", [2, 3])
+    write_log(f"{base}.w1", [4, -100])
+    # Рассылку запускает воркер 0: пишет он в свой журнал, а получателей берет из всех
+    monkeypatch.setattr(bot_module, "USER_SESSIONS_LOG", str(base))
+    monkeypatch.setattr(bot_module, "USER_SESSIONS_FILE", f"{base}.w0")
+
+    bot, status = RecordingBot(), Status()
+    asyncio.run(bot_module.run_broadcast(bot, "Новости", status))
+
+    assert sorted(bot.chat_ids) == [1, 2, 3, 4]
+    assert "Отправлено: 4" in status.texts[-1]
@@ -0,0 +1,29 @@
+import random
+
+from casting import CHI2_CRITICAL, DEFAULT_WEIGHTS, OUTCOMES, CastingEngine
+
+
+def legacy_numbers(lines):
+    """Номера основной и преобразованной гексаграмм так, как их считал прежний generate_hexagram"""
+    primary = ''.join('1' if x in ('Ян', 'ЯнСтарый') else '0' for x in reversed(lines))
+    flipped = {"ЯнСтарый": "Инь", "ИньСтарый": "Ян"}
+    moved = [flipped.get(x, x) for x in lines]
+    transformed = ''.join('1' if x in ('Ян', 'ЯнСтарый') else '0' for x in reversed(moved))
+    return int(primary, 2) + 1, int(transformed, 2) + 1
+
+
+def test_tables_match_legacy_numbering():
+    engine = CastingEngine(DEFAULT_WEIGHTS)
+    assert abs(sum(engine.probabilities) - 1.0) < 1e-9
+    for outcome in range(OUTCOMES):
+        lines = list(engine.lines[outcome])
+        assert legacy_numbers(lines) == (engine.primary[outcome], engine.transformed[outcome])
+        assert list(engine.changing_lines[outcome]) == [i for i, x in enumerate(lines, 1) if "Старый" in x]
+
+
+def test_line_frequencies_follow_weights():
+    engine = CastingEngine(DEFAULT_WEIGHTS, rng=random.Random(7))
+    single = [engine.sample() for _ in range(50000)]
+    batch = engine.sample_batch(200000, seed=7)
+    for outcomes in (single, batch):
+        assert engine.chi_square(engine.line_counts(outcomes)) < CHI2_CRITICAL
@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+from file_id_cache import FileIdCache, image_key
+
+
+def test_memory_miss_falls_back_to_database(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "file_ids.db")
+        first, second = FileIdCache(path), FileIdCache(path)
+        second.open()
+        # Картинку загрузил другой воркер уже после старта этого
+        await first.put(image_key(11, 3), "AgAD-11-3", 2048)
+        assert await second.get(image_key(11, 3)) == "AgAD-11-3"
+        second.record_hit(image_key(11, 3))
+        assert second.stats()["bytes_saved"] == 2048
+        assert await second.get(image_key(12, 0)) is None
+
+        await first.invalidate(image_key(11, 3))
+        assert await FileIdCache(path).get(image_key(11, 3)) is None
+        first.close()
+        second.close()
+
+    asyncio.run(scenario())
+
+
+class Message:
+    def __init__(self, error):
+        self.error = error
+        self.photos = []
+
+    async def reply_photo(self, photo):
+        self.photos.append(photo)
+        if isinstance(photo, str):
+            raise self.error
+        return SimpleNamespace(photo=[SimpleNamespace(file_id="AgAD-new")])
+
+    async def reply_text(self, text, **kwargs):
+        pass
+
+
+def send(bot_module, monkeypatch, tmp_path, error):
+    cache = FileIdCache(str(tmp_path / "file_ids.db"))
+    errors = []
+
+    async def log_error(text):
+        errors.append(text)
+
+    async def noop(*args, **kwargs):
+        pass
+
+    async def draw(number, changing_lines):
+        return b"png"
+
+    monkeypatch.setattr(bot_module, "photo_file_ids", cache)
+    monkeypatch.setattr(bot_module, "generate_hexagram", lambda: (11, [1, 2], []))
+    monkeypatch.setattr(bot_module, "draw_changing_lines", draw)
+    monkeypatch.setattr(bot_module, "log_user_action", noop)
+    monkeypatch.setattr(bot_module, "log_error", log_error)
+    message = Message(error)
+    update = SimpleNamespace(callback_query=None, message=message, effective_user=SimpleNamespace(
+        id=1, username="user", full_name="User"))
+
+    async def scenario():
+        await cache.put(image_key(11, 3), "AgAD-old", 2048)
+        await bot_module.send_hexagram(update, SimpleNamespace(user_data={}))
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        cache.close()
+    return cache, message, errors
+
+
+def test_rejected_file_id_is_replaced_by_upload(bot_module, monkeypatch, tmp_path):
+    error = BadRequest("Wrong file identifier/http url specified")
+    cache, message, errors = send(bot_module, monkeypatch, tmp_path, error)
+    assert message.photos == ["AgAD-old", b"png"]
+    assert asyncio.run(cache.get(image_key(11, 3))) == "AgAD-new"
+    assert cache.stats()["invalidated"] == 1 and len(errors) == 1
+
+
+def test_other_bad_request_is_not_treated_as_stale_file_id(bot_module, monkeypatch, tmp_path):
+    with pytest.raises(BadRequest):
+        send(bot_module, monkeypatch, tmp_path, BadRequest("Message to reply not found"))
@@ -0,0 +1,37 @@
+import asyncio
+
+from interpretation_cache import InterpretationCache, interpretation_key
+from shared_store import MemoryStore
+
+KEY = interpretation_key(12, [3], "Краткое толкование")
+
+
+def test_short_list_in_memory_sees_other_workers_variants(tmp_path):
+    async def scenario():
+        shared = MemoryStore()
+        first = InterpretationCache(str(tmp_path / "first.db"), variants=3, shared=shared)
+        second = InterpretationCache(str(tmp_path / "second.db"), variants=3, shared=shared)
+        assert await first.get(KEY) is None
+        for number in range(3):
+            await second.put(KEY, f"вариант {number}")
+        assert await first.get(KEY) in {"вариант 0", "вариант 1", "вариант 2"}
+        first.close()
+        second.close()
+
+    asyncio.run(scenario())
+
+
+def test_short_list_in_memory_sees_variants_on_shared_disk(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "interpretations.db")
+        first = InterpretationCache(path, variants=2)
+        second = InterpretationCache(path, variants=2)
+        await first.put(KEY, "первый")
+        assert await first.get(KEY) is None
+        await second.put(KEY, "второй")
+        assert await first.get(KEY) in {"первый", "второй"}
+        assert len(await first._entries(KEY)) == 2
+        first.close()
+        second.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,60 @@
+import gzip
+import os
+import time
+
+from analytics import ROTATED_SUFFIX
+from log_sink import LogSink
+
+
+def parts(tmp_path, name):
+    return sorted(p.name for p in tmp_path.iterdir() if p.name.startswith(name + "."))
+
+
+def test_rotates_by_size_and_compresses(tmp_path):
+    path = str(tmp_path / "user_sessions.txt")
+    sink = LogSink(batch_size=1, flush_interval=0.01)
+    # Строка — 15 байт: вторая в тот же файл уже не помещается
+    sink.configure(path, max_bytes=20, compress=True)
+    for i in range(3):
+        sink.write(path, f"строка {i}")
+    sink.stop()
+
+    rotated = parts(tmp_path, "user_sessions.txt")
+    assert len(rotated) == 2 and all(name.endswith(".gz") and ROTATED_SUFFIX.search(name) for name in rotated)
+    old = [gzip.open(tmp_path / name, "rt", encoding="utf-8").read() for name in rotated]
+    assert sorted(old) == ["строка 0\n", "строка 1\n"]
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "строка 2\n"
+
+
+def test_rotates_file_left_from_previous_day(tmp_path):
+    path = str(tmp_path / "error.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("вчера\n")
+    yesterday = time.time() - 86400
+    os.utime(path, (yesterday, yesterday))
+
+    sink = LogSink(flush_interval=0.01)
+    sink.configure(path, rotate_daily=True)
+    sink.write(path, "сегодня")
+    sink.stop()
+
+    (rotated,) = parts(tmp_path, "error.txt")
+    assert (tmp_path / rotated).read_text(encoding="utf-8") == "вчера\n"
+    with open(path, encoding="utf-8") as f:
+        assert f.read() == "сегодня\n"
+
+
+def test_stop_drains_queue_and_later_writes_go_to_disk(tmp_path):
+    path = str(tmp_path / "user_sessions.txt")
+    # Ни размер пачки, ни таймер не сработают до остановки
+    sink = LogSink(batch_size=10000, flush_interval=60)
+    for i in range(500):
+        sink.write(path, str(i))
+    sink.stop()
+    sink.write(path, "после остановки")
+
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines == [str(i) for i in range(500)] + ["после остановки"]
+    assert sink.stats()["written"] == 500 and sink.stats()["dropped"] == 0
@@ -0,0 +1,16 @@
+import asyncio
+
+from benchmarks import menu_router_bench
+
+
+def test_menu_handlers_select_the_same_callbacks_as_regex_chain(monkeypatch, tmp_path):
+    # prepare() переходит во временный каталог и ставит заглушечные ключи: monkeypatch вернет как было
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TELEGRAM_TOKEN", "123456:MENUBENCH")
+    monkeypatch.setenv("PROXY_API_KEY", "menu-bench")
+
+    async def scenario():
+        bot, current, legacy, updates = await menu_router_bench.prepare()
+        assert menu_router_bench.check_equivalence(bot, legacy, current, updates) == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,32 @@
+import asyncio
+import time
+
+from outbound import OutboundRateLimiter
+
+
+async def ok():
+    return True
+
+
+def test_edits_do_not_spend_chat_tokens():
+    async def scenario():
+        limiter = OutboundRateLimiter(global_rate=1000, private_rate=1, private_burst=1)
+        await limiter.initialize()
+        try:
+            async def call(endpoint):
+                return await limiter.process_request(ok, (), {}, endpoint, {"chat_id": 5}, None)
+
+            started = time.monotonic()
+            await call("sendMessage")
+            for _ in range(5):
+                await call("editMessageText")
+            edits = time.monotonic() - started
+            await call("sendMessage")
+            total = time.monotonic() - started
+        finally:
+            await limiter.shutdown()
+        assert edits < 0.5
+        # Второе сообщение в чат по-прежнему ждет своего токена
+        assert total >= 0.8
+
+    asyncio.run(scenario())
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+from telegram import Bot
+from telegram.ext import ApplicationBuilder, CommandHandler, ConversationHandler
+
+from persistence import SQLitePersistence
+
+
+async def noop(*args, **kwargs):
+    return None
+
+
+def test_idle_conversations_are_evicted_with_users(tmp_path, monkeypatch):
+    # getMe не нужен: проверяется только загрузка и сохранение диалогов
+    monkeypatch.setattr(Bot, "initialize", noop)
+    monkeypatch.setattr(Bot, "shutdown", noop)
+
+    async def scenario():
+        path = str(tmp_path / "state.db")
+        before = SQLitePersistence(path)
+        await before.update_conversation("hex", (1, 1), 1)
+        await before.update_conversation("hex", (2, 2), 1)
+        await before.flush()
+
+        persistence = SQLitePersistence(path, idle_ttl=0.2)
+        application = ApplicationBuilder().token("123456:TESTS").persistence(persistence).build()
+        application.add_handler(ConversationHandler(
+            entry_points=[CommandHandler("start", noop)],
+            states={1: [CommandHandler("next", noop)]},
+            fallbacks=[],
+            name="hex",
+            persistent=True,
+        ))
+        await application.initialize()
+        assert persistence.evict_idle(application) == 0
+
+        await asyncio.sleep(0.3)
+        # Второй пользователь вернулся: его диалог продолжается
+        await persistence.refresh_user_data(2, {})
+        assert persistence.evict_idle(application) == 1
+        assert persistence.stats()["conversations_in_memory"] == 1
+        # Завершение диалога доходит до базы через update_conversation при сохранении
+        await application.shutdown()
+
+        assert await SQLitePersistence(path).get_conversations("hex") == {(2, 2): 1}
+
+    asyncio.run(scenario())
+
+
+def test_eviction_without_conversation_dict_only_drops_users(tmp_path, caplog):
+    async def scenario():
+        persistence = SQLitePersistence(str(tmp_path / "state.db"), idle_ttl=0.1)
+        await persistence.refresh_user_data(1, {})
+        await asyncio.sleep(0.2)
+        dropped = []
+        application = SimpleNamespace(user_data={1: {"a": 1}}, drop_user_data=dropped.append)
+        with caplog.at_level(logging.WARNING, logger="persistence"):
+            assert persistence.evict_idle(application) == 1
+            assert persistence.evict_idle(application) == 0
+        assert dropped == [1]
+        # Предупреждение — один раз, а не на каждом проходе выгрузки
+        assert len(caplog.records) == 1
+        await persistence.flush()
+
+    asyncio.run(scenario())
@@ -0,0 +1,52 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from ratings_store import RatingsStore
+
+
+def write_ratings(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({"user_id": i % 7, "rate": "good" if i % 3 else "bad"}) + "\n")
+        # Строки, которые не являются объектами JSON, пропускаются
+        f.write('[]\n"x"\n42\n{broken\n')
+
+
+def test_import_skips_non_objects(tmp_path):
+    source = tmp_path / "ratings.json"
+    write_ratings(source, 30)
+    store = RatingsStore(str(tmp_path / "ratings.db"))
+    assert store.import_jsonl(str(source)) == 30
+    assert store.import_jsonl(str(source)) == 0
+    assert store.totals() == {"good": 20, "bad": 10, "users": 7}
+    store.close()
+
+
+def test_concurrent_imports_count_once(tmp_path):
+    source = tmp_path / "ratings.json"
+    write_ratings(source, 3000)
+    stores = [RatingsStore(str(tmp_path / "ratings.db")) for _ in range(4)]
+    with ThreadPoolExecutor(len(stores)) as pool:
+        imported = sorted(pool.map(lambda store: store.import_jsonl(str(source)), stores))
+    assert imported == [0, 0, 0, 3000]
+    assert stores[0].totals()["good"] + stores[0].totals()["bad"] == 3000
+    for store in stores:
+        store.close()
+
+
+def test_database_is_opened_on_first_use(tmp_path):
+    path = tmp_path / "ratings.db"
+    store = RatingsStore(str(path))
+    assert not path.exists()
+    store.add({"user_id": 1, "rate": "good"})
+    assert store.totals() == {"good": 1, "bad": 0, "users": 1}
+    store.close()
+
+
+def test_ratings_without_user_are_not_counted_as_users(tmp_path):
+    store = RatingsStore(str(tmp_path / "ratings.db"))
+    for _ in range(3):
+        store.add({"rate": "good"})
+    store.add({"user_id": 5, "rate": "bad"})
+    assert store.totals() == {"good": 3, "bad": 1, "users": 1}
+    store.close()
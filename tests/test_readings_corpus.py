@@ -0,0 +1,35 @@
+import struct
+
+import pytest
+
+from readings_corpus import HEADER, KEYS, ReadingsCorpus, pack, reading_index
+
+
+def test_packed_corpus_reads_back(tmp_path):
+    path = str(tmp_path / "readings.bin")
+    key = reading_index(11, [1, 6])
+    pack({key: ["Мир и согласие.", "Небо и земля сходятся."], 0: ["Творчество."]}, path, variants=2)
+
+    corpus = ReadingsCorpus(path)
+    assert corpus.keys == 0  # без open() файл не читается
+    corpus.open()
+    assert corpus.keys == 2
+    assert corpus.variants(11, [6, 1]) == ["Мир и согласие.", "Небо и земля сходятся."]
+    assert corpus.variants(1, []) == ["Творчество."]
+    assert corpus.get(2, [3]) is None
+    assert corpus.stats() == {"keys": 2, "hits": 0, "misses": 1}
+    corpus.close()
+
+
+def test_corrupt_corpus_stays_empty(tmp_path):
+    foreign = tmp_path / "foreign.bin"
+    foreign.write_bytes(HEADER.pack(b"NOTDAO", 1, 3, KEYS))
+    truncated = tmp_path / "truncated.bin"
+    truncated.write_bytes(HEADER.pack(b"DAORC1", 1, 3, KEYS) + b"\0" * 10)
+
+    for path, error in ((foreign, ValueError), (truncated, struct.error)):
+        corpus = ReadingsCorpus(str(path))
+        with pytest.raises(error):
+            corpus.open()
+        assert corpus.keys == 0
+        assert corpus.get(1, []) is None
@@ -0,0 +1,112 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from llm_gateway import LLMGateway
+from resilience import CircuitBreaker, CircuitOpenError
+from usage_ledger import UsageLedger
+
+REQUEST = httpx.Request("POST", "http://proxy.test/v1/chat/completions")
+MESSAGES = [{"role": "user", "content": "вопрос"}]
+RESPONSE = SimpleNamespace(usage=None)
+
+
+def make_gateway(create):
+    gateway = LLMGateway(
+        api_key="test", base_url="http://proxy.test/v1", model="gpt-4.1-mini", retries=0,
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    )
+    gateway._create = create
+    return gateway
+
+
+async def complete(gateway):
+    return await gateway.complete(MESSAGES, temperature=0.5, max_tokens=10)
+
+
+async def open_breaker(gateway, calls):
+    calls.append(httpx.ConnectError("нет соединения"))
+    with pytest.raises(httpx.ConnectError):
+        await complete(gateway)
+    assert gateway.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        await complete(gateway)
+    await asyncio.sleep(0.06)
+    assert gateway.breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def scripted(calls):
+    async def create(**kwargs):
+        outcome = calls.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        if outcome == "hang":
+            await asyncio.sleep(3600)
+        return outcome
+    return create
+
+
+def test_non_retryable_probe_closes_breaker():
+    async def scenario():
+        calls = []
+        gateway = make_gateway(scripted(calls))
+        await open_breaker(gateway, calls)
+        # 400 на пробный запрос: прокси ответил, значит доступен
+        calls.append(openai.BadRequestError("bad", response=httpx.Response(400, request=REQUEST), body=None))
+        with pytest.raises(openai.BadRequestError):
+            await complete(gateway)
+        assert gateway.breaker.state == CircuitBreaker.CLOSED
+        assert gateway.available()
+        calls.append(RESPONSE)
+        assert await complete(gateway) is RESPONSE
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_frees_slot():
+    async def scenario():
+        calls = []
+        gateway = make_gateway(scripted(calls))
+        await open_breaker(gateway, calls)
+        calls.append("hang")
+        probe = asyncio.create_task(complete(gateway))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert gateway.breaker.state == CircuitBreaker.HALF_OPEN
+        # Слот пробы свободен: следующий запрос доходит до прокси
+        calls.append(RESPONSE)
+        assert await complete(gateway) is RESPONSE
+        assert gateway.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_hedge_is_charged_to_ledger(tmp_path):
+    async def scenario():
+        ledger = UsageLedger(str(tmp_path / "usage.db"))
+        gateway = LLMGateway(
+            api_key="test", base_url="http://proxy.test/v1", model="gpt-4.1-mini", retries=0,
+            hedge_percentile=50, ledger=ledger
+        )
+        for _ in range(gateway.latencies.min_samples):
+            gateway.latencies.observe(0.01)
+        usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=500)
+        calls = scripted(["hang", SimpleNamespace(usage=usage)])
+        gateway._get_client = lambda: SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=calls)))
+
+        response = await gateway.complete(MESSAGES, temperature=0.5, max_tokens=10, user_id=7)
+        assert response.usage is usage
+        # Первый запрос отменен после дубля, но прокси его выполнил: в учете оба
+        assert gateway.stats()["hedges_cancelled"] == 1
+        cost = ledger.cost("gpt-4.1-mini", 1000, 500)
+        assert ledger.totals()["calls"] == 2
+        assert ledger.stats()["estimated"] == 1
+        assert await ledger.spent_today(7) == pytest.approx(2 * cost)
+        ledger.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+from telegram import Update
+from telegram.ext import ConversationHandler, MessageHandler, filters
+
+import menu_router
+from menu_router import MenuHandler, RoutedConversation
+from scheduler import FAST, LLM, fast_lane, handler_lane
+
+CHOOSING = 1
+
+
+@fast_lane
+async def show_menu(update, context):
+    pass
+
+
+async def ask_llm(update, context):
+    pass
+
+
+def text_update(text: str) -> Update:
+    user = {"id": 7, "is_bot": False, "first_name": "Test"}
+    return Update.de_json({
+        "update_id": 1,
+        "message": {
+            "message_id": 1, "date": 0, "text": text,
+            "chat": {"id": 7, "type": "private"}, "from": user,
+        },
+    }, None)
+
+
+def build_handlers():
+    conversation = RoutedConversation(
+        entry_points=[MenuHandler({"Толкование": show_menu})],
+        states={CHOOSING: [MenuHandler({"Кратко": show_menu}, default=ask_llm)]},
+        fallbacks=[],
+    )
+    conversation._conversations[(7, 7)] = CHOOSING
+    return [MenuHandler({"Старт": show_menu}), conversation, MessageHandler(filters.TEXT, ask_llm)]
+
+
+def test_lane_selection_is_reused_by_application(monkeypatch):
+    handlers = build_handlers()
+    application = SimpleNamespace(handlers={0: handlers})
+    calls = []
+    monkeypatch.setattr(menu_router, "normalize", lambda text: calls.append(text) or text)
+
+    update = text_update("12")
+    assert handler_lane(application, update) == LLM
+    selected = calls.copy()
+    # Второй проход, как в Application.process_update: обработчик уже выбран
+    results = [handler.check_update(update) for handler in handlers[:2]]
+    assert calls == selected
+    assert results[0] is None
+    assert results[1][2].__class__ is MenuHandler and results[1][3] is ask_llm
+
+    assert handler_lane(application, text_update("Кратко")) == FAST
+
+
+def test_other_update_is_checked_again():
+    handlers = build_handlers()
+    application = SimpleNamespace(handlers={0: handlers})
+    handler_lane(application, text_update("12"))
+    other = text_update("Кратко")
+    assert handlers[0].check_update(other) is None
+    assert handlers[1].check_update(other)[3] is show_menu
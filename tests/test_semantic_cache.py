@@ -0,0 +1,30 @@
+import pytest
+
+from semantic_cache import SemanticCache
+
+ANSWER = "ответ"
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("Стоит ли мне уходить с работы?", "стоит ли уходить с работы"),
+    ("Как мне найти работу?", "как найти работу"),
+    ("Что делать, если начальник не ценит?", "что делать если начальник не ценит меня"),
+])
+def test_rephrased_question_hits(cached, asked):
+    cache = SemanticCache()
+    cache.put(cached, ANSWER)
+    assert cache.get(asked) == ANSWER
+    assert cache.stats()["similar_hits"] == 1
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("Стоит ли мне уходить с работы?", "Не стоит ли мне уходить с работы?"),
+    ("Брать ли кредит на машину", "Брать ли кредит на квартиру"),
+    ("Стоит ли переезжать в Москву", "Стоит ли переезжать в Казань"),
+    ("Толкование гексаграммы 12", "Толкование гексаграммы 13"),
+])
+def test_different_meaning_misses(cached, asked):
+    for threshold in (0.9, 0.5):
+        cache = SemanticCache(threshold=threshold)
+        cache.put(cached, ANSWER)
+        assert cache.get(asked) is None
@@ -0,0 +1,19 @@
+from stop_words import StopWordMatcher, normalize
+
+
+def test_latin_homoglyphs_inside_cyrillic_word_are_found():
+    matcher = StopWordMatcher(["кокаин", "смерть"])
+    # "o" и "a" здесь латинские, как и "C" и "p" в "Cмеpть"
+    assert normalize("кoкaин") == "кокаин"
+    assert matcher.scan("где взять кoкaин?") == "кокаин"
+    assert matcher.scan("Cмеpть близко") == "смерть"
+    assert matcher.scan("кокон") is None
+
+
+def test_yo_and_ye_match_each_other():
+    matcher = StopWordMatcher(["зарезать", "ёж"])
+    assert normalize("ЁЛКА") == "елка"
+    assert matcher.scan("Ёж во дворе") == "ёж"
+    assert matcher.scan("еж во дворе") == "ёж"
+    assert matcher.scan("зарёзать") == "зарезать"
+
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from resilience import CircuitOpenError
+from streaming import stream_reply
+
+
+class Message:
+    def __init__(self):
+        self.texts = []
+
+    async def reply_text(self, text, **kwargs):
+        self.texts.append(text)
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        self.texts.append(text)
+
+
+def failing(error):
+    async def chunks():
+        raise error
+        yield ""
+    return chunks()
+
+
+@pytest.mark.parametrize("error, shown", [
+    (CircuitOpenError("LLM-прокси недоступен"), "недоступен"),
+    (RuntimeError("обрыв"), "ошибка"),
+])
+def test_failed_stream_replaces_placeholder(error, shown):
+    message = Message()
+    with pytest.raises(type(error)):
+        asyncio.run(stream_reply(message, failing(error), header="> ",
+                                 error_text="ошибка", unavailable_text="недоступен"))
+    assert message.texts == ["> ⏳", f"> {shown}"]
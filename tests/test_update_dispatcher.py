@@ -0,0 +1,18 @@
+import time
+
+from update_dispatcher import UpdateDispatcher
+
+
+def stuck_worker(index, updates):
+    time.sleep(60)
+
+
+def test_stop_does_not_hang_on_full_queue_of_stuck_worker():
+    dispatcher = UpdateDispatcher(2, stuck_worker, max_queue=1)
+    dispatcher.start()
+    for updates in dispatcher._queues:
+        updates.put({"update_id": 1})
+    started = time.monotonic()
+    dispatcher.stop(timeout=1.0)
+    assert time.monotonic() - started < 10
+    assert dispatcher.alive() == 0
@@ -0,0 +1,21 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from web_server import WebServer
+
+
+def test_webhook_rejects_non_updates():
+    async def scenario():
+        application = SimpleNamespace(update_queue=asyncio.Queue(), bot=None)
+        server = WebServer(application, webhook_path="/hook")
+        async with TestClient(TestServer(server.app)) as client:
+            for body in ("[]", '"x"', "42", "{}", "{broken"):
+                response = await client.post("/hook", data=body, headers={"Content-Type": "application/json"})
+                assert response.status == 400, body
+            response = await client.post("/hook", json={"update_id": 1})
+            assert response.status == 200
+        assert application.update_queue.qsize() == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,110 @@
+"""Раздача обновлений по процессам-воркерам.
+
+Входной процесс получает обновления (polling или вебхук) и отправляет
+каждое в очередь воркера, выбранного по chat_id. Все обновления одного
+чата попадают к одному воркеру в порядке поступления, поэтому его
+user_data и состояние диалога живут в одном процессе. Воркеры запускаются
+через spawn: SQLite-соединения и потоки входного процесса не наследуются.
+"""
+import asyncio
+import multiprocessing
+import queue
+import time
+
+from telegram import Update
+
+
+def shard_for(update: Update, workers: int) -> int:
+    if update.effective_chat is not None:
+        key = update.effective_chat.id
+    elif update.effective_user is not None:
+        key = update.effective_user.id
+    else:
+        key = update.update_id
+    return key % workers
+
+
+class UpdateDispatcher:
+    def __init__(self, workers: int, target, max_queue: int = 10000):
+        self.workers = workers
+        self.target = target
+        self.max_queue = max_queue
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = []
+        self._processes = []
+        self.dispatched = [0] * workers
+        self.dropped = 0
+
+    def start(self):
+        """Запустить воркеры: target(index, queue) в отдельном процессе"""
+        for index in range(self.workers):
+            updates = self._context.Queue(maxsize=self.max_queue)
+            process = self._context.Process(
+                target=self.target, args=(index, updates), name=f"bot-worker-{index}", daemon=True
+            )
+            process.start()
+            self._queues.append(updates)
+            self._processes.append(process)
+
+    def dispatch(self, update: Update):
+        index = shard_for(update, self.workers)
+        try:
+            self._queues[index].put_nowait(update.to_dict())
+            self.dispatched[index] += 1
+        except queue.Full:
+            # Воркер не успевает: обновление теряется, это видно по счетчику dropped
+            self.dropped += 1
+
+    async def forward(self, update_queue: asyncio.Queue):
+        """Фоновая задача входного процесса: из очереди Updater в очереди воркеров"""
+        while True:
+            update = await update_queue.get()
+            self.dispatch(update)
+
+    def alive(self) -> int:
+        return sum(1 for process in self._processes if process.is_alive())
+
+    def stats(self) -> dict:
+        stats = {"workers_alive": self.alive(), "dropped": self.dropped}
+        for index, count in enumerate(self.dispatched):
+            stats[f"dispatched_{index}"] = count
+        return stats
+
+    def stop(self, timeout: float = 30.0):
+        """Отправить воркерам сигнал остановки и дождаться, пока они допишут очереди"""
+        deadline = time.monotonic() + timeout
+        for updates, process in zip(self._queues, self._processes):
+            if not process.is_alive():
+                continue
+            try:
+                updates.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                # Воркер завис и не разбирает полную очередь: сигнал не поместится
+                process.terminate()
+        for updates, process in zip(self._queues, self._processes):
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            # Недоставленные обновления остановленного воркера не должны задерживать выход
+            updates.cancel_join_thread()
+
+
+def _next(updates):
+    # Раз в секунду проверяем, жив ли входной процесс, чтобы не остаться сиротой
+    while True:
+        try:
+            return updates.get(timeout=1.0)
+        except queue.Empty:
+            parent = multiprocessing.parent_process()
+            if parent is not None and not parent.is_alive():
+                return None
+
+
+async def consume(updates, application):
+    """Цикл воркера: переносит обновления из очереди процесса в очередь Application до None"""
+    while True:
+        data = await asyncio.to_thread(_next, updates)
+        if data is None:
+            return
+        await application.update_queue.put(Update.de_json(data, application.bot))
@@ -0,0 +1,194 @@
+"""Учет токенов и стоимости запросов к LLM.
+
+Каждый вызов модели (пользователь, обработчик, модель, токены запроса и
+ответа, задержка, оценка стоимости) дописывается строкой в таблицу llm_calls
+на SQLite: только вставки, строки старше retention_days удаляются раз в
+сутки. В той же транзакции обновляются суточные итоги по пользователю,
+обработчику и модели, поэтому /spend и проверка дневного бюджета читают
+несколько агрегированных строк, а не всю историю. База общая для воркеров
+на одной машине: бюджет пользователя считается по всем процессам.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+# Цены за 1 млн токенов: (запрос, ответ)
+PRICES = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+USER, HANDLER, MODEL = "user", "handler", "model"
+# Суточные итоги хранятся дольше отдельных вызовов
+AGGREGATE_DAYS = 400
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка для ответов без usage: около трех символов русского текста на токен"""
+    return max(1, len(text) // 3) if text else 0
+
+
+def usage_tokens(usage) -> tuple:
+    """(токены запроса, токены ответа) из usage ответа API или из словаря в потоке"""
+    if usage is None:
+        return 0, 0
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0
+
+
+class UsageLedger:
+    def __init__(self, path: str, prices: dict = None, retention_days: int = 30):
+        self.path = path
+        self.prices = dict(PRICES)
+        self.prices.update(prices or {})
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._db = None
+        self._pruned_on = None
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_total = 0.0
+        self.estimated = 0
+        self.write_errors = 0
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS llm_calls (
+                    id INTEGER PRIMARY KEY,
+                    time REAL NOT NULL,
+                    user_id INTEGER,
+                    handler TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    completion_tokens INTEGER NOT NULL,
+                    latency_ms INTEGER NOT NULL,
+                    cost REAL NOT NULL,
+                    estimated INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_llm_calls_time ON llm_calls(time);
+                CREATE TABLE IF NOT EXISTS llm_usage_daily (
+                    day TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    calls INTEGER NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    completion_tokens INTEGER NOT NULL,
+                    cost REAL NOT NULL,
+                    PRIMARY KEY (day, kind, name)
+                ) WITHOUT ROWID;
+            """)
+            self._db.commit()
+        return self._db
+
+    def open(self):
+        """Подключиться заранее, чтобы первая запись вызова не ждала создания таблиц"""
+        with self._lock:
+            self._connect()
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        prompt_price, completion_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+    def _insert(self, row: tuple):
+        when, user_id, handler, model, prompt_tokens, completion_tokens, latency_ms, cost, estimated = row
+        day = datetime.fromtimestamp(when).date().isoformat()
+        with self._lock:
+            self._connect()
+            self._db.execute(
+                "INSERT INTO llm_calls (time, user_id, handler, model, prompt_tokens, completion_tokens, "
+                "latency_ms, cost, estimated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row
+            )
+            for kind, name in ((USER, str(user_id)), (HANDLER, handler), (MODEL, model)):
+                if kind == USER and user_id is None:
+                    continue
+                self._db.execute(
+                    "INSERT INTO llm_usage_daily (day, kind, name, calls, prompt_tokens, completion_tokens, cost) "
+                    "VALUES (?, ?, ?, 1, ?, ?, ?) ON CONFLICT(day, kind, name) DO UPDATE SET "
+                    "calls = calls + 1, prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                    "completion_tokens = completion_tokens + excluded.completion_tokens, cost = cost + excluded.cost",
+                    (day, kind, name, prompt_tokens, completion_tokens, cost)
+                )
+            if self._pruned_on != day:
+                self._prune()
+                self._pruned_on = day
+            self._db.commit()
+
+    def _prune(self):
+        self._db.execute("DELETE FROM llm_calls WHERE time < ?", (time.time() - self.retention_days * 86400,))
+        oldest = (date.today() - timedelta(days=AGGREGATE_DAYS)).isoformat()
+        self._db.execute("DELETE FROM llm_usage_daily WHERE day < ?", (oldest,))
+
+    async def record(self, user_id, handler: str, model: str, prompt_tokens: int, completion_tokens: int,
+                     latency: float, estimated: bool = False):
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost_total += cost
+        self.estimated += estimated
+        row = (time.time(), user_id, handler, model, prompt_tokens, completion_tokens,
+               round(latency * 1000), cost, int(estimated))
+        try:
+            await asyncio.to_thread(self._insert, row)
+        except sqlite3.Error:
+            # Учет не должен ломать ответ пользователю
+            self.write_errors += 1
+
+    def _spent(self, user_id, day: str) -> float:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT cost FROM llm_usage_daily WHERE day = ? AND kind = ? AND name = ?",
+                (day, USER, str(user_id))
+            ).fetchone()
+        return row[0] if row else 0.0
+
+    async def spent_today(self, user_id) -> float:
+        return await asyncio.to_thread(self._spent, user_id, date.today().isoformat())
+
+    def top(self, kind: str, days: int = 1, limit: int = 10) -> list:
+        """[(имя, вызовы, токены запроса, токены ответа, стоимость)] за последние days дней по убыванию стоимости"""
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        with self._lock:
+            return self._connect().execute(
+                "SELECT name, SUM(calls), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost) "
+                "FROM llm_usage_daily WHERE kind = ? AND day >= ? GROUP BY name "
+                "ORDER BY SUM(cost) DESC, SUM(calls) DESC LIMIT ?",
+                (kind, since, limit)
+            ).fetchall()
+
+    def totals(self, days: int = 1) -> dict:
+        # Каждый вызов учтен ровно в одной строке по модели
+        rows = self.top(MODEL, days, limit=-1)
+        return {
+            "calls": sum(row[1] for row in rows),
+            "prompt_tokens": sum(row[2] for row in rows),
+            "completion_tokens": sum(row[3] for row in rows),
+            "cost": sum(row[4] for row in rows),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": self.cost_total,
+            "estimated": self.estimated,
+            "write_errors": self.write_errors,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
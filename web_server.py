@@ -0,0 +1,74 @@
+"""HTTP-сервер бота в том же цикле событий, что и python-telegram-bot.
+
+Отдает `/` и `/health` для платформы и, в режиме вебхука, принимает
+обновления от Telegram и кладет их в очередь Application. Во входном
+процессе многопроцессного режима вместо Application передается Updater:
+серверу нужны только update_queue и bot.
+"""
+import hmac
+
+from aiohttp import web
+from telegram import Update
+
+import metrics
+
+
+class WebServer:
+    def __init__(self, application, host: str = "0.0.0.0", port: int = 8080,
+                 webhook_path: str = None, secret_token: str = None, health=None):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.webhook_path = webhook_path
+        self.secret_token = secret_token
+        # health() -> {"компонент": "состояние"} для /health
+        self.health = health
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/", self.home)
+        self.app.router.add_get("/health", self.health_check)
+        self.app.router.add_get("/metrics", self.metrics)
+        if webhook_path:
+            self.app.router.add_post(webhook_path, self.telegram_webhook)
+
+    async def home(self, request):
+        return web.Response(text="🔮 Бот активен! Версия 2.0")
+
+    async def health_check(self, request):
+        # Процесс жив, пока отвечает; состояние зависимостей — отдельными строками
+        lines = ["OK"]
+        if self.health is not None:
+            lines.extend(f"{name}: {state}" for name, state in self.health().items())
+        return web.Response(text="\n".join(lines))
+
+    async def metrics(self, request):
+        return web.Response(text=metrics.registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def telegram_webhook(self, request):
+        if self.secret_token:
+            header = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not hmac.compare_digest(header, self.secret_token):
+                return web.Response(status=403)
+        try:
+            data = await request.json()
+            # Обновление — JSON-объект с update_id; остальное не доходит до очереди
+            if not isinstance(data, dict) or not isinstance(data.get("update_id"), int):
+                return web.Response(status=400)
+            update = Update.de_json(data, self.application.bot)
+        except (ValueError, KeyError, TypeError):
+            return web.Response(status=400)
+
+        # Отвечаем Telegram сразу; обработка идет в очереди Application
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None